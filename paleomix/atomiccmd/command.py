@@ -30,8 +30,10 @@ import weakref
 
 import paleomix.atomiccmd.pprint as atomicpp
 import paleomix.common.fileutils as fileutils
+import paleomix.common.forkserver as forkserver
 import paleomix.common.procs as procs
 import paleomix.common.signals as signals
+import paleomix.common.text as text
 
 from paleomix.common.utilities import safe_coerce_to_tuple
 
@@ -186,12 +188,12 @@ class AtomicCmd(object):
             if stdin is None:
                 stdin = self.DEVNULL
 
-            self._proc = procs.open_proc(call,
-                                         stdin=stdin,
-                                         stdout=stdout,
-                                         stderr=stderr,
-                                         cwd=cwd,
-                                         preexec_fn=os.setsid)
+            # PALEOMIX commands are run using a pre-warmed fork-server
+            self._proc = forkserver.open_proc(call,
+                                              stdin=stdin,
+                                              stdout=stdout,
+                                              stderr=stderr,
+                                              cwd=cwd)
         except StandardError, error:
             if not wrap_errors:
                 raise
@@ -215,6 +217,13 @@ class AtomicCmd(object):
         regardless of wether or not an error occured."""
         return self._proc and self._proc.poll() is not None
 
+    def running_procs(self):
+        """Returns a list containing the process of this command, if it is
+        still running; see paleomix.common.procs.wait_any."""
+        if self._proc and self._proc.poll() is None:
+            return [self._proc]
+        return []
+
     def join(self):
         """Similar to Popen.wait(), but returns the value wrapped in a list,
         and ensures that any opened handles are closed. Must be called before
@@ -258,6 +267,21 @@ class AtomicCmd(object):
     expected_temp_files = _property_file_sets("output_fname")
     optional_temp_files = _property_file_sets("temporary_fname")
 
+    @property
+    def memory(self):
+        """Returns the (known) maximum amount of memory in bytes used by the
+        command; this is currently limited to the max heap size of JREs, as
+        specified using the '-Xmx' option, and is 0 for other commands."""
+        memory = 0
+        for field in self._command:
+            if isinstance(field, types.StringTypes) \
+                    and field.startswith("-Xmx"):
+                try:
+                    memory = text.parse_size(field[4:])
+                except ValueError:
+                    pass  # Errors are left for the JRE to report
+        return memory
+
     def commit(self, temp):
         if not self.ready():
             raise CmdError("Attempting to commit before command has completed")
@@ -20,10 +20,10 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 #
-import time
 import collections
 
 import paleomix.atomiccmd.pprint as atomicpp
+import paleomix.common.procs as procs
 
 from paleomix.atomiccmd.command import AtomicCmd, CmdError
 from paleomix.common.utilities import safe_coerce_to_tuple
@@ -66,6 +66,12 @@ class _CommandSet:
     expected_temp_files = _collect_properties("expected_temp_files")
     optional_temp_files = _collect_properties("optional_temp_files")
 
+    @property
+    def memory(self):
+        """Returns the maximum amount of memory used by sub-commands at
+        any one time; see AtomicCmd.memory."""
+        raise NotImplementedError
+
     @property
     def stdout(self):
         raise CmdError("%s does not implement property 'stdout'!" \
@@ -118,6 +124,12 @@ class ParallelCmds(_CommandSet):
                 raise CmdError("ParallelCmds must only contain AtomicCmds or other ParallelCmds!")
         _CommandSet.__init__(self, commands)
 
+    @property
+    def memory(self):
+        """Returns the sum of memory used by sub-commands, since all commands
+        are run simultaneously; see AtomicCmd.memory."""
+        return sum(command.memory for command in self._commands)
+
     def run(self, temp):
         for command in self._commands:
             command.run(temp)
@@ -126,8 +138,12 @@ class ParallelCmds(_CommandSet):
     def ready(self):
         return all(cmd.ready() for cmd in self._commands)
 
+    def running_procs(self):
+        """Returns a list of the processes of sub-commands that are still
+        running; see AtomicCmd.running_procs."""
+        return sum((cmd.running_procs() for cmd in self._commands), [])
+
     def join(self):
-        sleep_time = 0.05
         commands = list(enumerate(self._commands))
         return_codes = [[None]] * len(commands)
         while commands and self._joinable:
@@ -135,15 +151,14 @@ class ParallelCmds(_CommandSet):
                 if command.ready():
                     return_codes[index] = command.join()
                     commands.remove((index, command))
-                    sleep_time = 0.05
                 elif any(any(codes) for codes in return_codes):
                     command.terminate()
                     return_codes[index] = command.join()
                     commands.remove((index, command))
-                    sleep_time = 0.05
 
-            time.sleep(sleep_time)
-            sleep_time = min(1, sleep_time * 2)
+            # Remaining commands are terminated immediately following a failure
+            if commands and not any(any(codes) for codes in return_codes):
+                procs.wait_any(self.running_procs())
         return sum(return_codes, [])
 
 
@@ -171,6 +186,12 @@ class SequentialCmds(_CommandSet):
                 raise CmdError("ParallelCmds must only contain AtomicCmds or other ParallelCmds!")
         _CommandSet.__init__(self, commands)
 
+    @property
+    def memory(self):
+        """Returns the maximum memory used by any one sub-command, since
+        commands are run one at a time; see AtomicCmd.memory."""
+        return max(command.memory for command in self._commands)
+
     def run(self, temp):
         self._ready = False
         for command in self._commands:
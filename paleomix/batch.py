@@ -0,0 +1,423 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Execution of nodes using batch schedulers (e.g. SLURM or SGE).
+
+Nodes are pickled to task files in a shared folder, and grouped into job
+arrays of nodes requiring the same resources, each job running a script that
+selects a task based on the array-index of the job. Tasks are run using the
+'paleomix batch_task' command, which writes the result of running the node to
+a file next to the task file. The scheduler is polled at regular intervals in
+order to detect jobs that were terminated without reporting results.
+"""
+import errno
+import itertools
+import logging
+import os
+import pickle
+import pipes
+import shlex
+import shutil
+import signal
+import sys
+import time
+import traceback
+
+import paleomix.main
+import paleomix.pipeline
+
+import paleomix.common.fileutils as fileutils
+import paleomix.common.procs as procs
+
+from paleomix.node import \
+    NodeError, \
+    NodeUnhandledException
+
+
+# Templates for commands used to submit, poll, and cancel jobs, for supported
+# batch systems. Submit commands must print the job ID, polling commands must
+# print one or more lines while a job is queued or running, and the name of
+# the environment variable containing the array-index must be specified.
+# Submit commands may use the fields {script}, {output}, {count}, {last},
+# {threads}, {memory}, and {memory_per_thread}, with memory given in MB;
+# arguments using a memory field are omitted for tasks with unknown memory
+# requirements, leaving the default allocation to the batch system.
+BATCH_SYSTEMS = {
+    "slurm": {
+        "submit": "sbatch --parsable --array=0-{last} "
+                  "--cpus-per-task={threads} --mem={memory}M "
+                  "--output={output} {script}",
+        "poll": "squeue --noheader --jobs={job_id}",
+        "cancel": "scancel {job_id}",
+        "index_var": "SLURM_ARRAY_TASK_ID",
+        "index_offset": 0,
+    },
+    "sge": {
+        "submit": "qsub -terse -S /bin/bash -t 1-{count} -pe smp {threads} "
+                  "-l h_vmem={memory_per_thread}M -j y -o {output} {script}",
+        "poll": "qstat -j {job_id}",
+        "cancel": "qdel {job_id}",
+        "index_var": "SGE_TASK_ID",
+        "index_offset": 1,
+    },
+}
+
+# Max number of seconds between checks for finished tasks
+_POLL_INTERVAL = 5
+# Min number of seconds between polling the batch system for job states
+_JOB_POLL_INTERVAL = 60
+# Max number of tasks in a single job array
+_MAX_ARRAY_SIZE = 1000
+# Number of bytes per unit of memory used in submit commands
+_MEGABYTE = 1024 * 1024
+
+_JOB_SCRIPT = """#!/bin/bash
+# Generated by PALEOMIX; runs one of {count} task(s) per array index
+set -o nounset
+set -o errexit
+
+TASKS=(
+{tasks}
+)
+
+INDEX=$((${{{index_var}}} - {index_offset}))
+exec {command} "${{TASKS[${{INDEX}}]}}"
+"""
+
+
+class BatchError(RuntimeError):
+    pass
+
+
+class CommandSubmitter(object):
+    """Submits job-scripts using command-line tools, given templates for
+    commands; see BATCH_SYSTEMS for templates and fields. Templates are split
+    into arguments using shlex, before fields are filled in.
+    """
+
+    def __init__(self, submit, poll, cancel, index_var, index_offset=0):
+        self.index_var = index_var
+        self.index_offset = index_offset
+        self._submit = shlex.split(submit)
+        self._poll = shlex.split(poll)
+        self._cancel = shlex.split(cancel)
+
+    @classmethod
+    def from_system(cls, name, submit=None):
+        """Returns a submitter for one of the BATCH_SYSTEMS, optionally with
+        a custom template for submitting jobs."""
+        options = dict(BATCH_SYSTEMS[name])
+        if submit:
+            options["submit"] = submit
+
+        return cls(**options)
+
+    def submit(self, script, count, threads, memory, output):
+        """Submits a job-array with 'count' jobs, each requiring 'threads'
+        threads and 'memory' bytes of memory (0 if unknown); returns the job
+        ID."""
+        template = self._submit
+        if not memory:
+            template = [value for value in template
+                        if "{memory" not in value]
+
+        memory = -(-memory // _MEGABYTE)
+        stdout = self._run(template,
+                           script=script,
+                           count=count,
+                           last=count - 1,
+                           threads=threads,
+                           memory=memory,
+                           memory_per_thread=-(-memory // threads),
+                           output=output)
+
+        # SLURM may print "ID;cluster", and SGE prints "ID.FIRST-LAST:STEP"
+        job_id = stdout.strip().split(";")[0].split(".")[0]
+        if not job_id:
+            raise BatchError("Submit command did not print a job ID")
+
+        return job_id
+
+    def is_active(self, job_id):
+        """Returns true if the job is queued or running."""
+        try:
+            return bool(self._run(self._poll, job_id=job_id).strip())
+        except BatchError:
+            return False
+
+    def cancel(self, job_id):
+        """Cancels a queued / running job."""
+        self._run(self._cancel, job_id=job_id)
+
+    @classmethod
+    def _run(cls, template, **fields):
+        call = [value.format(**fields) for value in template]
+        proc = procs.open_proc(call, stdout=procs.PIPE, stderr=procs.PIPE)
+        stdout, stderr = proc.communicate()
+        if proc.returncode:
+            raise BatchError("Command %r failed with return-code %i:\n%s"
+                             % (" ".join(call), proc.returncode, stderr))
+        return stdout
+
+
+class LocalSubmitter(object):
+    """Stand-in for a batch system, which runs every job of a job array in a
+    subprocess on the current host; intended for testing."""
+
+    index_var = "PALEOMIX_TASK_ID"
+    index_offset = 0
+
+    def __init__(self):
+        self._jobs = {}
+        self._counter = itertools.count(1)
+
+    def submit(self, script, count, _threads, _memory, output):
+        job_id = str(self._counter.next())
+        with open(output, "w") as handle:
+            self._jobs[job_id] = [self._start(script, index, handle)
+                                  for index in xrange(count)]
+        return job_id
+
+    def is_active(self, job_id):
+        return any(proc.poll() is None for proc in self._jobs[job_id])
+
+    def cancel(self, job_id):
+        for proc in self._jobs[job_id]:
+            if proc.poll() is None:
+                proc.send_signal(signal.SIGTERM)
+
+    def _start(self, script, index, handle):
+        env = dict(os.environ)
+        env[self.index_var] = str(index + self.index_offset)
+        return procs.open_proc(("bash", script), env=env,
+                               stdout=handle, stderr=procs.STDOUT)
+
+
+class BatchExecutor(paleomix.pipeline.BaseExecutor):
+    """Executor that runs nodes as jobs submitted to a batch system; nodes
+    started at the same time and that require the same resources are
+    submitted together as a single job array.
+    """
+
+    def __init__(self, submitter, root, max_array_size=_MAX_ARRAY_SIZE,
+                 poll_interval=_POLL_INTERVAL,
+                 job_poll_interval=_JOB_POLL_INTERVAL):
+        """Jobs are submitted using 'submitter' (e.g. a CommandSubmitter), and
+        task files / job scripts are written to the folder 'root', which must
+        be accessible from all hosts running jobs."""
+        self._logger = logging.getLogger(__name__)
+        self._submitter = submitter
+        self._root = root
+        self._max_array_size = max_array_size
+        self._poll_interval = poll_interval
+        self._job_poll_interval = job_poll_interval
+        self._counter = itertools.count(1)
+        # Tasks not yet submitted, by (threads, memory): [(key, node, config)]
+        self._pending = {}
+        # Job ID -> _Job
+        self._jobs = {}
+        self._last_job_poll = time.time()
+
+    @property
+    def timeout(self):
+        # Pending tasks are submitted when 'poll' is called
+        if self._pending:
+            return 0
+        return self._poll_interval
+
+    @property
+    def handles(self):
+        return []
+
+    def start(self, key, node, config):
+        group = (node.threads, node.memory)
+        self._pending.setdefault(group, []).append((key, node, config))
+        return True
+
+    def poll(self):
+        self._submit_pending_tasks()
+
+        finished = []
+        for job in self._jobs.values():
+            finished.extend(job.collect_results())
+
+        if time.time() - self._last_job_poll >= self._job_poll_interval:
+            for job in self._jobs.values():
+                if job.tasks and not self._submitter.is_active(job.job_id):
+                    # Results are collected again, in case the job just ended
+                    finished.extend(job.collect_results())
+                    finished.extend(job.collect_lost_tasks())
+            self._last_job_poll = time.time()
+
+        for (job_id, job) in self._jobs.items():
+            if not job.tasks:
+                # Files are kept for failed jobs, to allow troubleshooting
+                if not job.failed:
+                    shutil.rmtree(job.root)
+                del self._jobs[job_id]
+
+        return finished
+
+    def close(self):
+        self._jobs.clear()
+
+    def terminate(self):
+        for job_id in self._jobs:
+            try:
+                self._submitter.cancel(job_id)
+            except BatchError, error:
+                self._logger.error("Failed to cancel job %s: %s"
+                                   % (job_id, error))
+        self._jobs.clear()
+
+    def _submit_pending_tasks(self):
+        for ((threads, memory), tasks) in sorted(self._pending.iteritems()):
+            for start in xrange(0, len(tasks), self._max_array_size):
+                self._submit_tasks(tasks[start:start + self._max_array_size],
+                                   threads, memory)
+        self._pending.clear()
+
+    def _submit_tasks(self, tasks, threads, memory):
+        root = os.path.join(self._root, "job_%i_%i"
+                            % (os.getpid(), self._counter.next()))
+        fileutils.make_dirs(root)
+
+        filenames = {}
+        for (index, (key, node, config)) in enumerate(tasks):
+            filename = os.path.join(root, "task_%i.pickle" % (index,))
+            with open(filename, "wb") as handle:
+                pickle.dump((node, config), handle, pickle.HIGHEST_PROTOCOL)
+            filenames[key] = filename
+
+        script = os.path.join(root, "job.sh")
+        output = os.path.join(root, "job.log")
+        with open(script, "w") as handle:
+            handle.write(_JOB_SCRIPT.format(
+                count=len(tasks),
+                tasks="\n".join("  %s" % (pipes.quote(filenames[key]),)
+                                for (key, _, _) in tasks),
+                index_var=self._submitter.index_var,
+                index_offset=self._submitter.index_offset,
+                command=" ".join(map(pipes.quote, _TASK_COMMAND))))
+
+        try:
+            job_id = self._submitter.submit(script, len(tasks), threads,
+                                            memory, output)
+        except (BatchError, EnvironmentError), error:
+            # Tasks are reported as failed, since the job-script is kept
+            job_id = None
+            self._logger.error("Failed to submit job %r: %s"
+                               % (script, error))
+
+        job = _Job(job_id, root, filenames)
+        if job_id is None:
+            job.lost_message = "Failed to submit job %r" % (script,)
+            job_id = script
+        self._jobs[job_id] = job
+
+
+class _Job(object):
+    """Tasks submitted as a single job (array)."""
+
+    def __init__(self, job_id, root, tasks):
+        self.job_id = job_id
+        self.root = root
+        # Key -> filename of pickled task
+        self.tasks = tasks
+        self.failed = False
+        self.lost_message = None
+
+    def collect_results(self):
+        """Returns (key, error) for tasks that have finished running."""
+        finished = []
+        if self.job_id is None:
+            return self.collect_lost_tasks()
+
+        for (key, filename) in self.tasks.items():
+            result = _read_result(filename)
+            if result is not _NO_RESULT:
+                finished.append((key, result))
+                self.failed |= result is not None
+                self.tasks.pop(key)
+
+        return finished
+
+    def collect_lost_tasks(self):
+        """Returns (key, error) for all tasks that have not reported back."""
+        message = self.lost_message
+        if message is None:
+            message = "Batch job %s terminated without reporting results; " \
+                      "see log-file at %r" \
+                      % (self.job_id, os.path.join(self.root, "job.log"))
+
+        finished = [(key, NodeError(message)) for key in self.tasks]
+        self.failed |= bool(finished)
+        self.tasks.clear()
+        return finished
+
+
+def run_task(filename):
+    """Runs a pickled task, and writes the result of running the node (None
+    or an exception) to a file next to the task file; see '_read_result'."""
+    with open(filename, "rb") as handle:
+        node, config = pickle.load(handle)
+
+    result = None
+    try:
+        node.run(config)
+    except NodeError, error:
+        result = error
+    except Exception:
+        result = NodeUnhandledException("Unhandled error running Node:\n\n%s"
+                                        % (traceback.format_exc(),))
+
+    try:
+        pickle.dumps(result)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        result = NodeUnhandledException(str(result))
+
+    # Result files are written atomically, since they may be read at any time
+    temp_filename = "%s.result.tmp" % (filename,)
+    with open(temp_filename, "wb") as handle:
+        pickle.dump(result, handle, pickle.HIGHEST_PROTOCOL)
+    os.rename(temp_filename, filename + ".result")
+
+    return 0 if result is None else 1
+
+
+def _read_result(filename):
+    """Returns the result of running a task (None or an exception), or
+    _NO_RESULT if the task has not finished running."""
+    try:
+        with open(filename + ".result", "rb") as handle:
+            return pickle.load(handle)
+    except IOError, error:
+        if error.errno != errno.ENOENT:
+            raise
+        return _NO_RESULT
+
+
+# Placeholder returned by '_read_result' for unfinished tasks
+_NO_RESULT = object()
+
+# Command used to run tasks
+_TASK_COMMAND = (sys.executable, paleomix.main.__file__, "batch_task")
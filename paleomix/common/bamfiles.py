@@ -117,6 +117,70 @@ class BAMRegionsIter(object):
         return records
 
 
+class BAMIndexedRegionsIter(object):
+    """Iterates over the regions of interest in a BAM file, as described by
+    a BEDIndex (see paleomix.common.bedtools), reading each part of the BAM
+    file at most once: Reads overlapping each block of merged regions are
+    fetched once, and reads overlapping multiple blocks are only returned
+    for the first such block. One region is yielded per contig, with the
+    following additional properties:
+      - contig: Name of the contig.
+      - index: The BEDIndex used to find the regions overlapping each read.
+      - owned_start: Reads starting before this position also overlap a block
+        not included in the list of blocks, and may therefore have been
+        processed elsewhere; see BAMCollector for how this is used.
+
+    Note that the name of these regions is the name of the contig.
+    """
+
+    def __init__(self, handle, index, blocks=None,
+                 exclude_flags=EXCLUDED_FLAGS):
+        """
+          - handle: BAM file handle (c.f. module 'pysam')
+          - index: BEDIndex of regions of interest
+          - blocks: List of (contig, start, end) tuples, a subset of the
+                    merged blocks in the index; defaults to all blocks.
+        """
+        self._handle = handle
+        self._index = index
+        self._blocks = index.merged() if blocks is None else blocks
+        self._excluded = exclude_flags
+
+    def __iter__(self):
+        for (contig, blocks) in itertools.groupby(self._blocks,
+                                                  lambda block: block[0]):
+            blocks = list(blocks)
+            start = blocks[0][1]
+            end = blocks[-1][2]
+
+            region = _BAMRegion(tid=self._handle.gettid(contig),
+                                records=self._fetch(contig, blocks),
+                                name=contig,
+                                start=start,
+                                end=end)
+            region.contig = contig
+            region.index = self._index
+            region.owned_start = self._index.preceding_end(contig, start)
+
+            yield region
+
+    def _fetch(self, contig, blocks):
+        excluded = self._excluded
+        last_end = None
+        for (_, start, end) in blocks:
+            for record in self._handle.fetch(contig, start, end):
+                if record.flag & excluded:
+                    continue
+                # Reads starting before the end of the previous block also
+                # overlapped that block, and have already been returned
+                elif last_end is not None and record.pos < last_end:
+                    continue
+
+                yield record
+
+            last_end = end
+
+
 class _BAMRegion(object):
     """Implements iteration over sites in a BAM file. It is assumed that the
     BAM file is sorted, and that the input records are from one contig.
@@ -22,6 +22,8 @@
 #
 import copy
 import types
+import bisect
+import collections
 
 import paleomix.common.fileutils as fileutils
 import paleomix.common.text as text
@@ -225,6 +227,121 @@ def read_bed_file(filename, min_columns=3, contigs=None):
             handle.close()
 
 
+class BEDIndex(object):
+    """Index of BED records, supporting queries for records overlapping a
+    given interval, and iteration over blocks of overlapping records.
+
+    Records are grouped by contig and sorted by start coordinates; records
+    overlapping an interval are found using a binary search on the start
+    coordinates, combined with a binary search on the running maximum of end
+    coordinates, which bounds the first record that may overlap the interval.
+    Contigs are ordered as first seen in the list of records.
+    """
+
+    def __init__(self, records):
+        by_contig = collections.OrderedDict()
+        for record in records:
+            by_contig.setdefault(record.contig, []).append(record)
+
+        self._contigs = collections.OrderedDict()
+        for (contig, records) in by_contig.iteritems():
+            records.sort(key=lambda record: (record.start, record.end))
+
+            max_ends = []
+            max_end = 0
+            for record in records:
+                max_end = max(max_end, record.end)
+                max_ends.append(max_end)
+
+            starts = [record.start for record in records]
+            self._contigs[contig] = (records, starts, max_ends,
+                                     self._merge(records))
+
+    def contigs(self):
+        """Returns the names of contigs with one or more records."""
+        return self._contigs.keys()
+
+    def overlapping(self, contig, start, end):
+        """Returns the list of records on 'contig' overlapping the interval
+        [start, end), sorted by start coordinates."""
+        value = self._contigs.get(contig)
+        if value is None:
+            return []
+
+        records, starts, max_ends, _ = value
+        first = bisect.bisect_right(max_ends, start)
+        last = bisect.bisect_left(starts, end, first)
+
+        return [record for record in records[first:last]
+                if record.end > start]
+
+    def merged(self, contig=None):
+        """Returns a list of (contig, start, end) tuples, in which
+        overlapping (or adjacent) records have been merged, for either a
+        single contig or for all contigs."""
+        if contig is not None:
+            value = self._contigs.get(contig)
+            return list(value[-1]) if value is not None else []
+
+        result = []
+        for value in self._contigs.itervalues():
+            result.extend(value[-1])
+        return result
+
+    def preceding_end(self, contig, start):
+        """Returns the end of the last merged block on 'contig' ending at or
+        before 'start', or 0 if there are no such blocks."""
+        blocks = self._contigs[contig][-1]
+        index = bisect.bisect_right(blocks, (contig, start, float("inf")))
+        while index and blocks[index - 1][2] > start:
+            index -= 1
+
+        return blocks[index - 1][2] if index else 0
+
+    def segments(self, contig, start, end):
+        """Returns a list of (start, end, records) tuples, splitting the
+        interval [start, end) into segments covered by the same records;
+        segments not covered by any records are not included."""
+        records = self.overlapping(contig, start, end)
+        boundaries = set((start, end))
+        for record in records:
+            boundaries.add(max(start, record.start))
+            boundaries.add(min(end, record.end))
+        boundaries = sorted(boundaries)
+
+        result = []
+        active = []
+        index = 0
+        for (seg_start, seg_end) in zip(boundaries, boundaries[1:]):
+            active = [record for record in active if record.end > seg_start]
+            while index < len(records) and records[index].start <= seg_start:
+                active.append(records[index])
+                index += 1
+
+            if active:
+                result.append((seg_start, seg_end, tuple(active)))
+
+        return result
+
+    @classmethod
+    def _merge(cls, records):
+        merged = []
+        last_start = last_end = None
+        for record in records:
+            if last_end is None or record.start > last_end:
+                if last_end is not None:
+                    merged.append((record.contig, last_start, last_end))
+                last_start = record.start
+                last_end = record.end
+            else:
+                last_end = max(last_end, record.end)
+
+        if last_end is not None:
+            merged.append((records[-1].contig, last_start, last_end))
+
+        return merged
+
+
 def sort_bed_by_bamfile(bamfile, regions):
     """Orders a set of BED regions, such that processing matches
     (as far as possible) the layout of the BAM file. This may be
@@ -0,0 +1,530 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Fork-server for running PALEOMIX commands without starting a new Python
+interpreter for every call.
+
+Calls to PALEOMIX commands built using paleomix.tools.factory take the form
+(sys.executable, paleomix.main.__file__, command, ...). Rather than executing
+these, 'open_proc' sends the arguments, current directory, environment, and
+standard streams of such calls to a helper process ('paleomix forkserver'),
+which imports only 'paleomix.main' on startup. The helper forks a child for
+each call, which runs 'paleomix.main.main' in a new session (equivalent to
+using 'preexec_fn=os.setsid'), and reports the exit code of the child once it
+terminates. The module implementing a command (and hence any modules it
+imports, such as Pysam) is imported by the helper before forking the first
+call to that command, so that subsequent calls do not have to import it again.
+
+A helper is started for each process calling 'open_proc', and terminates when
+that process closes its end of the connection (e.g. on exit). If the helper
+cannot be started, calls are run using paleomix.common.procs.open_proc.
+"""
+import errno
+import fcntl
+import marshal
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+import threading
+import traceback
+
+import multiprocessing.reduction
+
+import paleomix.main
+import paleomix.common.procs as procs
+
+
+class ForkServerError(RuntimeError):
+    pass
+
+
+def is_paleomix_call(call):
+    """Returns true if the call is a call to a PALEOMIX command, as built by
+    paleomix.tools.factory."""
+    return len(call) > 2 \
+        and call[0] == sys.executable \
+        and call[1] == paleomix.main.__file__
+
+
+def open_proc(call, stdin=procs.DEVNULL, stdout=None, stderr=None, cwd=None):
+    """Starts a command in a new session, returning a Popen-like object with
+    the properties 'call', 'pid', 'returncode', 'stdin', 'stdout', and
+    'stderr', and the methods 'poll', 'wait', 'send_signal', 'terminate', and
+    'kill'. PALEOMIX commands are run using the fork-server; other commands
+    are run using paleomix.common.procs.open_proc. Values for 'stdin',
+    'stdout', and 'stderr' are as for procs.open_proc.
+
+    Commands run using the fork-server are not children of this process, and
+    instead have a 'sentinel' property; see paleomix.common.procs.wait_any.
+    """
+    if is_paleomix_call(call):
+        client = _get_client()
+        if client is not None:
+            return client.open_proc(call, stdin, stdout, stderr, cwd)
+
+    return procs.open_proc(call,
+                           stdin=stdin,
+                           stdout=stdout,
+                           stderr=stderr,
+                           cwd=cwd,
+                           preexec_fn=os.setsid)
+
+
+class _ForkedProc(object):
+    """Popen-like object representing a command run by the fork-server.
+
+    The 'sentinel' is the read end of a pipe, the write end of which is only
+    held open by the command, and which therefore becomes readable (EOF) once
+    the command has terminated; it is closed (and set to None) once the exit
+    code has been received.
+    """
+
+    def __init__(self, client, call, pid, sentinel, stdin, stdout, stderr):
+        self._client = client
+        self.call = tuple(call)
+        self.pid = pid
+        self.sentinel = sentinel
+        self.returncode = None
+        self.stdin = stdin
+        self.stdout = stdout
+        self.stderr = stderr
+
+    def poll(self):
+        if self.returncode is None:
+            self._set_returncode(self._client.poll(self.pid))
+        return self.returncode
+
+    def wait(self):
+        if self.returncode is None:
+            self._set_returncode(self._client.wait(self.pid))
+        return self.returncode
+
+    def _set_returncode(self, returncode):
+        self.returncode = returncode
+        if returncode is not None and self.sentinel is not None:
+            os.close(self.sentinel)
+            self.sentinel = None
+
+    def send_signal(self, signum):
+        if self.returncode is None:
+            os.kill(self.pid, signum)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+class _ForkServerClient(object):
+    """Connection to a fork-server started by the current process."""
+
+    def __init__(self):
+        self.owner = os.getpid()
+        self._lock = threading.Lock()
+        self._returncodes = {}
+
+        client, server = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._server = procs.open_proc(_SERVER_CALL,
+                                           stdin=server,
+                                           stdout=procs.DEVNULL)
+        except:
+            client.close()
+            raise
+        finally:
+            server.close()
+
+        self._sock = client
+
+    def open_proc(self, call, stdin, stdout, stderr, cwd):
+        # File descriptors passed to the server, and those that should be
+        # closed once these have been passed on (e.g. pipe ends, /dev/null)
+        fds, to_close, pipes = [], [], []
+        # Pipe held open by the child, used to detect its termination
+        sentinel, exit_fd = os.pipe()
+        try:
+            for (handle, is_input) in ((stdin, True),
+                                       (stdout, False),
+                                       (stderr, False)):
+                if handle is None:
+                    # Inherit STDIN, STDOUT, or STDERR of this process
+                    fds.append(len(fds))
+                    pipes.append(None)
+                elif handle is procs.DEVNULL:
+                    fds.append(os.open(os.devnull, os.O_RDWR))
+                    to_close.append(fds[-1])
+                    pipes.append(None)
+                elif handle == procs.PIPE:
+                    read_fd, write_fd = os.pipe()
+                    if is_input:
+                        fds.append(read_fd)
+                        pipes.append(os.fdopen(write_fd, "wb"))
+                    else:
+                        fds.append(write_fd)
+                        pipes.append(os.fdopen(read_fd, "rb"))
+                    to_close.append(fds[-1])
+                elif isinstance(handle, (int, long)):
+                    fds.append(handle)
+                    pipes.append(None)
+                else:
+                    fds.append(handle.fileno())
+                    pipes.append(None)
+
+            fds.append(exit_fd)
+            # Children mirror whether or not SIGINT is ignored by this process
+            ignore_sigint = signal.getsignal(signal.SIGINT) == signal.SIG_IGN
+            request = ("run", list(call[2:]), cwd or os.getcwd(),
+                       dict(os.environ), ignore_sigint)
+
+            with self._lock:
+                _send_message(self._sock, request)
+                for fd in fds:
+                    multiprocessing.reduction.send_handle(self._sock, fd,
+                                                          self._server.pid)
+
+                pid = self._recv_until(lambda message: message[0] != "exit")
+        except:
+            os.close(sentinel)
+            for pipe in pipes:
+                if pipe is not None:
+                    pipe.close()
+            raise
+        finally:
+            os.close(exit_fd)
+            for fd in to_close:
+                os.close(fd)
+
+        return _ForkedProc(self, call, pid, sentinel, *pipes)
+
+    def poll(self, pid):
+        with self._lock:
+            while pid not in self._returncodes:
+                if not self._is_readable():
+                    return None
+                self._recv_until(lambda _: True)
+
+            return self._returncodes.pop(pid)
+
+    def wait(self, pid):
+        with self._lock:
+            if pid not in self._returncodes:
+                self._recv_until(lambda message: message[1] == pid)
+
+            return self._returncodes.pop(pid)
+
+    def _is_readable(self):
+        while True:
+            try:
+                readable, _, _ = select.select([self._sock], [], [], 0)
+                return bool(readable)
+            except select.error, error:
+                if error.args[0] != errno.EINTR:
+                    raise
+
+    def _recv_until(self, pred):
+        """Receives messages from the server until a message matching 'pred'
+        is found, recording exit codes of children; returns the PID of the
+        child in the matching message."""
+        while True:
+            message = _recv_message(self._sock)
+            if message is None:
+                raise ForkServerError("Fork-server terminated unexpectedly")
+            elif message[0] == "error":
+                raise ForkServerError(message[1])
+            elif message[0] == "exit":
+                self._returncodes[message[1]] = message[2]
+
+            if pred(message):
+                return message[1]
+
+
+def _get_client():
+    """Returns the fork-server client for the current process, starting a
+    fork-server if required, or None if the fork-server cannot be used."""
+    global _CLIENT
+
+    with _CLIENT_LOCK:
+        if _CLIENT is not None and _CLIENT.owner != os.getpid():
+            # Connections are not shared with forked processes
+            _CLIENT = None
+
+        if _CLIENT is None:
+            try:
+                _CLIENT = _ForkServerClient()
+            except (OSError, socket.error):
+                return None
+
+        return _CLIENT
+
+
+###############################################################################
+# Fork-server
+
+def _serve(sock):
+    children = set()
+    wakeup_r, wakeup_w = os.pipe()
+    for fd in (wakeup_r, wakeup_w):
+        _set_fd_flag(fd, fcntl.F_GETFL, fcntl.F_SETFL, os.O_NONBLOCK)
+
+    # SIGCHLD signals are written to the wakeup FD, to interrupt 'select'
+    signal.set_wakeup_fd(wakeup_w)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    # The server is terminated when the client closes the connection
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    while True:
+        try:
+            readable, _, _ = select.select([sock, wakeup_r], [], [])
+        except select.error, error:
+            if error.args[0] == errno.EINTR:
+                continue
+            raise
+
+        if wakeup_r in readable:
+            _drain(wakeup_r)
+            _reap_children(sock, children)
+
+        if sock in readable:
+            message = _recv_message(sock)
+            if message is None:
+                return 0
+
+            _, argv, cwd, env, ignore_sigint = message
+            # STDIN, STDOUT, STDERR, and the write end of the exit pipe
+            fds = [multiprocessing.reduction.recv_handle(sock)
+                   for _fd_index in xrange(4)]
+
+            # Closed by the child once it has started a new session, so that
+            # the process group exists once the PID is reported to the client
+            session_r, session_w = os.pipe()
+            try:
+                _import_command(argv)
+                pid = os.fork()
+                if not pid:
+                    os.close(session_r)
+                    _run_child(sock, (wakeup_r, wakeup_w), session_w, fds,
+                               argv, cwd, env, ignore_sigint)
+
+                os.close(session_w)
+                session_w = None
+                _wait_for_eof(session_r)
+            except OSError, error:
+                _send_message(sock, ("error", "Error forking: %s" % (error,)))
+                continue
+            finally:
+                os.close(session_r)
+                if session_w is not None:
+                    os.close(session_w)
+                for fd in fds:
+                    os.close(fd)
+
+            children.add(pid)
+            _send_message(sock, ("started", pid))
+
+
+def _reap_children(sock, children):
+    for pid in list(children):
+        try:
+            child_pid, status = os.waitpid(pid, os.WNOHANG)
+        except OSError, error:
+            if error.errno != errno.EINTR:
+                raise
+            continue
+
+        if child_pid:
+            if os.WIFSIGNALED(status):
+                returncode = -os.WTERMSIG(status)
+            else:
+                returncode = os.WEXITSTATUS(status)
+
+            children.remove(pid)
+            _send_message(sock, ("exit", pid, returncode))
+
+
+def _import_command(argv):
+    """Imports the module for a command in the server, such that children
+    do not need to import it; errors are reported by the child."""
+    # pylint: disable=W0212
+    for (name, module, _) in paleomix.main._commands():
+        if module and argv and name == argv[0]:
+            try:
+                __import__(module)
+            except StandardError:
+                pass
+            break
+
+
+def _run_child(sock, wakeup_fds, session_fd, fds, argv, cwd, env,
+               ignore_sigint):
+    """Runs a command in a forked child; never returns."""
+    returncode = 1
+    try:
+        os.setsid()
+        os.close(session_fd)
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        if not ignore_sigint:
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+
+        sock.close()
+        for fd in wakeup_fds:
+            os.close(fd)
+
+        streams, exit_fd = fds[:3], fds[3]
+        for (target, fd) in enumerate(streams):
+            os.dup2(fd, target)
+
+        for fd in set(streams):
+            if fd > 2:
+                os.close(fd)
+
+        # The exit pipe must not be inherited by commands run by this child
+        _set_fd_flag(exit_fd, fcntl.F_GETFD, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(env)
+        sys.argv = [paleomix.main.__file__] + argv
+
+        returncode = _to_exit_code(paleomix.main.main(argv))
+    except SystemExit, error:
+        returncode = _to_exit_code(error.code)
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(returncode)
+
+
+def _to_exit_code(value):
+    """Converts a return value / SystemExit code to an exit code."""
+    if value is None:
+        return 0
+    elif isinstance(value, (int, long)):
+        return value & 0xFF
+
+    sys.stderr.write("%s\n" % (value,))
+    return 1
+
+
+def _set_fd_flag(fd, get_cmd, set_cmd, flag):
+    fcntl.fcntl(fd, set_cmd, fcntl.fcntl(fd, get_cmd) | flag)
+
+
+def _wait_for_eof(fd):
+    while True:
+        try:
+            if not os.read(fd, 4096):
+                return
+        except OSError, error:
+            if error.errno != errno.EINTR:
+                raise
+
+
+def _drain(fd):
+    try:
+        while os.read(fd, 1024):
+            pass
+    except OSError, error:
+        if error.errno not in (errno.EAGAIN, errno.EINTR):
+            raise
+
+
+###############################################################################
+# Messages are marshal'ed values, prefixed by their size
+
+def _send_message(sock, message):
+    data = marshal.dumps(message)
+    sock.sendall(struct.pack(_HEADER, len(data)) + data)
+
+
+def _recv_message(sock):
+    """Returns the next message, or None if the connection was closed."""
+    header = _recv_exactly(sock, struct.calcsize(_HEADER))
+    if header is None:
+        return None
+
+    size, = struct.unpack(_HEADER, header)
+    data = _recv_exactly(sock, size)
+    if data is None:
+        raise ForkServerError("Connection closed while receiving message")
+
+    return marshal.loads(data)
+
+
+def _recv_exactly(sock, size):
+    """Reads exactly 'size' bytes from the socket, to avoid reading the bytes
+    accompanying file descriptors; returns None on EOF."""
+    chunks = []
+    while size:
+        try:
+            chunk = sock.recv(size)
+        except socket.error, error:
+            if error.errno == errno.EINTR:
+                continue
+            elif error.errno == errno.ECONNRESET:
+                # Other end terminated without closing the connection
+                return None
+            raise
+
+        if not chunk:
+            return None
+
+        chunks.append(chunk)
+        size -= len(chunk)
+
+    return "".join(chunks)
+
+
+def main(argv):
+    """Runs the fork-server, reading requests from STDIN; this is expected to
+    be a UNIX socket connected to the process that started the server."""
+    if argv:
+        sys.stderr.write("Usage: paleomix forkserver\n")
+        return 1
+
+    sock = socket.fromfd(0, socket.AF_UNIX, socket.SOCK_STREAM)
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+
+    return _serve(sock)
+
+
+# Size of messages sent between client and server
+_HEADER = "!I"
+# Call used to start the fork-server
+_SERVER_CALL = (sys.executable, paleomix.main.__file__, "forkserver")
+# Fork-server client for the current process; see '_get_client'
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -24,8 +24,6 @@ import os
 import sys
 import types
 
-import pysam
-
 from paleomix.common.utilities import \
     fragment, \
     split_before, \
@@ -115,6 +113,7 @@ class FASTA(TotallyOrdered, Immutable):
                 raise FASTAError(message)
 
             # Use pysam to index the file
+            import pysam
             pysam.Fastafile(filename).close()
 
         names = set()
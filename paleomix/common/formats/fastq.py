@@ -20,6 +20,7 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 #
+import string
 
 
 # Quality score offsets for Phred (or similar) scores in FASTQ reads (33 or 64)
@@ -37,18 +38,25 @@ OFFSET_AMBIGIOUS = "AMBIGIOUS"
 
 def classify_quality_strings(quality_strings):
     """Takes a sequence of quality strings from FASTQ"""
-    counts = [0] * 256
-    for read in quality_strings:
-        for char in read:
-            counts[ord(char)] += 1
+    return classify_quality_ranges(find_quality_ranges("".join(quality_strings)))
 
-    return _identify_format(counts)
 
+def find_quality_ranges(qualities):
+    """Takes a string of (concatenated) quality scores, and returns a tuple of
+    booleans, indicating if the string contains scores unique to offset 33,
+    scores that could belong to either offset, and scores unique to offset 64.
+    """
+    ranges = qualities.translate(_QUALITY_RANGES)
+
+    return (_RANGE_33 in ranges,
+            _RANGE_AMBIGIOUS in ranges,
+            _RANGE_64 in ranges)
 
-def _identify_format(counts):
-    """Given a list representing counts of ASCII characters found in one or
-    more FASTQ quality strins, this function attempts to identify the offset
-    used to encode the quality scores.
+
+def classify_quality_ranges(ranges):
+    """Given a tuple of booleans returned by 'find_quality_ranges' (or the
+    combined tuples for several strings), this function attempts to identify
+    the offset used to encode the quality scores.
 
     The following constants may be returned:
       - OFFSET_33: Offset identified as being 33
@@ -57,13 +65,7 @@ def _identify_format(counts):
       - OFFSET_MISSING: No quality scores found, wrong file? (error)
       - OFFSET_AMBIGIOUS: Qualities could be either offset. (warning)
     """
-    # The range of scores that can unambigiously be identified
-    # as belonging to Phred scores with offset 33 or 64. Scores
-    # in between could potentially signify either offset
-    # See e.g. http://en.wikipedia.org/wiki/FASTQ_format#Encoding
-    has_offset_33_scores = any(counts[33:59])
-    has_ambigious_scores = any(counts[59:75])
-    has_offset_64_scores = any(counts[75:105])
+    has_offset_33_scores, has_ambigious_scores, has_offset_64_scores = ranges
 
     if has_offset_33_scores:
         if has_offset_64_scores:
@@ -74,3 +76,26 @@ def _identify_format(counts):
     elif has_ambigious_scores:
         return OFFSET_AMBIGIOUS
     return OFFSET_MISSING
+
+
+def _build_quality_ranges():
+    """Returns a translation table mapping the characters in each range of
+    quality scores to the single character representing that range."""
+    # The range of scores that can unambigiously be identified
+    # as belonging to Phred scores with offset 33 or 64. Scores
+    # in between could potentially signify either offset
+    # See e.g. http://en.wikipedia.org/wiki/FASTQ_format#Encoding
+    ranges = [_RANGE_OTHER] * 256
+    ranges[33:59] = _RANGE_33 * (59 - 33)
+    ranges[59:75] = _RANGE_AMBIGIOUS * (75 - 59)
+    ranges[75:105] = _RANGE_64 * (105 - 75)
+
+    return string.maketrans("".join(map(chr, xrange(256))), "".join(ranges))
+
+
+# Characters representing quality scores unique to offset 33, quality scores
+# that could be either offset, quality scores unique to offset 64, and any
+# other characters, following translation with _QUALITY_RANGES
+_RANGE_33, _RANGE_AMBIGIOUS, _RANGE_64, _RANGE_OTHER = "3", "?", "6", " "
+# Translation table used to classify quality scores in bulk
+_QUALITY_RANGES = _build_quality_ranges()
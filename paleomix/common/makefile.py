@@ -191,7 +191,6 @@ import hashlib
 import datetime
 import operator
 
-import paleomix.yaml
 from paleomix.common.utilities import group_by_pred
 
 
@@ -212,11 +211,13 @@ def read_makefile(filename, specification):
          }
       }
     """
+    import paleomix.yaml as paleo_yaml
+
     try:
         with open(filename) as makefile:
             string = makefile.read()
-            data = paleomix.yaml.safe_load(string)
-    except paleomix.yaml.error.YAMLError, error:
+            data = paleo_yaml.safe_load(string)
+    except paleo_yaml.error.YAMLError, error:
         raise MakefileError(error)
 
     mtime = os.path.getmtime(os.path.realpath(filename))
@@ -23,15 +23,22 @@
 """
 Tools used for working with subprocesses.
 """
+import errno
+import fcntl
 import os
+import select
+import signal
 import sys
-import time
 
+from contextlib import contextmanager
 from subprocess import *
 
 
 DEVNULL = object()
 
+# Interval between polls when SIGCHLD cannot be handled (outside main thread)
+_POLL_INTERVAL = 0.1
+
 
 def open_proc(call, *args, **kwargs):
     """Wrapper around subprocess.Popen, which records the system call as a
@@ -70,18 +77,20 @@ def join_procs(procs, out=sys.stderr):
     containing the result of each call. Status messages are written to STDERR
     by default.
     """
-    sleep_time = 0.05
     commands = list(enumerate(procs))
     assert all(hasattr(cmd, "call") for (_, cmd) in commands)
 
     return_codes = [None] * len(commands)
     out.write("Joinining subprocesses:\n")
     while commands:
+        # Remaining commands are terminated immediately following a failure
+        if not any(return_codes):
+            wait_any(command for (_, command) in commands)
+
         for (index, command) in list(commands):
             if command.poll() is not None:
                 return_codes[index] = command.wait()
                 commands.remove((index, command))
-                sleep_time = 0.05
 
                 out.write("  - Command finished: %s\n"
                           "    - Return-code:    %s\n"
@@ -96,13 +105,109 @@ def join_procs(procs, out=sys.stderr):
                 command.terminate()
                 return_codes[index] = command.wait()
                 commands.remove((index, command))
-                sleep_time = 0.05
-
-        time.sleep(sleep_time)
-        sleep_time = min(1, sleep_time * 2)
 
     if any(return_codes):
         out.write("Errors occured during processing!\n")
         out.flush()
 
     return return_codes
+
+
+def wait_any(procs):
+    """Blocks until at least one of a set of processes has terminated, and
+    returns a list of the processes that have terminated; an empty list is
+    returned if no processes were given. Processes are either Popen objects
+    for children of the current process, for which termination is detected
+    using SIGCHLD, or Popen-like objects with a 'sentinel' property; this must
+    be a file-descriptor that becomes readable once the process has terminated
+    (see paleomix.common.forkserver). Outside of the main thread, where
+    signals cannot be handled, the processes are instead polled periodically.
+    """
+    procs = list(procs)
+
+    with _sigchld_wakeup_fd() as wakeup_fd:
+        while procs:
+            finished = [proc for proc in procs if proc.poll() is not None]
+            if finished:
+                return finished
+
+            sentinels = {}
+            for proc in procs:
+                sentinel = getattr(proc, "sentinel", None)
+                if sentinel is not None:
+                    sentinels[sentinel] = proc
+
+            fds = sentinels.keys()
+            timeout = None
+            if len(sentinels) < len(procs):
+                if wakeup_fd is None:
+                    timeout = _POLL_INTERVAL
+                else:
+                    fds.append(wakeup_fd)
+
+            try:
+                readable, _, _ = select.select(fds, (), (), timeout)
+            except select.error, error:
+                if error.args[0] != errno.EINTR:
+                    raise
+                continue
+
+            for fd in readable:
+                if fd == wakeup_fd:
+                    _drain(fd)
+                else:
+                    # EOF; the exit-code is expected to follow shortly
+                    sentinels[fd].wait()
+
+    return []
+
+
+@contextmanager
+def _sigchld_wakeup_fd():
+    """Context manager yielding a file-descriptor that becomes readable when a
+    SIGCHLD is received, or None if the current thread is not the main thread.
+    The previous SIGCHLD handler and wakeup FD are restored on exit.
+    """
+    try:
+        old_handler = signal.signal(signal.SIGCHLD, _on_sigchld)
+    except ValueError:
+        # Signal handlers may only be set in the main thread
+        yield None
+        return
+
+    if old_handler is None:
+        # Handler was not installed from Python; assume the default handler
+        old_handler = signal.SIG_DFL
+
+    wakeup_r, wakeup_w = os.pipe()
+    try:
+        for fd in (wakeup_r, wakeup_w):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+        # Avoid interrupting (EINTR) system-calls elsewhere in the process;
+        # this is undone when the previous handler is restored, since
+        # signal.signal always makes signals interrupt system-calls
+        signal.siginterrupt(signal.SIGCHLD, False)
+        old_wakeup_fd = signal.set_wakeup_fd(wakeup_w)
+        try:
+            yield wakeup_r
+        finally:
+            signal.set_wakeup_fd(old_wakeup_fd)
+    finally:
+        signal.signal(signal.SIGCHLD, old_handler)
+        os.close(wakeup_r)
+        os.close(wakeup_w)
+
+
+def _on_sigchld(_signum, _frame):
+    """Signal handler for SIGCHLD; the signal is reported via the wakeup FD."""
+
+
+def _drain(fd):
+    try:
+        while os.read(fd, 4096):
+            pass
+    except OSError, error:
+        if error.errno != errno.EAGAIN:
+            raise
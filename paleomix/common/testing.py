@@ -112,3 +112,61 @@ def set_file_contents(fname, contents):
 def get_file_contents(fname):
     with open(fname) as handle:
         return handle.read()
+
+
+def write_random_bam(filename, contigs, readgroups, nreads=2000, seed=12345):
+    """Writes an indexed, sorted BAM containing random (but deterministic)
+    alignments, including duplicates, paired, and collapsed reads.
+
+      - contigs: List of (name, length) tuples
+      - readgroups: List of (ID, SM, LB) tuples
+    """
+    import random
+
+    import pysam
+
+    def _random_cigar(rng):
+        cigar = [(0, rng.randint(10, 50))]
+        for _ in xrange(rng.randint(0, 3)):
+            cigar.append((rng.choice((1, 2, 3, 7, 8)), rng.randint(1, 20)))
+            cigar.append((0, rng.randint(1, 50)))
+        return cigar
+
+    rng = random.Random(seed)
+    header = {"HD": {"VN": "1.4", "SO": "coordinate"},
+              "SQ": [{"SN": name, "LN": length}
+                     for (name, length) in contigs],
+              "RG": [{"ID": key, "SM": sample, "LB": library}
+                     for (key, sample, library) in readgroups]}
+
+    records = []
+    for _ in xrange(nreads):
+        tid = rng.randint(0, len(contigs) - 1)
+        # Reads are clustered, to produce a range of depths
+        position = min(int(rng.expovariate(1 / 500.0)),
+                       contigs[tid][1] - 200)
+        # Single-end, duplicate, mate 1, mate 2, or collapsed reads
+        flag, prefix = rng.choice(((0, ""), (0x400, ""), (0x43, ""),
+                                   (0x83, ""), (0x41, ""), (0, "M_")))
+        records.append((tid, position, _random_cigar(rng),
+                        rng.choice(readgroups)[0],
+                        flag, prefix, rng.randint(-20, 20)))
+    records.sort()
+
+    with pysam.AlignmentFile(filename, "wb", header=header) as handle:
+        for (index, values) in enumerate(records):
+            (tid, position, cigar, readgroup, flag, prefix, tlen) = values
+            record = pysam.AlignedSegment()
+            record.query_name = "%sread_%i" % (prefix, index)
+            record.reference_id = tid
+            record.reference_start = position
+            record.cigartuples = cigar
+            record.query_sequence = "A" * sum(count for (op, count) in cigar
+                                              if op in (0, 1, 4, 7, 8))
+            record.flag = flag
+            record.template_length = tlen * 10 if flag & 0x1 else 0
+            record.mapping_quality = 30
+            record.set_tag("RG", readgroup)
+            handle.write(record)
+
+    pysam.index(filename)
@@ -22,6 +22,8 @@
 #
 import collections
 import itertools
+import marshal
+import os
 import re
 import types
 
@@ -32,6 +34,12 @@ class TableError(RuntimeError):
 
 _MIN_PADDING = 4
 _WHITESPACE_OR_EMPTY = re.compile(r"\s|^$")
+_SIZE_RE = re.compile(r"^(\d+)([kmgt]?)b?$", re.IGNORECASE)
+_SIZE_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+# Extension of binary copies of tables; see 'write_binary_table'
+_BINARY_TABLE_EXT = ".bin"
+# Magic string (and format version) at the start of binary tables
+_BINARY_TABLE_MAGIC = "PALEOMIX-TABLE\x01"
 
 
 def padded_table(table):
@@ -71,6 +79,19 @@ def parse_padded_table(lines, header=None):
     are ignored. Each row is returned as a dictionary, using the values found
     in the first row as keys.
     """
+    rows = _parse_padded_rows(lines, header)
+    header = next(rows, None)
+    for fields in rows:
+        yield dict(zip(header, fields))
+
+
+def _parse_padded_rows(lines, header=None):
+    """Yields the header of a table parsed as in 'parse_padded_table', followed
+    by each row as a list of fields; nothing is yielded for empty tables."""
+    if header is not None:
+        nheader = len(header)
+        yield header
+
     for line in lines:
         stripped = line.strip()
         if not stripped or stripped.startswith("#"):
@@ -78,6 +99,7 @@ def parse_padded_table(lines, header=None):
         elif header is None:
             header = stripped.split()
             nheader = len(header)
+            yield header
             continue
 
         fields = stripped.split()
@@ -85,7 +107,95 @@ def parse_padded_table(lines, header=None):
             raise TableError("Malformed table; #columns does not match header:"
                              " %r vs %r" % (header, fields))
 
-        yield dict(zip(header, fields))
+        yield fields
+
+
+def binary_table_path(filename):
+    """Returns the path of the binary copy of a table; see
+    'write_binary_table'."""
+    return filename + _BINARY_TABLE_EXT
+
+
+def write_binary_table(filename, rows):
+    """Writes a binary copy of a table to 'binary_table_path(filename)', which
+    is read by 'read_table_file' in place of the text table 'filename'. Rows
+    are given as for 'padded_table', with the first row being the header;
+    strings (comments) are not included. Values must be strings, integers, or
+    floats, and are stored as is; repeated strings are only stored once.
+    """
+    def _intern(value):
+        if isinstance(value, str):
+            return intern(value)
+        return value
+
+    header = None
+    records = []
+    for row in rows:
+        if isinstance(row, types.StringTypes):
+            continue
+        elif header is None:
+            header = tuple(map(str, row))
+            continue
+
+        records.append(tuple(map(_intern, row)))
+
+    with open(binary_table_path(filename), "wb") as handle:
+        handle.write(_BINARY_TABLE_MAGIC)
+        marshal.dump((header, records), handle, 2)
+
+
+def read_table_file(filename):
+    """Returns the header and rows of a table, as a tuple of column names and a
+    list of tuples. The binary copy of the table is read instead of the text
+    table, if one exists and was written after the text table (see
+    'write_binary_table'); values are then returned as written. Otherwise the
+    text table is parsed as in 'parse_padded_table', and values are strings.
+    """
+    try:
+        table = _read_binary_table(filename)
+    except (EOFError, IOError, OSError, TypeError, ValueError):
+        table = None
+
+    if table is None:
+        with open(filename) as handle:
+            rows = _parse_padded_rows(handle)
+            header = tuple(next(rows, ()))
+            table = (header, map(tuple, rows))
+
+    return table
+
+
+def _read_binary_table(filename):
+    """Returns the header and rows of the binary copy of a table, or None if
+    no up-to-date copy exists."""
+    binary_filename = binary_table_path(filename)
+    if not os.path.exists(binary_filename):
+        return None
+    elif os.path.getmtime(binary_filename) < os.path.getmtime(filename):
+        return None
+
+    with open(binary_filename, "rb") as handle:
+        if handle.read(len(_BINARY_TABLE_MAGIC)) != _BINARY_TABLE_MAGIC:
+            return None
+
+        header, records = marshal.load(handle)
+
+    return (header, records)
+
+
+def parse_size(value):
+    """Parses a size such as '512m' or '4G', as used for the JRE -Xmx option,
+    and returns the number of bytes. Suffixes (k, m, g, t) are case-insensitive
+    and correspond to powers of 1024; values without suffixes are in bytes. A
+    ValueError is raised if the value cannot be parsed.
+    """
+    match = _SIZE_RE.match(str(value).strip())
+    if not match:
+        raise ValueError("Invalid size %r; expected a number, optionally "
+                         "followed by K, M, G, or T" % (value,))
+
+    number, unit = match.groups()
+    return int(number) * _SIZE_UNITS[unit.lower()]
 
 
 def parse_lines(lines, parser):
@@ -67,6 +67,12 @@ class BAMTimer:
         return self
 
 
+    @property
+    def count(self):
+        """Number of records counted so far."""
+        return self._count
+
+
     def finalize(self):
         self._print(time.time(), None)
 
@@ -44,11 +44,23 @@ For example, to check that the Java version is v1.7 or later:
         obj()
     except VersionRequirementError:
         pass  # requirements not met, or failure to determine version
+
+The output of system calls may furthermore be stored on disk using a
+VersionCache, in which case calls are only repeated if the executable (or
+other files used in the call, e.g. JAR files) have changed; see 'prefetch'.
 """
 import collections
+import errno
+import json
+import logging
+import multiprocessing.pool
 import operator
+import os
 import re
 
+from paleomix.common.fileutils import \
+    make_dirs, \
+    which_executable
 from paleomix.common.utilities import \
     TotallyOrdered, \
     safe_coerce_to_tuple, \
@@ -57,10 +69,15 @@ from paleomix.common.utilities import \
 import paleomix.common.procs as procs
 
 
+# Default location of the version cache, relative to the user's home folder
+CACHE_FILENAME = os.path.join(".paleomix", "versions.json")
+
 # Cache used to store the output of cmd-line / function calls
 _CALL_CACHE = {}
 # Cache used to store Requirement object
 _REQUIREMENT_CACHE = {}
+# Maximum number of version checks run simultaneously by 'prefetch'
+_MAX_PARALLEL_CALLS = 8
 
 
 class VersionRequirementError(Exception):
@@ -230,6 +247,136 @@ class RequirementObj(object):
             yield "    $ %s" % (" ".join(self._call),)
 
 
+class VersionCache(object):
+    """Persistent cache of the output of system calls used to determine
+    versions. Outputs are keyed by the call and by the path (after resolving
+    symbolic links), size, and modification time of the executable and of any
+    other files passed to it, and are discarded if any of these change.
+    """
+
+    def __init__(self, filename, refresh=False):
+        """Reads cached outputs from 'filename', if it exists; if 'refresh' is
+        true, previously cached outputs are ignored (but overwritten on save).
+        """
+        self._filename = filename
+        self._logger = logging.getLogger(__name__)
+        self._entries = {}
+        self._changed = False
+
+        if not refresh:
+            self._read_entries(filename)
+
+    def get(self, call):
+        """Returns the cached output for a system call, or None if the output
+        was not cached or if the files used in the call have changed."""
+        entry = self._entries.get(call)
+        if entry is not None and entry["files"] == _fingerprint_call(call):
+            return entry["output"]
+
+    def set(self, call, output):
+        """Caches the output of a system call; the output is not cached if
+        the executable could not be located."""
+        files = _fingerprint_call(call)
+        if files is not None:
+            self._entries[call] = {"files": files, "output": output}
+            self._changed = True
+
+    def save(self):
+        """Writes cached outputs to disk, if any outputs have been added."""
+        if not self._changed:
+            return
+
+        records = []
+        for (call, entry) in sorted(self._entries.iteritems()):
+            records.append({"call": call,
+                            "files": entry["files"],
+                            # Raw output may not be valid UTF-8
+                            "output": entry["output"].decode("latin-1")})
+
+        temp_filename = "%s.%i.tmp" % (self._filename, os.getpid())
+        try:
+            make_dirs(os.path.dirname(self._filename))
+            with open(temp_filename, "w") as handle:
+                json.dump(records, handle)
+            os.rename(temp_filename, self._filename)
+            self._changed = False
+        except (IOError, OSError), error:
+            self._logger.warn("Could not write version cache %r: %s"
+                              % (self._filename, error))
+
+    def _read_entries(self, filename):
+        try:
+            with open(filename) as handle:
+                records = json.load(handle)
+
+            for record in records:
+                call = tuple(str(value) for value in record["call"])
+                files = [[str(path), size, mtime]
+                         for (path, size, mtime) in record["files"]]
+                output = record["output"].encode("latin-1")
+
+                self._entries[call] = {"files": files, "output": output}
+        except IOError, error:
+            if error.errno != errno.ENOENT:
+                self._logger.warn("Could not read version cache %r: %s"
+                                  % (filename, error))
+        except (ValueError, TypeError, KeyError), error:
+            # Corrupt or outdated cache; versions are determined anew
+            self._logger.warn("Ignoring invalid version cache %r: %s"
+                              % (filename, error))
+            self._entries.clear()
+
+
+def prefetch(requirements, cache=None):
+    """Carries out the calls required to determine the versions of a set of
+    RequirementObjs, so that checking these requirements does not involve
+    further calls. Outputs of system calls are read from the VersionCache
+    'cache', if specified, while remaining calls are run in parallel; the
+    output of these calls is added to the cache, which is then saved, if a
+    version could be determined from the output.
+    """
+    calls = []
+    # Call -> regexps of requirements, used to verify output before caching
+    searches = {}
+    for requirement in requirements:
+        # pylint: disable=protected-access
+        call, regexp = requirement._call, requirement._rege
+        if call in _CALL_CACHE or isinstance(call[0], collections.Callable):
+            continue
+        elif call in searches:
+            searches[call].append(regexp)
+            continue
+
+        searches[call] = [regexp]
+        output = None if cache is None else cache.get(call)
+        if output is None:
+            calls.append(call)
+        else:
+            _CALL_CACHE[call] = output
+
+    if calls:
+        pool = multiprocessing.pool.ThreadPool(min(len(calls),
+                                                   _MAX_PARALLEL_CALLS))
+        try:
+            results = pool.map(_run, calls)
+        finally:
+            pool.close()
+            pool.join()
+
+        for (call, result) in zip(calls, results):
+            _CALL_CACHE[call] = result
+            # Failures to run a program (e.g. not installed) and output from
+            # which no version could be determined (e.g. transient errors)
+            # are not cached
+            if cache is not None and not isinstance(result, OSError) \
+                    and any(regexp.search(result)
+                            for regexp in searches[call]):
+                cache.set(call, result)
+
+    if cache is not None:
+        cache.save()
+
+
 class Check(TotallyOrdered):
     """Abstract base-class for version checks.
 
@@ -430,6 +577,24 @@ def _do_call(call):
     return result
 
 
+def _fingerprint_call(call):
+    """Returns a list of (path, size, mtime) for the executable in a system
+    call and for any arguments that are existing files, or None if the
+    executable could not be located."""
+    executable = which_executable(call[0])
+    if executable is None:
+        return None
+
+    files = []
+    for filename in (executable,) + call[1:]:
+        if os.path.isfile(filename):
+            filename = os.path.realpath(filename)
+            stats = os.stat(filename)
+            files.append([filename, stats.st_size, stats.st_mtime])
+
+    return files
+
+
 def _pprint_version(value):
     """Pretty-print version tuple; takes a tuple of field numbers / values,
     and returns it as a string joined by dots with a 'v' prepended.
@@ -26,13 +26,17 @@ PALEOMIX module ('paleomix') is available, and forwards arguments to the
 appropriate commands.
 """
 import os
+import re
 import sys
 import textwrap
 
 
 # List of tuples of commands: (name, module, help string).
 # If module is None, the command cannot be invoked directly (e.g. help), and
-# if help string is none, the command is considered a help header.
+# if help string is none, the command is considered a help header. Modules are
+# only imported when the command is invoked; modules should therefore avoid
+# importing slow-to-load modules (e.g. pysam) that are not required by the
+# command itself.
 def _commands():
     yield ("Pipelines", None, None)
     yield ("bam_pipeline", "paleomix.tools.bam_pipeline.pipeline",
@@ -43,6 +47,12 @@ def _commands():
            "Pipeline for genotyping and phylogenetic inference from BAMs.")
     yield ("zonkey", "paleomix.tools.zonkey.pipeline",
            "Pipeline for detecting F1 (equine) hybrids.")
+    yield ("worker", "paleomix.tools.worker",
+           "Runs tasks on behalf of pipelines started with --worker-port.")
+
+    # Currently not documented; used internally by pipelines
+    yield ("batch_task", "paleomix.tools.batch_task", None)
+    yield ("forkserver", "paleomix.common.forkserver", None)
 
     # Currently not documented; used internally by Zonkey
     yield ("zonkey_db", "paleomix.tools.zonkey.build_db", None)
@@ -60,6 +70,9 @@ def _commands():
     yield ("cleanup", "paleomix.tools.cleanup",
            "Reads SAM file from STDIN, and outputs sorted, tagged, and filter "
            "BAM, for which NM and MD tags have been updated.")
+    yield ("bam_stats", "paleomix.tools.bam_stats.scanner",
+           "Calculate coverage, depth histograms, and other statistics in a "
+           "single pass over a BAM file.")
     yield ("coverage", "paleomix.tools.coverage",
            "Calculate coverage across reference sequences or regions of "
            "interest.")
@@ -68,6 +81,8 @@ def _commands():
            "of interest.")
     yield ("duphist", "paleomix.tools.duphist",
            "Generates PCR duplicate histogram; used with the 'Preseq' tool.")
+    yield ("merge", "paleomix.tools.merge",
+           "Merges sorted BAM files, writing an uncompressed BAM by default.")
     yield ("rmdup_collapsed", "paleomix.tools.rmdup_collapsed",
            "Filters PCR duplicates for collapsed paired-ended reads generated "
            "by the AdapterRemoval tool.")
@@ -157,19 +172,21 @@ def _are_requirements_met():
         sys.stderr.write("Please install Python v2.7 to continue.\n")
         return False
 
-    modules = [('pysam', _IMPORT_ERROR_PYSAM),
-               ('paleomix', _IMPORT_ERROR_PALEOMIX)]
+    try:
+        pysam_version = _get_pysam_version()
+    except ImportError:
+        error = sys.exc_info()[1]  # Python 2/3 compatible exception syntax
+        sys.stderr.write(_IMPORT_ERROR_PYSAM % (error,))
+        return False
 
-    for (module, message) in modules:
-        try:
-            __import__(module)
-        except ImportError:
-            error = sys.exc_info()[1]  # Python 2/3 compatible exception syntax
-            sys.stderr.write(message % (error,))
-            return False
+    try:
+        import paleomix
+    except ImportError:
+        error = sys.exc_info()[1]  # Python 2/3 compatible exception syntax
+        sys.stderr.write(_IMPORT_ERROR_PALEOMIX % (error,))
+        return False
 
     # Sanity check, to catch multiple, conflicting PALEOMIX installations
-    import paleomix
     if not os.path.samefile(os.path.dirname(__file__),
                             os.path.dirname(paleomix.__file__)):
         sys.stderr.write(_INCONSISTENT_IMPORT_ERROR
@@ -177,17 +194,37 @@ def _are_requirements_met():
                             os.path.dirname(paleomix.__file__)))
         return False
 
-    import pysam
-    version = [int(field) for field in pysam.__version__.split(".")]
+    version = [int(field) for field in re.findall(r"\d+", pysam_version)]
     if version[:3] < [0, 8, 3]:
         error = "Pysam is outdated (v%s), version must be at least v0.8.3!"
-        error %= (pysam.__version__,)
+        error %= (pysam_version,)
         sys.stderr.write(_IMPORT_ERROR_PYSAM % (error,))
         return False
 
     return True
 
 
+def _get_pysam_version():
+    """Returns the version of the Pysam module; to reduce the startup time of
+    commands not using Pysam, the version is read from 'pysam/version.py'
+    rather than by importing the module, if possible.
+    """
+    import imp
+
+    try:
+        _, path, _ = imp.find_module("pysam")
+        with open(os.path.join(path, "version.py")) as handle:
+            match = re.search(r"^__version__\s*=\s*[\"']([^\"']+)[\"']",
+                              handle.read(), re.MULTILINE)
+        if match:
+            return match.group(1)
+    except (ImportError, IOError):
+        pass
+
+    import pysam
+    return pysam.__version__
+
+
 def _print_help():
     """Prints description of commands and reference to PALEOMIX paper."""
     import paleomix
@@ -0,0 +1,265 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Persistent manifest of the files read and written by nodes.
+
+For every node that has finished running, the size and mtime of the output
+files are recorded, together with the size, mtime, and checksum of the input
+files used to generate them. This allows nodes to be considered up-to-date if
+the timestamps of input files have changed (e.g. due to a reference sequence
+being touched or copied), but the contents of these files have not.
+
+Checksums of input files are calculated in a background thread when nodes
+finish running, in order to avoid delaying the scheduling of other nodes.
+
+Records are stored as JSON objects, one per line, and are only ever appended
+to the file, with the exception of occasional compaction of the file when it
+is read.
+"""
+import errno
+import hashlib
+import json
+import logging
+import os
+import Queue
+import threading
+
+import paleomix.nodegraph
+
+
+# Filename used to store the manifest in the temp root
+FILENAME = "manifest.jsonl"
+
+# Size of blocks read when calculating checksums
+_BLOCK_SIZE = 1024 * 1024
+
+
+class FileManifest(object):
+    """Records the state of files generated by nodes, and of the input files
+    used to generate them. The object is used by FileStatusCache to determine
+    if the contents of input files have changed, in case the timestamps of
+    files indicate that a node is outdated, and may be added as a state
+    observer to a NodeGraph, in order to record nodes as they finish running.
+    """
+
+    def __init__(self, filename=None):
+        """If a filename is specified, the manifest is read from that file,
+        and new records are appended to it."""
+        self._filename = filename
+        self._logger = logging.getLogger(__name__)
+        # Path -> (size, mtime, checksum)
+        self._checksums = {}
+        # Path -> (size, mtime, {input path -> checksum})
+        self._outputs = {}
+        # Guards records, which may be added by the background thread
+        self._lock = threading.Lock()
+        # Nodes that have finished running, but have yet to be recorded
+        self._pending = Queue.Queue()
+        self._thread = None
+
+        if filename is not None:
+            self._read_records(filename)
+
+    def is_unchanged(self, input_files, output_files, cache):
+        """Returns true if the output files have not changed since they were
+        recorded, and if the contents of the input files match the contents
+        of the input files used to generate them, as determined using
+        checksums. Stats are retrieved using the FileStatusCache 'cache'.
+        """
+        inputs = None
+        for filename in output_files:
+            record = self._outputs.get(filename)
+            stats = cache.get_stats(filename)
+            if record is None or stats is None \
+                    or record[:2] != (stats.st_size, stats.st_mtime):
+                return False
+            elif inputs is None:
+                inputs = record[2]
+            elif inputs is not record[2]:
+                # Output files were not generated by the same node (run)
+                return False
+
+        if inputs is None or frozenset(inputs) != frozenset(input_files):
+            return False
+
+        for filename in input_files:
+            if self.checksum(filename, cache) != inputs[filename]:
+                return False
+
+        return True
+
+    def checksum(self, filename, cache):
+        """Returns the checksum of a file, or None if it does not exist;
+        checksums are only (re)calculated if the size or mtime of the file
+        differs from when the checksum was last recorded."""
+        stats = cache.get_stats(filename)
+        if stats is None:
+            return None
+
+        record = self._checksums.get(filename)
+        if record is None or record[:2] != (stats.st_size, stats.st_mtime):
+            record = (stats.st_size, stats.st_mtime, _checksum(filename))
+            with self._lock:
+                self._checksums[filename] = record
+                self._append_record({"inputs": {filename: record}})
+
+        return record[2]
+
+    def add(self, node, cache):
+        """Records the current state of the output files of a node, and of
+        the input files used to generate them."""
+        inputs = {}
+        for filename in node.input_files:
+            checksum = self.checksum(filename, cache)
+            if checksum is None:
+                return
+            inputs[filename] = self._checksums[filename]
+
+        outputs = {}
+        for filename in node.output_files:
+            stats = cache.get_stats(filename)
+            if stats is None:
+                return
+            outputs[filename] = (stats.st_size, stats.st_mtime)
+
+        with self._lock:
+            self._add_record(inputs, outputs)
+            self._append_record({"inputs": inputs, "outputs": outputs})
+
+    def close(self):
+        """Waits for nodes that have finished running to be recorded."""
+        if self._thread is not None:
+            self._pending.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def refresh(self, nodegraph):
+        """See NodeGraph.add_state_observer."""
+        pass
+
+    def state_changed(self, node, old_state, new_state, is_primary):
+        """See NodeGraph.add_state_observer; nodes that have finished running
+        are recorded in a background thread; see 'close'."""
+        if is_primary and new_state == paleomix.nodegraph.NodeGraph.DONE:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._add_pending)
+                self._thread.daemon = True
+                self._thread.start()
+
+            self._pending.put(node)
+
+    def _add_pending(self):
+        for node in iter(self._pending.get, None):
+            try:
+                self.add(node, paleomix.nodegraph.FileStatusCache())
+            except (IOError, OSError), error:
+                self._logger.warn("Could not record %s in manifest: %s"
+                                  % (node, error))
+
+    def _add_record(self, inputs, outputs):
+        for (filename, record) in inputs.iteritems():
+            self._checksums[filename] = tuple(record)
+
+        if outputs:
+            checksums = dict((filename, record[2])
+                             for (filename, record) in inputs.iteritems())
+            for (filename, (size, mtime)) in outputs.iteritems():
+                self._outputs[filename] = (size, mtime, checksums)
+
+    def _append_record(self, record):
+        if self._filename is not None:
+            try:
+                with open(self._filename, "a") as handle:
+                    handle.write(json.dumps(record) + "\n")
+            except (IOError, OSError), error:
+                self._logger.warn("Could not write to manifest %r; files "
+                                  "will not be recorded: %s"
+                                  % (self._filename, error))
+                self._filename = None
+
+    def _read_records(self, filename):
+        """Reads records from a file; lines that cannot be parsed (e.g. due to
+        the pipeline being killed while writing) are ignored. If the file
+        contains a large number of outdated records, these are removed.
+        """
+        nrecords = 0
+        try:
+            with open(filename) as handle:
+                for line in handle:
+                    try:
+                        record = json.loads(line)
+                        self._add_record(inputs=record["inputs"],
+                                         outputs=record.get("outputs"))
+                        nrecords += 1
+                    except (ValueError, TypeError, KeyError, AttributeError):
+                        pass
+        except IOError, error:
+            if error.errno != errno.ENOENT:
+                raise
+            return
+
+        nkept = len(self._get_output_groups()) + 1
+        if nrecords > 2 * nkept:
+            self._write_records(filename)
+
+    def _get_output_groups(self):
+        """Returns a list of (inputs, outputs) for each recorded node."""
+        groups = {}
+        for (filename, (size, mtime, checksums)) in self._outputs.iteritems():
+            key = id(checksums)
+            if key not in groups:
+                groups[key] = (checksums, {})
+            groups[key][1][filename] = (size, mtime)
+
+        return groups.values()
+
+    def _write_records(self, filename):
+        """Atomically replaces the file with the currently kept records."""
+        temp_filename = "%s.%i" % (filename, os.getpid())
+        try:
+            with open(temp_filename, "w") as handle:
+                for (checksums, outputs) in self._get_output_groups():
+                    inputs = {}
+                    for (key, checksum) in checksums.iteritems():
+                        size, mtime, _ = self._checksums[key]
+                        inputs[key] = (size, mtime, checksum)
+
+                    record = {"inputs": inputs, "outputs": outputs}
+                    handle.write(json.dumps(record) + "\n")
+
+                # Written last, to replace the (possibly outdated) input
+                # checksums recorded for the output files above
+                record = {"inputs": self._checksums}
+                handle.write(json.dumps(record) + "\n")
+            os.rename(temp_filename, filename)
+        except (IOError, OSError), error:
+            self._logger.warn("Could not compact manifest %r: %s"
+                              % (filename, error))
+
+
+def _checksum(filename):
+    """Returns the MD5 hex-digest of the contents of a file."""
+    hasher = hashlib.md5()
+    with open(filename, "rb") as handle:
+        for block in iter(lambda: handle.read(_BLOCK_SIZE), ""):
+            hasher.update(block)
+    return hasher.hexdigest()
@@ -54,7 +54,8 @@ class Node(object):
     def __init__(self, description=None, threads=1,
                  input_files=(), output_files=(),
                  executables=(), auxiliary_files=(),
-                 requirements=(), dependencies=()):
+                 requirements=(), dependencies=(), priority=0,
+                 memory=0, io_weight=0):
 
         if not isinstance(description, _DESC_TYPES):
             raise TypeError("'description' must be None or a string, not %r"
@@ -68,6 +69,12 @@ class Node(object):
         self.requirements = self._validate_requirements(requirements)
 
         self.threads = self._validate_nthreads(threads)
+        # Hint used when scheduling nodes; see NodeGraph.get_node_priority
+        self.priority = self._validate_priority(priority)
+        # Expected max memory usage in bytes, and relative I/O load; these are
+        # used to limit the number of simultaneously running nodes
+        self.memory = self._validate_resource("memory", memory)
+        self.io_weight = self._validate_resource("io_weight", io_weight)
         self.dependencies = self._collect_nodes(dependencies)
 
         # If there are no input files, the node cannot be re-run based on
@@ -232,10 +239,33 @@ class Node(object):
                              % (threads,))
         return threads
 
+    @classmethod
+    def _validate_priority(cls, priority):
+        if not isinstance(priority, (types.IntType, types.LongType)):
+            raise TypeError("'priority' must be an integer, not a %s"
+                            % (type(priority),))
+        return priority
+
+    @classmethod
+    def _validate_resource(cls, name, value):
+        if not isinstance(value, (types.IntType, types.LongType)):
+            raise TypeError("%r must be a non-negative integer, not a %s"
+                            % (name, type(value)))
+        elif value < 0:
+            raise ValueError("%r must be a non-negative integer, not %i"
+                             % (name, value))
+        return value
+
 
 class CommandNode(Node):
     def __init__(self, command, description=None, threads=1,
-                 dependencies=()):
+                 dependencies=(), priority=0, memory=None, io_weight=0):
+        """See Node.__init__; if 'memory' is None, the expected memory usage
+        is derived from the command (e.g. from the -Xmx option of JREs), if
+        the command provides this information."""
+        if memory is None:
+            memory = getattr(command, "memory", 0)
+
         Node.__init__(self,
                       description=description,
                       input_files=command.input_files,
@@ -244,7 +274,10 @@ class CommandNode(Node):
                       executables=command.executables,
                       requirements=command.requirements,
                       threads=threads,
-                      dependencies=dependencies)
+                      dependencies=dependencies,
+                      priority=priority,
+                      memory=memory,
+                      io_weight=io_weight)
 
         self._command = command
 
@@ -24,6 +24,8 @@ import collections
 import errno
 import logging
 import os
+import Queue
+import threading
 
 import paleomix.common.versions as versions
 
@@ -37,16 +39,23 @@ from paleomix.common.utilities import \
 # Max number of error messages of each type
 _MAX_ERROR_MESSAGES = 10
 
+# Number of threads used to collect the status of files in parallel
+_PREFETCH_THREADS = 16
+
 
 class FileStatusCache(object):
     """Cache used to avoid repeatedly checking the state (existance / mtime) of
-    files required / generated by nodes. A new cache is generated for every
-    operation (e.g. refreshing all states / manually setting the state of a
-    node) to avoid relying on the filesystem staying consistant for long
-    periods of time.
+    files required / generated by nodes. A cache is kept by the NodeGraph
+    until the states of all nodes are refreshed, with cached entries being
+    invalidated for files written by nodes run by the pipeline itself.
     """
 
-    def __init__(self):
+    def __init__(self, manifest=None):
+        """If a FileManifest is specified, this is used to determine if the
+        contents of input files have changed, in case the timestamps of input
+        and output files indicate that the output files are outdated.
+        """
+        self._manifest = manifest
         self._stat_cache = {}
 
     def files_exist(self, fpaths):
@@ -57,6 +66,17 @@ class FileStatusCache(object):
         """Returns a list of paths in fpaths that do not exist."""
         return [fpath for fpath in fpaths if (self._get_state(fpath) is None)]
 
+    def file_sizes(self, fpaths):
+        """Returns the total size of the files listed in fpaths, or None if
+        one or more of the files do not exist."""
+        total_size = 0
+        for fpath in fpaths:
+            stats = self._get_stats(fpath)
+            if stats is None:
+                return None
+            total_size += stats.st_size
+        return total_size
+
     def are_files_outdated(self, input_files, output_files):
         """Returns true if any 'input' files have a time-stamp that post-date
         any time-stamp for the 'output' files, indicating that one or more of
@@ -74,7 +94,68 @@ class FileStatusCache(object):
         if not self._get_states(output_files, output_timestamps):
             return True
 
-        return max(input_timestamps) > min(output_timestamps)
+        if max(input_timestamps) <= min(output_timestamps):
+            return False
+        elif self._manifest is not None:
+            return not self._manifest.is_unchanged(input_files, output_files,
+                                                   self)
+
+        return True
+
+    def get_stats(self, fpath):
+        """Returns the result of os.stat for a path, or None if the path does
+        not exist."""
+        return self._get_stats(fpath)
+
+    def prefetch(self, fpaths, threads=_PREFETCH_THREADS):
+        """Collects the status of the listed paths using multiple threads, to
+        reduce the overhead of checking files on network file-systems. Paths
+        are grouped by directory, and paths not found in directory listings
+        are marked as missing without being checked individually.
+        """
+        by_dirname = collections.defaultdict(list)
+        for fpath in fpaths:
+            if fpath not in self._stat_cache:
+                by_dirname[os.path.dirname(fpath)].append(fpath)
+
+        work = Queue.Queue()
+        for item in by_dirname.iteritems():
+            work.put(item)
+
+        results = []
+        errors = []
+
+        def _worker():
+            try:
+                while True:
+                    results.append(_stat_files_in_dir(work.get_nowait()))
+            except Queue.Empty:
+                pass
+            except EnvironmentError, error:
+                errors.append(error)
+
+        workers = []
+        for _ in xrange(min(threads, len(by_dirname)) - 1):
+            worker = threading.Thread(target=_worker)
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+
+        # The main thread also participates in collecting stats
+        _worker()
+        for worker in workers:
+            worker.join()
+
+        if errors:
+            raise errors[0]
+
+        for stats in results:
+            self._stat_cache.update(stats)
+
+    def invalidate(self, fpaths):
+        """Removes cached information about the listed paths."""
+        for fpath in fpaths:
+            self._stat_cache.pop(fpath, None)
 
     def _get_states(self, filenames, dst):
         """Collects the mtimes for a set of filenames, returning true if all
@@ -91,14 +172,16 @@ class FileStatusCache(object):
 
     def _get_state(self, fpath):
         """Returns the mtime of a path, or None if the path does not exist."""
+        stats = self._get_stats(fpath)
+        if stats is None:
+            return None
+        return stats.st_mtime
+
+    def _get_stats(self, fpath):
+        """Returns the result of os.stat for a path, or None if the path does
+        not exist."""
         if fpath not in self._stat_cache:
-            try:
-                mtime = os.path.getmtime(fpath)
-            except OSError, error:
-                if error.errno != errno.ENOENT:
-                    raise
-                mtime = None
-            self._stat_cache[fpath] = mtime
+            self._stat_cache[fpath] = _stat_file(fpath)
         return self._stat_cache[fpath]
 
 
@@ -111,10 +194,21 @@ class NodeGraph:
     DONE, RUNNING, RUNABLE, QUEUED, OUTDATED, ERROR \
         = range(NUMBER_OF_STATES)
 
-    def __init__(self, nodes, cache_factory=FileStatusCache):
+    def __init__(self, nodes, cache_factory=FileStatusCache, runtimes=None,
+                 version_cache=None):
+        """Builds and validates the graph of nodes; 'runtimes' may be a
+        RuntimeHistory object, used to estimate the runtime of nodes, and
+        'version_cache' may be a VersionCache, used to avoid repeating calls
+        made to check the versions of required programs.
+        """
         self._cache_factory = cache_factory
+        self._runtimes = runtimes
+        self._version_cache = version_cache
         self._state_observers = []
         self._states = {}
+        self._cache = None
+        self._estimates = {}
+        self._priorities = {}
 
         nodes = safe_coerce_to_frozenset(nodes)
 
@@ -124,19 +218,39 @@ class NodeGraph:
         self._intersections = {}
         self._top_nodes = [node for (node, rev_deps) in self._reverse_dependencies.iteritems() if not rev_deps]
 
+        self._logger.info("  - Collecting file states ...")
+        cache = self._new_cache()
+
         self._logger.info("  - Checking file dependencies ...")
-        self._check_file_dependencies(self._reverse_dependencies)
+        self._check_file_dependencies(self._reverse_dependencies, cache)
         self._logger.info("  - Checking for required executables ...")
         self._check_required_executables(self._reverse_dependencies)
         self._logger.info("  - Checking version requirements ...")
         self._check_version_requirements(self._reverse_dependencies)
         self._logger.info("  - Determining states ...")
-        self.refresh_states()
+        self._refresh_states(cache)
         self._logger.info("  - Ready ...\n")
 
     def get_node_state(self, node):
         return self._states[node]
 
+    def get_node_priority(self, node):
+        """Returns the scheduling priority of a node, as a tuple that may be
+        compared with the priorities of other nodes; nodes with greater
+        priorities should be started first. The priority consists of the
+        (optional) hint set for the node itself (Node.priority), followed by
+        the estimated amount of work remaining along the longest path from
+        the node to the end of the pipeline (the critical path).
+        """
+        return self._priorities[node]
+
+    def get_runtime_estimate(self, node):
+        """Returns the estimated runtime of a node in seconds, based on the
+        runtimes recorded for similar nodes, or None if no estimate could be
+        made (e.g. if no runtimes have been recorded).
+        """
+        return self._estimates.get(node)
+
     def set_node_state(self, node, state):
         if state not in (NodeGraph.RUNNING, NodeGraph.ERROR, NodeGraph.DONE):
             raise ValueError("Invalid state: %r" % (state,))
@@ -155,26 +269,36 @@ class NodeGraph:
         requires_update = dict.fromkeys(intersections, False)
         for dependency in self._reverse_dependencies[node]:
             requires_update[dependency] = True
-
-        cache = self._cache_factory()
-        while any(requires_update.itervalues()):
-            for (node, count) in intersections.items():
-                if not count:
-                    has_changed = False
-                    if requires_update[node]:
-                        old_state = self._states.pop(node)
-                        new_state = self._update_node_state(node, cache)
-                        if new_state != old_state:
-                            self._notify_state_observers(node, old_state,
-                                                         new_state, False)
-                            has_changed = True
-
-                    for dependency in self._reverse_dependencies[node]:
-                        intersections[dependency] -= 1
-                        requires_update[dependency] |= has_changed
-
-                    intersections.pop(node)
-                    requires_update.pop(node)
+        pending_updates = len(self._reverse_dependencies[node])
+
+        # Nodes for which every affected dependency has been processed; the
+        # intersection counts function as counters of unmet dependencies.
+        ready = collections.deque(node for (node, count)
+                                  in intersections.iteritems() if not count)
+
+        # Only files written by the node may have changed
+        cache = self._cache
+        cache.invalidate(node.output_files)
+        while ready and pending_updates:
+            node = ready.popleft()
+            has_changed = False
+            if requires_update.pop(node):
+                pending_updates -= 1
+                old_state = self._states.pop(node)
+                new_state = self._update_node_state(node, cache)
+                if new_state != old_state:
+                    self._notify_state_observers(node, old_state,
+                                                 new_state, False)
+                    has_changed = True
+
+            for dependency in self._reverse_dependencies[node]:
+                if has_changed and not requires_update[dependency]:
+                    requires_update[dependency] = True
+                    pending_updates += 1
+
+                intersections[dependency] -= 1
+                if not intersections[dependency]:
+                    ready.append(dependency)
 
     def __iter__(self):
         """Returns a graph of nodes."""
@@ -184,14 +308,33 @@ class NodeGraph:
         return iter(self._reverse_dependencies)
 
     def refresh_states(self):
-        states = {}
+        self._refresh_states(self._new_cache())
+
+    def _new_cache(self):
+        """Returns a new cache, pre-filled with the status of all files used
+        by nodes in the graph."""
+        filenames = set()
+        for node in self._reverse_dependencies:
+            filenames.update(node.input_files)
+            filenames.update(node.output_files)
+            filenames.update(node.auxiliary_files)
+
         cache = self._cache_factory()
+        cache.prefetch(filenames)
+
+        return cache
+
+    def _refresh_states(self, cache):
+        states = {}
+        self._cache = cache
         for (node, state) in self._states.iteritems():
             if state in (self.ERROR, self.RUNNING):
                 states[node] = state
         self._states = states
         for node in self._reverse_dependencies:
             self._update_node_state(node, cache)
+        self._estimates = self._estimate_runtimes(cache)
+        self._priorities = self._calculate_priorities()
         self._refresh_state_observers()
 
     def add_state_observer(self, observer):
@@ -222,12 +365,14 @@ class NodeGraph:
 
     def _calculate_intersections(self, for_node):
         def count_nodes(node, counts):
-            for node in self._reverse_dependencies[node]:
-                if node in counts:
-                    counts[node] += 1
-                else:
-                    counts[node] = 1
-                    count_nodes(node, counts)
+            queue = [node]
+            while queue:
+                for node in self._reverse_dependencies[queue.pop()]:
+                    if node in counts:
+                        counts[node] += 1
+                    else:
+                        counts[node] = 1
+                        queue.append(node)
             return counts
 
         if for_node not in self._intersections:
@@ -238,14 +383,71 @@ class NodeGraph:
 
         return dict(self._intersections[for_node])
 
+    def _calculate_priorities(self):
+        """Calculates the priorities of all nodes (see 'get_node_priority'),
+        visiting nodes only once all nodes depending on them have been
+        visited, starting with the top (final) nodes of the graph.
+        """
+        remaining_work = {}
+        counts = dict((node, len(rev_deps)) for (node, rev_deps)
+                      in self._reverse_dependencies.iteritems())
+        queue = list(self._top_nodes)
+
+        while queue:
+            node = queue.pop()
+            work = 0
+            for rev_dependency in self._reverse_dependencies[node]:
+                work = max(work, remaining_work[rev_dependency])
+            remaining_work[node] = work + self._estimate_cost(node)
+
+            for dependency in node.dependencies:
+                counts[dependency] -= 1
+                if not counts[dependency]:
+                    queue.append(dependency)
+
+        return dict((node, (node.priority, work))
+                    for (node, work) in remaining_work.iteritems())
+
+    def _estimate_cost(self, node):
+        """Returns the estimated cost of running a node, used when
+        calculating the length of critical paths. This is the estimated
+        runtime if available; lacking other information, the number of
+        threads used is taken as a proxy for the cost.
+        """
+        estimate = self._estimates.get(node)
+        if estimate is None:
+            return node.threads
+        return estimate
+
+    def _estimate_runtimes(self, cache):
+        """Estimates the runtimes of nodes using the RuntimeHistory passed to
+        the constructor (if any). Nodes for which the size of the input files
+        cannot be determined are estimated based on the node type alone."""
+        estimates = {}
+        if self._runtimes is not None:
+            for node in self._reverse_dependencies:
+                size = cache.file_sizes(node.input_files)
+                estimate = self._runtimes.estimate(node, size)
+                if estimate is not None:
+                    estimates[node] = estimate
+
+        return estimates
+
     def _update_node_state(self, node, cache):
-        if node in self._states:
-            return self._states[node]
+        if node not in self._states:
+            # Update sub-nodes before checking for fixed states
+            for subnode in _iter_dependencies_first((node,), self._states):
+                self._states[subnode] = self._calculate_node_state(subnode,
+                                                                   cache)
+
+        return self._states[node]
 
-        # Update sub-nodes before checking for fixed states
+    def _calculate_node_state(self, node, cache):
+        """Returns the state of a node, based on the (already calculated)
+        states of its dependencies and the state of its files."""
         dependency_states = set((NodeGraph.DONE,))
         for dependency in node.dependencies:
-            dependency_states.add(self._update_node_state(dependency, cache))
+            dependency_states.add(self._states[dependency])
 
         state = max(dependency_states)
         if state == NodeGraph.DONE:
@@ -270,7 +472,6 @@ class NodeGraph:
                 state = NodeGraph.OUTDATED
             else:
                 state = NodeGraph.QUEUED
-        self._states[node] = state
 
         return state
 
@@ -322,6 +523,9 @@ class NodeGraph:
             return (-reqobj.priority, reqobj.name)
         exec_requirements = list(sorted(exec_requirements, key=_key_func))
 
+        # Versions are determined in parallel, or read from the cache
+        versions.prefetch(exec_requirements, self._version_cache)
+
         try:
             for requirement in exec_requirements:
                 self._logger.info("    - Checking version of %r ..."
@@ -335,7 +539,7 @@ class NodeGraph:
                                  % (requirement.name, error))
 
     @classmethod
-    def _check_file_dependencies(cls, nodes):
+    def _check_file_dependencies(cls, nodes, cache):
         files = ("input_files", "output_files")
         files = dict((key, collections.defaultdict(set)) for key in files)
         # Auxiliary files are treated as input files
@@ -350,7 +554,8 @@ class NodeGraph:
         error_messages = []
         error_messages.extend(zip(max_messages, cls._check_output_files(files["output_files"])))
         error_messages.extend(zip(max_messages, cls._check_input_dependencies(files["input_files"],
-                                                                              files["output_files"], nodes)))
+                                                                              files["output_files"], nodes,
+                                                                              cache)))
 
         if error_messages:
             messages = []
@@ -391,15 +596,15 @@ class NodeGraph:
 
 
     @classmethod
-    def _check_input_dependencies(cls, input_files, output_files, nodes):
-        dependencies = cls._collect_dependencies(nodes, {})
+    def _check_input_dependencies(cls, input_files, output_files, nodes, cache):
+        heights = cls._calculate_heights(nodes)
 
         for (filename, nodes) in sorted(input_files.items(), key = lambda v: v[0]):
             if (filename in output_files):
                 producers = output_files[filename]
                 bad_nodes = set()
                 for consumer in nodes:
-                    if not (producers & dependencies[consumer]):
+                    if not cls._depends_on(consumer, producers, heights):
                         bad_nodes.add(consumer)
 
                 if bad_nodes:
@@ -408,34 +613,54 @@ class NodeGraph:
                     yield "Node depends on dynamically created file, but not on the node creating it:" + \
                                 "\n\tFilename: %s\n\tCreated by: %s\n\tDependent node(s): %s" \
                                 % (filename, producer, "\n\t                   ".join(bad_nodes))
-            elif not os.path.exists(filename):
+            elif not cache.files_exist((filename,)):
                 nodes = _summarize_nodes(nodes)
                 yield "Required file does not exist, and is not created by a node:" + \
                             "\n\tFilename: %s\n\tDependent node(s): %s" \
                             % (filename,    "\n\t                   ".join(nodes))
 
     @classmethod
-    def _collect_dependencies(cls, nodes, dependencies):
-        for node in nodes:
-            if node not in dependencies:
-                subnodes = node.dependencies
-                if not subnodes:
-                    dependencies[node] = frozenset()
-                    continue
-
-                cls._collect_dependencies(subnodes, dependencies)
+    def _calculate_heights(cls, nodes):
+        """Returns the height of each node, defined as the length of the
+        longest path from the node to a node without dependencies."""
+        heights = {}
+        for node in _iter_dependencies_first(nodes, heights):
+            height = 0
+            for dependency in node.dependencies:
+                height = max(height, heights[dependency] + 1)
+            heights[node] = height
+
+        return heights
 
-                collected = set(subnodes)
-                for subnode in subnodes:
-                    collected.update(dependencies[subnode])
-                dependencies[node] = frozenset(collected)
+    @classmethod
+    def _depends_on(cls, consumer, producers, heights):
+        """Returns true if the node 'consumer' (indirectly) depends on one or
+        more nodes in the set 'producers'. Since a node can only depend on
+        nodes of a lesser height, nodes with a height less than or equal to
+        that of every producer need not be visited.
+        """
+        if not producers.isdisjoint(consumer.dependencies):
+            return True
 
-        return dependencies
+        min_height = min(heights[node] for node in producers)
+        visited = set()
+        queue = [consumer]
+        while queue:
+            for dependency in queue.pop().dependencies:
+                if dependency in producers:
+                    return True
+                elif dependency not in visited \
+                        and heights[dependency] > min_height:
+                    visited.add(dependency)
+                    queue.append(dependency)
 
+        return False
 
     @classmethod
     def _collect_reverse_dependencies(cls, lst, rev_dependencies, processed):
-        for node in lst:
+        queue = list(lst)
+        while queue:
+            node = queue.pop()
             if node not in processed:
                 processed.add(node)
 
@@ -445,8 +670,65 @@ class NodeGraph:
                 subnodes = node.dependencies
                 for dependency in subnodes:
                     rev_dependencies[dependency].add(node)
-                cls._collect_reverse_dependencies(subnodes, rev_dependencies, processed)
-
+                queue.extend(subnodes)
+
+
+def _iter_dependencies_first(nodes, done):
+    """Yields the nodes in 'nodes' and their (indirect) dependencies, such that
+    every node is yielded after its dependencies. Nodes in 'done' are skipped,
+    along with any dependencies only reachable through those nodes."""
+    visited = set()
+    for node in nodes:
+        if node in done or node in visited:
+            continue
+
+        visited.add(node)
+        stack = [(node, iter(node.dependencies))]
+        while stack:
+            node, dependencies = stack[-1]
+            for dependency in dependencies:
+                if dependency not in done and dependency not in visited:
+                    visited.add(dependency)
+                    stack.append((dependency, iter(dependency.dependencies)))
+                    break
+            else:
+                stack.pop()
+                yield node
+
+
+def _stat_file(fpath):
+    """Returns the result of os.stat for a path, or None if the path does
+    not exist."""
+    try:
+        return os.stat(fpath)
+    except OSError, error:
+        if error.errno != errno.ENOENT:
+            raise
+        return None
+
+
+def _stat_files_in_dir((dirname, fpaths)):
+    """Returns a list of (path, stats) for paths in a directory; see
+    FileStatusCache.prefetch. The directory is only listed if more than one
+    path is to be checked, and is otherwise stat'ed directly."""
+    filenames = None
+    if len(fpaths) > 1:
+        try:
+            filenames = frozenset(os.listdir(dirname or "."))
+        except OSError, error:
+            if error.errno in (errno.ENOENT, errno.ENOTDIR):
+                return [(fpath, None) for fpath in fpaths]
+            # Fall back to checking each file (e.g. if lacking permissions)
+
+    results = []
+    for fpath in fpaths:
+        basename = os.path.basename(fpath)
+        if filenames is not None and basename and basename not in filenames:
+            results.append((fpath, None))
+        else:
+            results.append((fpath, _stat_file(fpath)))
+
+    return results
 
 
 def _summarize_nodes(nodes):
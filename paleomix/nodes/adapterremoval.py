@@ -76,7 +76,9 @@ class SE_AdapterRemovalNode(CommandNode):
 
         self._multi_file_input = len(parameters.input_files) > 1
         if self._multi_file_input:
-            cat = _build_cat_command(parameters.input_files, "uncompressed_input")
+            cat = _build_cat_command(parameters.input_files,
+                                     "uncompressed_input",
+                                     threads=parameters.threads)
             command = ParallelCmds((command, cat))
 
         CommandNode.__init__(self,
@@ -144,8 +146,12 @@ class PE_AdapterRemovalNode(CommandNode):
         command = parameters.command.finalize()
         self._multi_file_input = len(parameters.input_files_1) > 1
         if self._multi_file_input:
-            cat_1 = _build_cat_command(parameters.input_files_1, "uncompressed_input_1")
-            cat_2 = _build_cat_command(parameters.input_files_2, "uncompressed_input_2")
+            cat_1 = _build_cat_command(parameters.input_files_1,
+                                       "uncompressed_input_1",
+                                       threads=parameters.threads)
+            cat_2 = _build_cat_command(parameters.input_files_2,
+                                       "uncompressed_input_2",
+                                       threads=parameters.threads)
             command = ParallelCmds((command, cat_1, cat_2))
 
         CommandNode.__init__(self,
@@ -165,9 +171,12 @@ class PE_AdapterRemovalNode(CommandNode):
         CommandNode._setup(self, config, temp)
 
 
-def _build_cat_command(input_files, output_file):
+def _build_cat_command(input_files, output_file, threads=1):
     cat = factory.new("cat")
     cat.set_option("--output", "%(TEMP_OUT_CAT)s")
+    if threads > 1:
+        # Decompression may otherwise limit multi-threaded trimming
+        cat.set_option("--threads", threads)
     cat.set_kwargs(TEMP_OUT_CAT=output_file)
     cat.add_multiple_values(input_files)
 
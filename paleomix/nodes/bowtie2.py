@@ -36,7 +36,8 @@ from paleomix.atomiccmd.sets import \
 from paleomix.nodes.bwa import \
     _get_node_description, \
     _process_output, \
-    _get_max_threads
+    _get_max_threads, \
+    _MAPPING_PRIORITY
 from paleomix.common.utilities import \
     safe_coerce_to_tuple
 
@@ -126,7 +127,8 @@ class Bowtie2Node(CommandNode):
                              command=command,
                              description=description,
                              threads=parameters.threads,
-                             dependencies=parameters.dependencies)
+                             dependencies=parameters.dependencies,
+                             priority=_MAPPING_PRIORITY)
 
 
 def _bowtie2_template(call, prefix, iotype="IN", **kwargs):
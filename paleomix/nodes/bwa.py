@@ -50,6 +50,10 @@ BWA_VERSION_07x = versions.Requirement(call=("bwa",),
                                        search=r"Version: (\d+)\.(\d+)\.(\d+)",
                                        checks=versions.GE(0, 7, 9))
 
+# Scheduling priority of mapping nodes (see Node), as mapping is typically the
+# most costly step, and should therefore be started as early as possible
+_MAPPING_PRIORITY = 1
+
 
 class BWAIndexNode(CommandNode):
     def __init__(self, input_file, prefix=None, dependencies=()):
@@ -78,7 +82,8 @@ class BWABacktrack(CommandNode):
         _check_bwa_prefix(reference)
         threads = _get_max_threads(reference, threads)
 
-        aln_in = _build_cat_command(input_file, "uncompressed_input")
+        aln_in = _build_cat_command(input_file, "uncompressed_input",
+                                    threads=threads)
         aln = _get_bwa_template(("bwa", "aln"), prefix,
                                 TEMP_IN_FILE="uncompressed_input",
                                 OUT_STDOUT=output_file,
@@ -108,7 +113,8 @@ class BWABacktrack(CommandNode):
                              command=command,
                              description=description,
                              threads=parameters.threads,
-                             dependencies=parameters.dependencies)
+                             dependencies=parameters.dependencies,
+                             priority=_MAPPING_PRIORITY)
 
     def _setup(self, _config, temp):
         os.mkfifo(os.path.join(temp, "uncompressed_input"))
@@ -226,7 +232,8 @@ class BWAAlgorithmNode(CommandNode):
 
         threads = _get_max_threads(reference, threads)
 
-        zcat_1 = _build_cat_command(input_file_1, "uncompressed_input_1")
+        zcat_1 = _build_cat_command(input_file_1, "uncompressed_input_1",
+                                    threads=threads)
         aln = _get_bwa_template(("bwa", algorithm), prefix,
                                 TEMP_IN_FILE_1="uncompressed_input_1",
                                 OUT_STDOUT=AtomicCmd.PIPE,
@@ -240,7 +247,8 @@ class BWAAlgorithmNode(CommandNode):
         if input_file_2:
             aln.add_value("%(TEMP_IN_FILE_2)s")
             aln.set_kwargs(**{"TEMP_IN_FILE_2": "uncompressed_input_2"})
-            zcat_2 = _build_cat_command(input_file_2, "uncompressed_input_2")
+            zcat_2 = _build_cat_command(input_file_2, "uncompressed_input_2",
+                                        threads=threads)
             commands["zcat_2"] = zcat_2
         else:
             # Ensure that the pipe is automatically removed
@@ -272,7 +280,8 @@ class BWAAlgorithmNode(CommandNode):
                              command=command,
                              description=desc,
                              threads=parameters.threads,
-                             dependencies=parameters.dependencies)
+                             dependencies=parameters.dependencies,
+                             priority=_MAPPING_PRIORITY)
 
     def _setup(self, _config, temp):
         os.mkfifo(os.path.join(temp, "uncompressed_input_1"))
@@ -395,9 +404,12 @@ def _check_bwa_prefix(prefix):
 _PREFIXES_CHECKED = set()
 
 
-def _build_cat_command(input_file, output_file):
+def _build_cat_command(input_file, output_file, threads=1):
     cat = factory.new("cat")
     cat.set_option("--output", "%(TEMP_OUT_CAT)s")
+    if threads > 1:
+        # Decompression may otherwise limit multi-threaded mapping
+        cat.set_option("--threads", threads)
     cat.add_value("%(IN_ARCHIVE)s")
     cat.set_kwargs(TEMP_OUT_CAT=output_file,
                    IN_ARCHIVE=input_file)
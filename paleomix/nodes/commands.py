@@ -54,16 +54,23 @@ from paleomix.nodes.samtools import \
     SAMTOOLS_VERSION_0119, \
     BCFTOOLS_VERSION_0119
 
+from paleomix.common.text import \
+    binary_table_path
+
 import paleomix.tools.bam_stats.coverage as coverage
 import paleomix.tools.factory as factory
 
+# I/O weight (see Node) of nodes reading and decompressing entire BAMs
+_BAM_IO_WEIGHT = 1
+
 
 class DuplicateHistogramNode(MultiBAMInputNode):
     """Node for calling the 'paleomix duphist' command.
 
-    Takes 1 or more BAMs as imput, requiring a config object in order to run
-    MergeSamFiles.jar to merge these files. The output is a histogram of PCR
-    duplicate counts, usable as input for the 'preseq' tool.
+    Takes 1 or more BAMs as imput, requiring a config object in order to
+    select the tool used to merge these files (see MultiBAMInputNode). The
+    output is a histogram of PCR duplicate counts, usable as input for the
+    'preseq' tool.
     """
 
     def __init__(self, config, input_files, output_file, dependencies=()):
@@ -82,18 +89,23 @@ class DuplicateHistogramNode(MultiBAMInputNode):
                                    input_bams=input_files,
                                    command=builder.finalize(),
                                    description=description,
-                                   dependencies=dependencies)
+                                   dependencies=dependencies,
+                                   io_weight=_BAM_IO_WEIGHT)
 
 
 class CoverageNode(CommandNode):
     def __init__(self, target_name, input_file, output_file,
-                 regions_file=None, dependencies=()):
+                 regions_file=None, threads=1, dependencies=()):
         builder = factory.new("coverage")
         builder.add_value("%(IN_BAM)s")
         builder.add_value("%(OUT_FILE)s")
         builder.set_option("--target-name", target_name)
         builder.set_kwargs(IN_BAM=input_file,
-                           OUT_FILE=output_file)
+                           OUT_FILE=output_file,
+                           OUT_FILE_BIN=binary_table_path(output_file))
+
+        if threads > 1:
+            builder.set_option("--threads", threads)
 
         if regions_file:
             builder.set_option('--regions-file', '%(IN_REGIONS)s')
@@ -103,7 +115,9 @@ class CoverageNode(CommandNode):
         CommandNode.__init__(self,
                              command=builder.finalize(),
                              description=description,
-                             dependencies=dependencies)
+                             threads=threads,
+                             dependencies=dependencies,
+                             io_weight=_BAM_IO_WEIGHT)
 
 
 class MergeCoverageNode(Node):
@@ -114,7 +128,8 @@ class MergeCoverageNode(Node):
                       description="<MergeCoverage: %s -> '%s'>"
                       % (describe_files(input_files), self._output_file),
                       input_files=input_files,
-                      output_files=self._output_file,
+                      output_files=(self._output_file,
+                                    binary_table_path(self._output_file)),
                       dependencies=dependencies)
 
     def _run(self, _config, temp):
@@ -123,12 +138,13 @@ class MergeCoverageNode(Node):
             coverage.read_table(table, filename)
 
         coverage.write_table(table, reroot_path(temp, self._output_file))
-        move_file(reroot_path(temp, self._output_file), self._output_file)
+        for filename in self.output_files:
+            move_file(reroot_path(temp, filename), filename)
 
 
 class DepthHistogramNode(MultiBAMInputNode):
     def __init__(self, config, target_name, input_files, output_file,
-                 prefix, regions_file=None, dependencies=()):
+                 prefix, regions_file=None, threads=1, dependencies=()):
         input_files = safe_coerce_to_tuple(input_files)
         index_format = regions_file and prefix['IndexFormat']
 
@@ -137,9 +153,13 @@ class DepthHistogramNode(MultiBAMInputNode):
         builder.add_value("%(OUT_FILE)s")
         builder.set_option("--target-name", target_name)
         builder.set_kwargs(OUT_FILE=output_file,
+                           OUT_FILE_BIN=binary_table_path(output_file),
                            TEMP_IN_BAM=MultiBAMInputNode.PIPE_FILE)
         builder.add_multiple_kwargs(input_files)
 
+        if threads > 1:
+            builder.set_option("--threads", threads)
+
         if regions_file:
             index_file = swap_ext(MultiBAMInputNode.PIPE_FILE, index_format)
 
@@ -156,7 +176,74 @@ class DepthHistogramNode(MultiBAMInputNode):
                                    index_format=index_format,
                                    command=builder.finalize(),
                                    description=description,
-                                   dependencies=dependencies)
+                                   threads=threads,
+                                   dependencies=dependencies,
+                                   io_weight=_BAM_IO_WEIGHT)
+
+
+class BAMStatisticsNode(MultiBAMInputNode):
+    """Node for calling the 'paleomix bam_stats' command.
+
+    Calculates one or more statistics for a set of BAMs (merged using
+    MultiBAMInputNode), reading the BAMs only once. Output tables are written
+    for those statistics for which an output filename is given; see the
+    CoverageNode, DepthHistogramNode, and DuplicateHistogramNode.
+    """
+
+    def __init__(self, config, target_name, input_files, prefix=None,
+                 coverage=None, depths=None, duphist=None, insert_sizes=None,
+                 regions_file=None, threads=1, dependencies=()):
+        input_files = safe_coerce_to_tuple(input_files)
+        index_format = regions_file and prefix['IndexFormat']
+
+        builder = factory.new("bam_stats")
+        builder.add_value("%(TEMP_IN_BAM)s")
+        builder.set_option("--target-name", target_name)
+        builder.set_kwargs(TEMP_IN_BAM=MultiBAMInputNode.PIPE_FILE)
+        builder.add_multiple_kwargs(input_files)
+
+        if threads > 1:
+            builder.set_option("--threads", threads)
+
+        output_files = []
+        for (option, key, filename) in (("--coverage", "COVERAGE", coverage),
+                                        ("--depths", "DEPTHS", depths),
+                                        ("--duphist", "DUPHIST", duphist),
+                                        ("--insert-sizes", "INSERT_SIZES",
+                                         insert_sizes)):
+            if filename is not None:
+                builder.set_option(option, "%%(OUT_%s)s" % (key,))
+                builder.set_kwargs(**{"OUT_" + key: filename})
+                output_files.append(filename)
+
+                if key in ("COVERAGE", "DEPTHS"):
+                    # Binary copies of tables; see 'write_binary_table'
+                    builder.set_kwargs(**{"OUT_%s_BIN" % (key,):
+                                          binary_table_path(filename)})
+
+        if not output_files:
+            raise ValueError("No output files specified for BAMStatisticsNode")
+
+        if regions_file:
+            index_file = swap_ext(MultiBAMInputNode.PIPE_FILE, index_format)
+
+            builder.set_option('--regions-file', '%(IN_REGIONS)s')
+            builder.set_kwargs(IN_REGIONS=regions_file,
+                               TEMP_IN_INDEX=index_file)
+
+        description = "<BAMStatistics: %s -> %s>" \
+            % (describe_files(input_files),
+               ", ".join(map(repr, output_files)))
+
+        MultiBAMInputNode.__init__(self,
+                                   config=config,
+                                   input_bams=input_files,
+                                   index_format=index_format,
+                                   command=builder.finalize(),
+                                   description=description,
+                                   threads=threads,
+                                   dependencies=dependencies,
+                                   io_weight=_BAM_IO_WEIGHT)
 
 
 class FilterCollapsedBAMNode(MultiBAMInputNode):
@@ -50,6 +50,10 @@ RSCRIPT_VERSION = versions.Requirement(call=("Rscript", "--version"),
                                        checks=versions.GE(2, 15, 1),
                                        priority=10)
 
+# Scheduling priority of rescaling nodes (see Node), as rescaling is slow, and
+# gates later steps, and should therefore be started as early as possible
+_RESCALE_PRIORITY = 1
+
 
 class MapDamagePlotNode(MultiBAMInputNode):
     @create_customizable_cli_parameters
@@ -230,7 +234,8 @@ class MapDamageRescaleNode(MultiBAMInputNode):
                                    input_bams=parameters.input_files,
                                    command=parameters.command.finalize(),
                                    description=description,
-                                   dependencies=parameters.dependencies)
+                                   dependencies=parameters.dependencies,
+                                   priority=_RESCALE_PRIORITY)
 
     def _setup(self, config, temp):
         MultiBAMInputNode._setup(self, config, temp)
@@ -39,6 +39,7 @@ from paleomix.common.utilities import \
     safe_coerce_to_tuple
 import paleomix.common.versions as versions
 import paleomix.common.system
+import paleomix.tools.factory as factory
 
 
 class PicardNode(CommandNode):
@@ -161,10 +162,18 @@ class MergeSamFilesNode(PicardNode):
 
 
 class MultiBAMInputNode(CommandNode):
+    """Base class for nodes taking one or more BAMs as input, which are made
+    available as a single (sorted) BAM named PIPE_FILE in the temporary
+    folder. Multiple BAMs are merged into a named pipe using the tool selected
+    by 'config.bam_merge_tool', either 'paleomix merge' or Picard
+    MergeSamFiles; a single BAM (and index) is simply symlinked.
+    """
+
     PIPE_FILE = "input.bam"
 
     def __init__(self, config, input_bams, command, index_format=None,
-                 description=None, threads=1, dependencies=()):
+                 description=None, threads=1, dependencies=(), priority=0,
+                 memory=None, io_weight=0):
         self._input_bams = safe_coerce_to_tuple(input_bams)
         self._index_format = index_format
 
@@ -176,14 +185,21 @@ class MultiBAMInputNode(CommandNode):
             raise ValueError("Unknown index format %r" % (index_format,))
 
         if len(self._input_bams) > 1:
-            merge = picard_command(config, "MergeSamFiles")
-            merge.set_option("SO", "coordinate", sep="=")
-            merge.set_option("COMPRESSION_LEVEL", 0, sep="=")
-            merge.set_option("OUTPUT", "%(TEMP_OUT_BAM)s", sep="=")
-            # Validation is mostly left to manual ValidateSamFile runs; this
-            # is because .csi indexed BAM records can have "invalid" bins.
-            merge.set_option("VALIDATION_STRINGENCY", "LENIENT", sep="=")
-            merge.add_multiple_options("I", input_bams, sep="=")
+            if config.bam_merge_tool == "picard":
+                merge = picard_command(config, "MergeSamFiles")
+                merge.set_option("SO", "coordinate", sep="=")
+                merge.set_option("COMPRESSION_LEVEL", 0, sep="=")
+                merge.set_option("OUTPUT", "%(TEMP_OUT_BAM)s", sep="=")
+                # Validation is mostly left to manual ValidateSamFile runs;
+                # this is because .csi indexed BAM records can have "invalid"
+                # bins.
+                merge.set_option("VALIDATION_STRINGENCY", "LENIENT", sep="=")
+                merge.add_multiple_options("I", input_bams, sep="=")
+            else:
+                # Merges BAMs without starting a JVM; see 'paleomix merge'
+                merge = factory.new("merge")
+                merge.set_option("--output", "%(TEMP_OUT_BAM)s")
+                merge.add_multiple_values(input_bams)
 
             merge.set_kwargs(TEMP_OUT_BAM=self.PIPE_FILE)
 
@@ -193,7 +209,10 @@ class MultiBAMInputNode(CommandNode):
                              command=command,
                              description=description,
                              threads=threads,
-                             dependencies=dependencies)
+                             dependencies=dependencies,
+                             priority=priority,
+                             memory=memory,
+                             io_weight=io_weight)
 
     def _setup(self, config, temp):
         CommandNode._setup(self, config, temp)
@@ -27,8 +27,6 @@ import copy
 import itertools
 import collections
 
-import pysam
-
 import paleomix.common.fileutils as fileutils
 import paleomix.common.utilities as utilities
 import paleomix.common.sequences as sequtils
@@ -90,6 +88,8 @@ class CollectSequencesNode(Node):
                     raise NodeError(message)
 
     def _run(self, _config, temp):
+        import pysam
+
         fasta_files = []
         for (name, filename) in sorted(self._infiles.iteritems()):
             fasta_files.append((name, pysam.Fastafile(filename)))
@@ -157,6 +157,8 @@ class ExtractReferenceNode(Node):
                       dependencies=dependencies)
 
     def _run(self, _config, temp):
+        import pysam
+
         def _by_name(bed):
             return bed.name
 
@@ -22,12 +22,13 @@
 #
 import collections
 import io
+import itertools
 import json
+import multiprocessing
+import operator
 import os
 import re
 
-import pysam
-
 from paleomix.node import \
     Node, \
     NodeError
@@ -41,7 +42,6 @@ from paleomix.common.sequences import \
 
 import paleomix.common.formats.fastq as fastq
 import paleomix.common.procs as procs
-import paleomix.common.sampling as sampling
 import paleomix.tools.factory as factory
 
 
@@ -107,7 +107,8 @@ class DetectInputDuplicationNode(Node):
 
 
 class ValidateFASTQFilesNode(Node):
-    def __init__(self, input_files, output_file, offset, dependencies=()):
+    def __init__(self, input_files, output_file, offset, threads=1,
+                 dependencies=()):
         self._offset = offset
         self._files = set()
         for (read_type, filename) in input_files.iteritems():
@@ -121,12 +122,14 @@ class ValidateFASTQFilesNode(Node):
         Node.__init__(self,
                       description="<Validate FASTQ Files: %s>"
                       % (describe_files(input_files)),
+                      threads=max(1, min(threads, len(self._files))),
                       input_files=input_files,
                       output_files=output_file,
                       dependencies=dependencies)
 
     def _run(self, _config, _temp):
-        stats = check_fastq_files(self._files, self._offset, True)
+        stats = check_fastq_files(self._files, self._offset, True,
+                                  self.threads)
         output_file = tuple(self.output_files)[0]
         if os.path.dirname(output_file):
             make_dirs(os.path.dirname(output_file))
@@ -137,10 +140,11 @@ class ValidateFASTQFilesNode(Node):
 
 
 class ValidateFASTAFilesNode(Node):
-    def __init__(self, input_files, output_file, dependencies=()):
+    def __init__(self, input_files, output_file, threads=1, dependencies=()):
         Node.__init__(self,
                       description="<Validate FASTA Files: %s>"
                       % (describe_files(input_files)),
+                      threads=threads,
                       input_files=input_files,
                       output_files=output_file,
                       dependencies=dependencies)
@@ -149,7 +153,7 @@ class ValidateFASTAFilesNode(Node):
 
     def _run(self, _config, _temp):
         for filename in self.input_files:
-            check_fasta_file(filename)
+            check_fasta_file(filename, self.threads)
         output_file, = self.output_files
         if os.path.dirname(output_file):
             make_dirs(os.path.dirname(output_file))
@@ -157,42 +161,43 @@ class ValidateFASTAFilesNode(Node):
             pass
 
 
-def check_bam_files(input_files, err_func):
-    handles = []
-    try:
-        last_pos = None
-        observed_reads = collections.defaultdict(list)
-        reads_iter = _open_samfiles(handles, input_files)
-        references = handles[0].references
-
-        for (record, filename) in reads_iter:
-            curr_pos = (record.pos, record.tid)
-            if curr_pos != last_pos:
-                _process_bam_reads(observed_reads, references, last_pos, err_func)
-                observed_reads.clear()
-                last_pos = curr_pos
-
-                # Stop once the trailing, unmapped reads are reached
-                if record.tid == -1:
-                    break
-
-            observed_reads[record.qname].append((record, filename))
-        _process_bam_reads(observed_reads, references, last_pos, err_func)
-    finally:
-        for handle in handles:
-            handle.close()
-
+def check_bam_files(input_files, err_func, threads=1):
+    """Checks a set of sorted BAM files for reads included multiple times,
+    i.e. reads with identical names, sequences, qualities, and strands that
+    are mapped to the same position, and calls 'err_func' for each such read.
 
-def check_fastq_files(filenames, required_offset, allow_empty=False):
+    Reads are first compared using 64-bit fingerprints, keeping only the
+    fingerprints of reads at the current position; positions with identical
+    fingerprints are then re-read, and the full reads compared. If 'threads'
+    is greater than 1, and all BAMs are indexed, contigs are checked in
+    parallel by worker processes.
+    """
+    input_files = list(input_files)
+    candidates = _find_duplicate_candidates(input_files, threads)
+    if candidates:
+        _report_duplicates(input_files, candidates, err_func)
+
+
+def check_fastq_files(filenames, required_offset, allow_empty=False,
+                      threads=1):
+    """Validates a set of (file type, filename) pairs, checking the structure
+    of every FASTQ record and the offset of all quality scores; up to 'threads'
+    files are validated in parallel by worker processes. Returns a dictionary
+    of the total number of reads and nucleotides in the files.
+    """
     stats = {
         "seq_retained_nts": 0,
         "seq_retained_reads": 0,
         "seq_collapsed": 0,
     }
 
-    for file_type, filename in filenames:
-        qualities = _read_sequences(file_type, filename, stats)
-        offsets = fastq.classify_quality_strings(qualities)
+    filenames = list(filenames)
+    results = _validate_fastq_files(filenames, threads)
+    for ((_, filename), (file_stats, ranges)) in zip(filenames, results):
+        for (key, value) in file_stats.iteritems():
+            stats[key] += value
+
+        offsets = fastq.classify_quality_ranges(ranges)
         if offsets == fastq.OFFSET_BOTH:
             raise NodeError("FASTQ file contains quality scores with both "
                             "quality offsets (33 and 64); file may be "
@@ -200,7 +205,7 @@ def check_fastq_files(filenames, required_offset, allow_empty=False):
                             "that this file contains valid FASTQ reads from a "
                             "single source.\n    Filename = %r" % (filename,))
         elif offsets == fastq.OFFSET_MISSING:
-            if allow_empty and not qualities:
+            if allow_empty and not file_stats["seq_retained_reads"]:
                 continue
 
             raise NodeError("FASTQ file did not contain quality scores; file "
@@ -218,7 +223,29 @@ def check_fastq_files(filenames, required_offset, allow_empty=False):
     return stats
 
 
-def _read_sequences(file_type, filename, stats):
+def _validate_fastq_files(filenames, threads):
+    """Returns a list of (stats, quality score ranges) for each (file type,
+    filename) pair, validating up to 'threads' files in parallel."""
+    if threads <= 1 or len(filenames) <= 1:
+        return map(_validate_fastq_file, filenames)
+
+    pool = multiprocessing.Pool(min(threads, len(filenames)))
+    try:
+        results = pool.map(_validate_fastq_file, filenames)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    return results
+
+
+def _validate_fastq_file(task):
+    """Validates a (file type, filename) pair, reading the (possibly
+    compressed) file using 'paleomix cat'."""
+    file_type, filename = task
     cat_call = factory.new("cat")
     cat_call.add_multiple_values((filename,))
     cat_call = cat_call.finalized_call
@@ -229,9 +256,7 @@ def _read_sequences(file_type, filename, stats):
                               bufsize=io.DEFAULT_BUFFER_SIZE,
                               stderr=procs.PIPE,
                               stdout=procs.PIPE)
-        qualities = _collect_qualities(cat.stdout, file_type, filename, stats)
-
-        return sampling.reservoir_sampling(qualities, 100000)
+        return _validate_fastq_handle(cat.stdout, file_type, filename)
     except StandardError as error:
         if cat:
             try:
@@ -250,19 +275,175 @@ def _read_sequences(file_type, filename, stats):
             raise NodeError(message)
 
 
-def _open_samfiles(handles, filenames):
+def _find_duplicate_candidates(filenames, threads):
+    """Returns a set of (tid, pos) tuples for positions at which two or more
+    reads have identical fingerprints."""
+    tasks = [(filenames, None)]
+    if threads > 1:
+        tasks = _build_duplicate_tasks(filenames, threads)
+
+    if len(tasks) == 1:
+        return _find_candidates_in_contigs(tasks[0])
+
+    candidates = set()
+    pool = multiprocessing.Pool(threads)
+    try:
+        for result in pool.imap_unordered(_find_candidates_in_contigs, tasks):
+            candidates.update(result)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    return candidates
+
+
+def _build_duplicate_tasks(filenames, threads):
+    """Splits the contigs of a set of BAM files into (filenames, contigs)
+    tasks of roughly equal total length; a single task covering all contigs
+    is returned if one or more BAMs are not indexed."""
+    import pysam
+
+    if not _all_indexed(filenames):
+        return [(filenames, None)]
+
+    with pysam.AlignmentFile(filenames[0]) as handle:
+        references = handle.references
+        lengths = handle.lengths
+
+    total = sum(lengths)
+    ntasks = max(1, min(len(references), threads * _DUPCHECK_TASKS_PER_THREAD))
+
+    tasks = [[]]
+    cumulative = 0
+    for (name, length) in zip(references, lengths):
+        if tasks[-1] and cumulative >= (total * len(tasks)) // ntasks:
+            tasks.append([])
+
+        tasks[-1].append(name)
+        cumulative += length
+
+    return [(filenames, contigs) for contigs in tasks]
+
+
+def _find_candidates_in_contigs(task):
+    """Returns the set of (tid, pos) tuples at which two or more reads have
+    identical fingerprints, for the given contigs (or all contigs if None);
+    only the fingerprints of reads at the current position are kept in
+    memory, and positions with a single read are skipped entirely."""
+    filenames, contigs = task
+    candidates = set()
+    handles = []
+    try:
+        reads_iter = _open_samfiles(handles, filenames, contigs)
+        for (position, records) in itertools.groupby(reads_iter,
+                                                     _key_by_tid_pos):
+            # Stop once the trailing, unmapped reads are reached
+            if position[0] == -1:
+                break
+
+            first = next(records)
+            second = next(records, None)
+            if second is None:
+                # Most positions are covered by at most one read start
+                continue
+
+            observed = set((_fingerprint(first[0]),))
+            for (record, _) in itertools.chain((second,), records):
+                fingerprint = _fingerprint(record)
+                if fingerprint in observed:
+                    candidates.add(position)
+                    break
+
+                observed.add(fingerprint)
+    finally:
+        for handle in handles:
+            handle.close()
+
+    return candidates
+
+
+def _report_duplicates(filenames, candidates, err_func):
+    """Compares the full reads at each candidate position, calling 'err_func'
+    for reads found multiple times; candidates may be false positives, due to
+    collisions between fingerprints."""
+    import pysam
+
+    with pysam.AlignmentFile(filenames[0]) as handle:
+        references = handle.references
+
+    contigs = None
+    if _all_indexed(filenames):
+        # Only read the contigs on which candidates were found
+        tids = sorted(set(tid for (tid, _) in candidates))
+        contigs = [references[tid] for tid in tids]
+
+    handles = []
+    try:
+        last_candidate = max(candidates)
+        reads_iter = _open_samfiles(handles, filenames, contigs)
+        for (position, records) in itertools.groupby(reads_iter,
+                                                     _key_by_tid_pos):
+            if position in candidates:
+                observed_reads = collections.defaultdict(list)
+                for (record, filename) in records:
+                    observed_reads[record.qname].append((record, filename))
+
+                _process_bam_reads(observed_reads, references, position,
+                                   err_func)
+
+                if position == last_candidate:
+                    break
+    finally:
+        for handle in handles:
+            handle.close()
+
+
+def _all_indexed(filenames):
+    """Returns true if all BAM files have been indexed."""
+    import pysam
+
+    for filename in filenames:
+        with pysam.AlignmentFile(filename) as handle:
+            if not handle.has_index():
+                return False
+
+    return True
+
+
+def _fingerprint(record):
+    """Returns a 64-bit hash of the name, sequence, qualities, and strand of a
+    read; reads with different fingerprints are never identical."""
+    return hash((record.is_reverse, record.qname, record.seq, record.qual))
+
+
+def _open_samfiles(handles, filenames, contigs=None):
+    import pysam
+
     sequences = []
     for filename in filenames:
-        handle = pysam.Samfile(filename)
+        handle = pysam.AlignmentFile(filename)
         handles.append(handle)
 
-        sequences.append(_read_samfile(handle, filename))
+        records = handle
+        if contigs is not None:
+            records = _fetch_contigs(handle, contigs)
+
+        sequences.append(_read_samfile(records, filename))
 
     return chain_sorted(*sequences, key=_key_by_tid_pos)
 
 
-def _read_samfile(handle, filename):
-    for record in handle:
+def _fetch_contigs(handle, contigs):
+    for contig in contigs:
+        for record in handle.fetch(contig):
+            yield record
+
+
+def _read_samfile(records, filename):
+    for record in records:
         if record.is_unmapped and (not record.pos or record.mate_is_unmapped):
             # Ignore unmapped reads except when these are sorted
             # according to the mate position (if mapped)
@@ -298,8 +479,8 @@ def _process_bam_reads(observed_reads, references, position, err_func):
                 seq = reverse_complement(seq)
                 qual = qual[::-1]
 
-            chrom = references[position[1]]
-            pos = position[0]
+            chrom = references[position[0]]
+            pos = position[1]
 
             err_func(chrom, pos, records, name, seq, qual)
 
@@ -332,7 +513,68 @@ def _key_by_tid_pos(record):
     return (record[0].tid, record[0].pos)
 
 
-def _collect_qualities(handle, file_type, filename, stats):
+def _validate_fastq_handle(handle, file_type, filename):
+    """Validates the FASTQ records read from 'handle' in blocks of (roughly)
+    _FASTQ_BLOCK_SIZE bytes, and returns a tuple of read / nucleotide counts
+    and of the ranges of quality scores observed (see
+    'fastq.find_quality_ranges'). Blocks are validated using bulk string
+    operations, while any partial record at the end of the file is validated
+    line by line.
+    """
+    stats = {
+        "seq_retained_nts": 0,
+        "seq_retained_reads": 0,
+        "seq_collapsed": 0,
+    }
+    ranges = [False, False, False]
+
+    remainder = ""
+    while True:
+        block = handle.read(_FASTQ_BLOCK_SIZE)
+        if not block:
+            break
+
+        lines = (remainder + block).split("\n")
+        # The last line is incomplete (or empty), as may be the current record
+        nrecords = (len(lines) - 1) // 4
+        remainder = "\n".join(lines[nrecords * 4:])
+        del lines[nrecords * 4:]
+
+        _validate_fastq_block(lines, file_type, filename, stats, ranges)
+
+    if remainder:
+        _validate_fastq_records(io.BytesIO(remainder), file_type, filename,
+                                stats, ranges)
+
+    return stats, ranges
+
+
+def _validate_fastq_block(lines, file_type, filename, stats, ranges):
+    """Validates a list of lines making up complete FASTQ records."""
+    headers = lines[0::4]
+    sequences = lines[1::4]
+    seperators = lines[2::4]
+    qualities = lines[3::4]
+
+    nrecords = len(headers)
+    if "".join(map(_FIRST_CHAR, headers)).count("@") != nrecords \
+            or "".join(map(_FIRST_CHAR, seperators)).count("+") != nrecords \
+            or map(len, sequences) != map(len, qualities):
+        # Re-validate the records line by line to report the first error
+        handle = io.BytesIO("\n".join(lines) + "\n")
+        _validate_fastq_records(handle, file_type, filename, stats, ranges)
+        return
+
+    # Lengths include the trailing newline, as when reading lines
+    stats["seq_retained_nts"] += sum(map(len, sequences)) + nrecords
+    stats["seq_retained_reads"] += nrecords
+    if "Collapsed" in file_type:
+        stats["seq_collapsed"] += nrecords
+
+    _update_quality_ranges(ranges, "".join(qualities))
+
+
+def _validate_fastq_records(handle, file_type, filename, stats, ranges):
     header = handle.readline()
     while header:
         sequence = handle.readline()
@@ -369,81 +611,297 @@ def _collect_qualities(handle, file_type, filename, stats):
         if "Collapsed" in file_type:
             stats["seq_collapsed"] += 1
 
-        yield qualities
+        _update_quality_ranges(ranges, qualities)
         header = handle.readline()
 
 
-def check_fasta_file(filename):
+def _update_quality_ranges(ranges, qualities):
+    """Marks the ranges of quality scores found in 'qualities' as observed."""
+    for (index, observed) in enumerate(fastq.find_quality_ranges(qualities)):
+        ranges[index] = ranges[index] or observed
+
+
+def check_fasta_file(filename, threads=1):
+    """Validates a FASTA file, raising a NodeError if the file is malformed.
+
+    The file is read in blocks of (roughly) _FASTA_BLOCK_SIZE bytes, and runs
+    of sequence lines are validated using bulk string operations. If 'threads'
+    is greater than 1, the file is split into chunks at sequence headers,
+    which are validated in parallel; if any chunk is invalid, the file is
+    re-validated by a single process to report the first error in the file.
+    """
+    if threads > 1:
+        chunks = _split_fasta_file(filename, threads * _FASTA_TASKS_PER_THREAD)
+        if len(chunks) > 1 and _check_fasta_chunks(filename, chunks, threads):
+            return
+
+    validator = _FASTAValidator(filename)
     with open(filename) as handle:
-        namecache = {}
-        state, linelength, linelengthchanged = _NA, None, False
-        for linenum, line in enumerate(handle, start=1):
-            # Only \n is allowed as not all tools (e.g. GATK) handle \r
-            line = line.rstrip('\n')
-
-            if not line:
-                if state in (_NA, _IN_WHITESPACE):
-                    continue
-                elif state == _IN_HEADER:
-                    raise NodeError("Expected FASTA sequence, found empty line"
-                                    "\n    Filename = %r\n    Line = %r"
-                                    % (filename, linenum))
-                elif state == _IN_SEQUENCE:
-                    state = _IN_WHITESPACE
-                else:
-                    assert False
-            elif line.startswith(">"):
-                if state in (_NA, _IN_SEQUENCE, _IN_WHITESPACE):
-                    _validate_fasta_header(filename, linenum, line, namecache)
-                    state = _IN_HEADER
-                    linelength = None
-                    linelengthchanged = False
-                elif state == _IN_HEADER:
-                    raise NodeError("Empty sequences not allowed\n"
-                                    "    Filename = %r\n    Line = %r"
-                                    % (filename, linenum - 1))
-                else:
-                    assert False
-            else:
-                if state == _NA:
-                    raise NodeError("Expected FASTA header, found %r\n"
-                                    "    Filename = %r\n    Line = %r"
-                                    % (line, filename, linenum))
-                elif state == _IN_HEADER:
-                    _validate_fasta_line(filename, linenum, line)
-                    linelength = len(line)
-                    state = _IN_SEQUENCE
-                elif state == _IN_SEQUENCE:
-                    _validate_fasta_line(filename, linenum, line)
-                    # If the length has changed, then that line must be the
-                    # last line in the record, which may be shorter due to the
-                    # sequence length. This is because the FAI index format
-                    # expects that each line has the same length.
-                    if linelengthchanged or (linelength < len(line)):
-                        raise NodeError("Lines in FASTQ files must be of same "
-                                        "length\n    Filename = %r\n"
-                                        "    Line = %r" % (filename, linenum))
-                    elif linelength != len(line):
-                        linelengthchanged = True
-                elif state == _IN_WHITESPACE:
-                    raise NodeError("Empty lines not allowed in sequences\n"
-                                    "    Filename = %r\n    Line = %r"
-                                    % (filename, linenum))
-                else:
-                    assert False
-
-        if state == _NA:
+        validator.feed(handle)
+    validator.finish()
+
+
+class _FASTAValidator(object):
+    """Validates the lines of a FASTA file, either one line at a time, or as
+    runs of sequence lines; line numbers are relative to the first line fed
+    to the validator."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.names = {}
+        self._linenum = 0
+        self._state = _NA
+        self._linelength = None
+        self._linelengthchanged = False
+
+    def feed(self, handle, size=None):
+        """Validates the lines read from 'handle', optionally reading at most
+        'size' bytes."""
+        remainder = ""
+        while size is None or size > 0:
+            blocksize = _FASTA_BLOCK_SIZE
+            if size is not None:
+                blocksize = min(blocksize, size)
+
+            block = handle.read(blocksize)
+            if not block:
+                break
+            elif size is not None:
+                size -= len(block)
+
+            block = remainder + block
+            end = block.rfind("\n") + 1
+            remainder = block[end:]
+
+            self._validate_block(block, end)
+
+        if remainder:
+            self._validate_line(remainder)
+
+    def finish(self):
+        """Checks that the lines fed to the validator form complete records."""
+        if self._state == _NA:
             raise NodeError("File does not contain any sequences:\n"
-                            "    Filename = %r" % (filename, ))
-        elif state == _IN_HEADER:
+                            "    Filename = %r" % (self.filename, ))
+        elif self._state == _IN_HEADER:
             raise NodeError("File ends with an empty sequence:\n"
-                            "    Filename = %r" % (filename, ))
+                            "    Filename = %r" % (self.filename, ))
+
+    def _validate_block(self, block, end):
+        """Validates the complete lines in block[:end]; headers and empty lines
+        are validated one at a time, and other lines as runs of sequences."""
+        start = 0
+        next_blank = block.find("\n\n", start, end)
+        while start < end:
+            if block[start] in ">\n":
+                linebreak = block.index("\n", start, end)
+                self._validate_line(block[start:linebreak])
+            else:
+                if 0 <= next_blank < start:
+                    next_blank = block.find("\n\n", start, end)
+
+                linebreak = block.find("\n>", start, end)
+                if linebreak == -1 or 0 <= next_blank < linebreak:
+                    linebreak = next_blank
+                if linebreak == -1:
+                    linebreak = end - 1
+
+                self._validate_sequences(block[start:linebreak])
+
+            start = linebreak + 1
+
+    def _validate_sequences(self, lines):
+        """Validates a run of one or more non-empty sequence lines, joined by
+        newlines; if any check fails, the lines are re-validated one at a time
+        to report the first invalid line."""
+        linelength = None
+        if self._state == _IN_HEADER:
+            linelength = lines.find("\n")
+            if linelength == -1:
+                linelength = len(lines)
+        elif self._state == _IN_SEQUENCE and not self._linelengthchanged:
+            linelength = self._linelength
+
+        nlinebreaks = lines.count("\n")
+        # All but the last line must have the same length; if so, every
+        # linebreak is found at a fixed interval, and the last line is no
+        # longer than the other lines
+        linebreaks = lines[linelength::linelength + 1] if linelength else ""
+        if linelength is None \
+                or lines.translate(None, _VALID_CHARS_AND_LINEBREAKS) \
+                or len(linebreaks) != nlinebreaks \
+                or linebreaks.count("\n") != nlinebreaks:
+            for line in lines.split("\n"):
+                self._validate_line(line)
+            return
+
+        lastlength = len(lines) - nlinebreaks * (linelength + 1)
+
+        self._linenum += nlinebreaks + 1
+        self._state = _IN_SEQUENCE
+        self._linelength = linelength
+        self._linelengthchanged = lastlength != linelength
+
+    def _validate_line(self, line):
+        """Validates a single line, without the trailing newline."""
+        self._linenum += 1
+        filename, linenum, state = self.filename, self._linenum, self._state
+
+        if not line:
+            if state in (_NA, _IN_WHITESPACE):
+                return
+            elif state == _IN_HEADER:
+                raise NodeError("Expected FASTA sequence, found empty line"
+                                "\n    Filename = %r\n    Line = %r"
+                                % (filename, linenum))
+            elif state == _IN_SEQUENCE:
+                self._state = _IN_WHITESPACE
+            else:
+                assert False
+        elif line.startswith(">"):
+            if state in (_NA, _IN_SEQUENCE, _IN_WHITESPACE):
+                _validate_fasta_header(filename, linenum, line, self.names)
+                self._state = _IN_HEADER
+                self._linelength = None
+                self._linelengthchanged = False
+            elif state == _IN_HEADER:
+                raise NodeError("Empty sequences not allowed\n"
+                                "    Filename = %r\n    Line = %r"
+                                % (filename, linenum - 1))
+            else:
+                assert False
+        else:
+            if state == _NA:
+                raise NodeError("Expected FASTA header, found %r\n"
+                                "    Filename = %r\n    Line = %r"
+                                % (line, filename, linenum))
+            elif state == _IN_HEADER:
+                _validate_fasta_line(filename, linenum, line)
+                self._linelength = len(line)
+                self._state = _IN_SEQUENCE
+            elif state == _IN_SEQUENCE:
+                _validate_fasta_line(filename, linenum, line)
+                # If the length has changed, then that line must be the
+                # last line in the record, which may be shorter due to the
+                # sequence length. This is because the FAI index format
+                # expects that each line has the same length.
+                if self._linelengthchanged or (self._linelength < len(line)):
+                    raise NodeError("Lines in FASTQ files must be of same "
+                                    "length\n    Filename = %r\n"
+                                    "    Line = %r" % (filename, linenum))
+                elif self._linelength != len(line):
+                    self._linelengthchanged = True
+            elif state == _IN_WHITESPACE:
+                raise NodeError("Empty lines not allowed in sequences\n"
+                                "    Filename = %r\n    Line = %r"
+                                % (filename, linenum))
+            else:
+                assert False
+
+
+def _split_fasta_file(filename, nchunks):
+    """Splits a FASTA file into at most 'nchunks' chunks of roughly equal size,
+    starting at sequence headers; returns a list of (start, end) offsets."""
+    size = os.path.getsize(filename)
+
+    offsets = [0]
+    with open(filename) as handle:
+        for index in xrange(1, nchunks):
+            offset = max(offsets[-1], (size * index) // nchunks)
+            offset = _find_fasta_header(handle, offset)
+            if offset is None:
+                break
+            elif offset > offsets[-1]:
+                offsets.append(offset)
+    offsets.append(size)
+
+    return zip(offsets, offsets[1:])
+
+
+def _find_fasta_header(handle, offset):
+    """Returns the offset of the first header starting at or after 'offset',
+    or None if there are no further headers."""
+    offset = max(0, offset - 1)
+    handle.seek(offset)
+
+    previous = ""
+    while True:
+        block = handle.read(io.DEFAULT_BUFFER_SIZE)
+        if not block:
+            return None
+
+        index = (previous + block).find("\n>")
+        if index != -1:
+            return offset + index - len(previous) + 1
+
+        offset += len(block)
+        previous = block[-1]
+
+
+def _check_fasta_chunks(filename, chunks, threads):
+    """Validates chunks of a FASTA file in parallel; returns true if all chunks
+    are valid, and if sequence names are unique across chunks."""
+    tasks = [(filename, start, end) for (start, end) in chunks]
+
+    pool = multiprocessing.Pool(min(threads, len(tasks)))
+    try:
+        results = pool.map(_check_fasta_chunk, tasks)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    if any(names is None for names in results):
+        return False
+
+    names = set()
+    for chunk_names in results:
+        if not names.isdisjoint(chunk_names):
+            return False
+        names.update(chunk_names)
+
+    return True
+
+
+def _check_fasta_chunk(task):
+    """Validates the records in a chunk of a FASTA file; returns the names of
+    the sequences in the chunk, or None if the chunk is invalid."""
+    filename, start, end = task
+
+    validator = _FASTAValidator(filename)
+    try:
+        with open(filename) as handle:
+            handle.seek(start)
+            validator.feed(handle, end - start)
+        validator.finish()
+    except NodeError:
+        return None
+
+    return list(validator.names)
+
 
 # Standard nucleotides + UIPAC codes
 _VALID_CHARS_STR = "ACGTN" "RYSWKMBDHV"
 _VALID_CHARS = frozenset(_VALID_CHARS_STR.upper() + _VALID_CHARS_STR.lower())
+# Characters deleted from runs of sequence lines, leaving only invalid chars
+_VALID_CHARS_AND_LINEBREAKS = "".join(_VALID_CHARS) + "\n"
 _NA, _IN_HEADER, _IN_SEQUENCE, _IN_WHITESPACE = range(4)
 
+# Number of sets of contigs per thread checked by 'check_bam_files'
+_DUPCHECK_TASKS_PER_THREAD = 4
+
+# Number of bytes of FASTQ records read and validated at a time
+_FASTQ_BLOCK_SIZE = 4 * 1024 * 1024
+# Returns the first character of a line (if any)
+_FIRST_CHAR = operator.itemgetter(slice(1))
+
+# Number of bytes of FASTA lines read and validated at a time
+_FASTA_BLOCK_SIZE = 4 * 1024 * 1024
+# Number of chunks of a FASTA file per thread checked by 'check_fasta_file'
+_FASTA_TASKS_PER_THREAD = 4
+
 
 def _validate_fasta_header(filename, linenum, line, cache):
     name = line.split(" ", 1)[0][1:]
@@ -23,16 +23,22 @@
 from __future__ import print_function
 
 import errno
+import heapq
+import itertools
 import logging
 import multiprocessing
 import os
 import pickle
 import Queue
+import select
 import signal
+import sys
 import traceback
 
 import paleomix.ui
 import paleomix.logger
+import paleomix.manifest
+import paleomix.runtimes
 
 from paleomix.node import \
     Node, \
@@ -46,18 +52,24 @@ from paleomix.common.utilities import \
     safe_coerce_to_tuple, \
     fast_pickle_test
 from paleomix.common.versions import \
+    CACHE_FILENAME, \
+    VersionCache, \
     VersionRequirementError
 
 
 class Pypeline(object):
-    def __init__(self, config):
+    def __init__(self, config, executor=None):
+        """Creates a pipeline; 'executor' is the BaseExecutor used to run
+        nodes, by default a LocalExecutor running nodes on the current host.
+        """
         self._nodes = []
         self._config = config
         self._logger = logging.getLogger(__name__)
         # Set if a keyboard-interrupt (SIGINT) has been caught
         self._interrupted = False
-        self._queue = multiprocessing.Queue()
-        self._pool = multiprocessing.Pool(1, _init_worker, (self._queue,))
+        if executor is None:
+            executor = LocalExecutor()
+        self._executor = executor
 
     def add_nodes(self, *nodes):
         for subnodes in safe_coerce_to_tuple(nodes):
@@ -67,13 +79,52 @@ class Pypeline(object):
                                     % repr(node))
                 self._nodes.append(node)
 
-    def run(self, max_threads=1, dry_run=False, progress_ui="verbose"):
+    def run(self, max_threads=1, dry_run=False, progress_ui="verbose",
+            max_memory=0, max_io_jobs=0, use_checksums=False,
+            refresh_version_cache=False):
+        """Runs the pipeline; nodes are started such that the sum of threads,
+        memory (in bytes), and I/O weights of running nodes do not exceed
+        'max_threads', 'max_memory', and 'max_io_jobs', respectively. A value
+        of 0 for the latter two options indicates that there is no limit.
+        A node exceeding any limit is only run if no other node is running.
+
+        If 'use_checksums' is true, nodes are not considered outdated if the
+        timestamps of input files have changed, but the contents have not;
+        this is determined using the manifest of files recorded in the temp
+        root for nodes run with 'use_checksums' enabled.
+
+        The output of calls used to check the versions of required programs is
+        cached in the user's home folder; if 'refresh_version_cache' is true,
+        previously cached outputs are ignored and all calls are repeated.
+        """
         if max_threads < 1:
             raise ValueError("Max threads must be >= 1")
-        _update_nprocesses(self._pool, max_threads)
+        elif max_memory < 0:
+            raise ValueError("Max memory must be >= 0")
+        elif max_io_jobs < 0:
+            raise ValueError("Max I/O jobs must be >= 0")
+        self._executor.set_max_threads(max_threads)
+
+        runtimes = paleomix.runtimes.RuntimeHistory(
+            os.path.join(self._config.temp_root, paleomix.runtimes.FILENAME))
+
+        manifest = None
+        cache_factory = FileStatusCache
+        if use_checksums:
+            manifest = paleomix.manifest.FileManifest(
+                os.path.join(self._config.temp_root,
+                             paleomix.manifest.FILENAME))
+            cache_factory = lambda: FileStatusCache(manifest)
+
+        version_cache = VersionCache(
+            os.path.join(os.path.expanduser("~"), CACHE_FILENAME),
+            refresh=refresh_version_cache)
 
         try:
-            nodegraph = NodeGraph(self._nodes)
+            nodegraph = NodeGraph(self._nodes,
+                                  cache_factory=cache_factory,
+                                  runtimes=runtimes,
+                                  version_cache=version_cache)
         except NodeGraphError, error:
             self._logger.error(error)
             return False
@@ -86,6 +137,14 @@ class Pypeline(object):
                 paleomix.ui.print_warn(message)
                 break
 
+        for node in nodegraph.iterflat():
+            if max_memory and node.memory > max_memory:
+                message = "Node(s) use more memory than the max allowed; " \
+                          "these will only be run once no other nodes are " \
+                          "running.\n"
+                paleomix.ui.print_warn(message)
+                break
+
         if dry_run:
             progress_printer = paleomix.ui.RunningUI()
             nodegraph.add_state_observer(progress_printer)
@@ -94,128 +153,135 @@ class Pypeline(object):
             self._logger.info("Dry run done ...")
             return True
 
+        # Runtimes of nodes are recorded as they finish running
+        nodegraph.add_state_observer(runtimes)
+        if manifest is not None:
+            nodegraph.add_state_observer(manifest)
+
         old_handler = signal.signal(signal.SIGINT, self._sigint_handler)
         try:
-            return self._run(nodegraph, max_threads, progress_ui)
+            return self._run(nodegraph, max_threads, progress_ui,
+                             max_memory, max_io_jobs)
         finally:
             signal.signal(signal.SIGINT, old_handler)
+            if manifest is not None:
+                manifest.close()
 
         return False
 
-    def _run(self, nodegraph, max_threads, progress_ui):
-        # Dictionary of nodes -> async-results
+    def _run(self, nodegraph, max_threads, progress_ui, max_memory,
+             max_io_jobs):
+        # Dictionary of keys -> running nodes
         running = {}
-        # Set of remaining nodes to be run
-        remaining = set(nodegraph.iterflat())
+        # Set of nodes that are ready to be run; updated by the nodegraph
+        runable = _RunableNodes()
+        nodegraph.add_state_observer(runable)
 
         is_ok = True
         progress_printer = paleomix.ui.get_ui(progress_ui)
-        progress_printer.max_threads = max_threads
+        progress_printer.max_threads \
+            = self._executor.get_max_threads(max_threads)
         nodegraph.add_state_observer(progress_printer)
 
         with paleomix.ui.CommandLine() as cli:
-            while running or (remaining and not self._interrupted):
-                is_ok &= self._poll_running_nodes(running,
-                                                  nodegraph,
-                                                  self._queue)
-
+            while running or (runable and not self._interrupted):
                 if not self._interrupted:  # Prevent starting of new nodes
-                    self._start_new_tasks(remaining, running, nodegraph,
-                                          max_threads, self._pool)
+                    self._start_new_tasks(runable, running, nodegraph,
+                                          max_threads, max_memory,
+                                          max_io_jobs)
 
-                if running:
+                # Nodes may remain runable if the executor lacks capacity
+                if running or runable:
                     progress_printer.flush()
+                    self._wait_for_events(self._executor, cli)
+
+                is_ok &= self._poll_running_nodes(running, nodegraph)
 
                 max_threads = cli.process_key_presses(nodegraph,
                                                       max_threads,
                                                       progress_printer)
-                progress_printer.max_threads = max_threads
-                _update_nprocesses(self._pool, max_threads)
+                self._executor.set_max_threads(max_threads)
+                progress_printer.max_threads \
+                    = self._executor.get_max_threads(max_threads)
 
-        self._pool.close()
-        self._pool.join()
+        self._executor.close()
 
         progress_printer.flush()
         progress_printer.finalize()
 
         return is_ok
 
-    def _start_new_tasks(self, remaining, running, nodegraph, max_threads,
-                         pool):
-        started_nodes = []
-        idle_processes = max_threads \
-            - sum(node.threads for (node, _) in running.itervalues())
-
-        if not idle_processes:
-            return False
-
-        for node in remaining:
-            if not running or (idle_processes >= node.threads):
-                state = nodegraph.get_node_state(node)
-                if state == nodegraph.RUNABLE:
-                    try:
-                        # The multi-processing module relies on pickling
-                        fast_pickle_test(node)
-                    except pickle.PicklingError, error:
-                        self._logger.error("Node cannot be pickled; please "
-                                           "file a bug-report:\n"
-                                           "\tNode: %s\n\tError: %s"
-                                           % (self, error))
-                        nodegraph.set_node_state(node, nodegraph.ERROR)
-                        started_nodes.append(node)
-                        continue
-
-                    key = id(node)
-                    proc_args = (key, node, self._config)
-                    running[key] = (node, pool.apply_async(_call_run,
-                                                           args=proc_args))
-                    started_nodes.append(node)
-
-                    nodegraph.set_node_state(node, nodegraph.RUNNING)
-                    idle_processes -= node.threads
-                elif state in (nodegraph.DONE, nodegraph.ERROR):
-                    started_nodes.append(node)
-            elif idle_processes <= 0:
+    def _start_new_tasks(self, runable, running, nodegraph, max_threads,
+                         max_memory, max_io_jobs):
+        idle_processes = self._executor.get_max_threads(max_threads)
+        idle_memory = max_memory
+        idle_io_jobs = max_io_jobs
+        for node in running.itervalues():
+            idle_processes -= node.threads
+            idle_memory -= node.memory
+            idle_io_jobs -= node.io_weight
+
+        def _fits(threads, memory, io_weight):
+            # A node is always started if no other nodes are running
+            return not running \
+                or ((threads <= idle_processes)
+                    and (not max_memory or memory <= idle_memory)
+                    and (not max_io_jobs or io_weight <= idle_io_jobs))
+
+        # Nodes that could not be started by the executor
+        deferred_nodes = []
+        while idle_processes > 0:
+            node = runable.pop(_fits)
+            if node is None:
                 break
 
-        for node in started_nodes:
-            remaining.remove(node)
+            try:
+                # The multi-processing module relies on pickling
+                fast_pickle_test(node)
+            except pickle.PicklingError, error:
+                self._logger.error("Node cannot be pickled; please "
+                                   "file a bug-report:\n"
+                                   "\tNode: %s\n\tError: %s"
+                                   % (self, error))
+                nodegraph.set_node_state(node, nodegraph.ERROR)
+                continue
+
+            key = id(node)
+            if not self._executor.start(key, node, self._config):
+                deferred_nodes.append(node)
+                continue
 
-    def _poll_running_nodes(self, running, nodegraph, queue):
-        errors = None
-        blocking = False
+            running[key] = node
+            nodegraph.set_node_state(node, nodegraph.RUNNING)
+            idle_processes -= node.threads
+            idle_memory -= node.memory
+            idle_io_jobs -= node.io_weight
 
-        while running and not errors:
-            node, proc = self._get_finished_node(queue, running, blocking)
-            if not node:
-                if blocking:
-                    break
+        for node in deferred_nodes:
+            runable.add(node)
 
-                blocking = True
+    def _poll_running_nodes(self, running, nodegraph):
+        is_ok = True
+        for (key, error) in self._executor.poll():
+            node = running.pop(key)
+            if error is None:
+                nodegraph.set_node_state(node, nodegraph.DONE)
                 continue
 
-            try:
-                # Re-raise exceptions from the node-process
-                proc.get()
-            except (KeyboardInterrupt, SystemExit):
-                raise
-            except Exception, errors:
-                nodegraph.set_node_state(node, nodegraph.ERROR)
+            is_ok = False
+            nodegraph.set_node_state(node, nodegraph.ERROR)
 
-                message = [str(node),
-                           "  Error (%r) occurred running command:"
-                           % (type(errors).__name__)]
+            message = [str(node),
+                       "  Error (%r) occurred running command:"
+                       % (type(error).__name__)]
 
-                for line in str(errors).strip().split("\n"):
-                    message.append("    %s" % (line,))
-                message.append("")
+            for line in str(error).strip().split("\n"):
+                message.append("    %s" % (line,))
+            message.append("")
 
-                self._logger.error("\n".join(message))
-
-            if not errors:
-                nodegraph.set_node_state(node, nodegraph.DONE)
+            self._logger.error("\n".join(message))
 
-        return not errors
+        return is_ok
 
     @property
     def nodes(self):
@@ -356,7 +422,7 @@ class Pypeline(object):
                                "running tasks to complete ... Press CTRL-C "
                                "again to force termination.\n")
         else:
-            self._pool.terminate()
+            self._executor.terminate()
             raise signal.default_int_handler(signum, frame)
 
     def to_dot(self, destination):
@@ -429,24 +495,199 @@ class Pypeline(object):
         return True
 
     @classmethod
-    def _get_finished_node(cls, queue, running, blocking):
-        """Returns a tuple containing a node that has finished running
-        and it's async-result, or None for both if no such node could
-        be found (and blocking is False), or if an interrupt occured
-        while waiting for a node to finish.
-
-        If blocking is True, the function will timeout after 0.1s.
+    def _wait_for_events(cls, executor, cli):
+        """Blocks until an event occurs in the executor (e.g. a node finishing
+        running), until the user presses a key (if the CLI is interactive),
+        until a signal (e.g. SIGINT) is caught, or until the timeout of the
+        executor (if any) expires.
         """
+        handles = list(executor.handles)
+        if cli.is_interactive:
+            handles.append(sys.stdin)
+
         try:
-            key = queue.get(blocking, 0.1)
-            return running.pop(key)
-        except IOError, error:
+            select.select(handles, [], [], executor.timeout)
+        except select.error, error:
             # User pressed ctrl-c (SIGINT), or similar event ...
-            if error.errno != errno.EINTR:
+            if error.args[0] != errno.EINTR:
                 raise
-        except Queue.Empty:
-            pass
-        return None, None
+
+
+class BaseExecutor(object):
+    """Interface for executors, responsible for running nodes on behalf of a
+    Pypeline. Nodes are started using 'start', after which the pipeline waits
+    for any of the 'handles' to become readable (or for 'timeout' seconds),
+    and then calls 'poll' to collect nodes that have finished running.
+    """
+
+    # Max number of seconds to wait for events; None if no timeout is needed
+    timeout = None
+
+    @property
+    def handles(self):
+        """Returns a list of objects that may be passed to select.select, and
+        which become readable when 'poll' should be called."""
+        raise NotImplementedError()
+
+    def get_max_threads(self, max_threads):
+        """Returns the total number of threads available for running nodes,
+        given the max number of threads specified by the user."""
+        return max_threads
+
+    def set_max_threads(self, max_threads):
+        """Called when the max number of threads specified by the user has
+        changed (e.g. due to the user pressing '+' or '-')."""
+
+    def start(self, key, node, config):
+        """Starts running a node, identified by 'key'; returns false if the
+        node could not be started due to a lack of resources."""
+        raise NotImplementedError()
+
+    def poll(self):
+        """Returns a list of (key, error) tuples for nodes that have finished
+        running; 'error' is None if the node ran successfully, and otherwise
+        an exception describing the failure."""
+        raise NotImplementedError()
+
+    def close(self):
+        """Called once the pipeline has finished running."""
+
+    def terminate(self):
+        """Called to abort running nodes, e.g. if the user presses CTRL-C."""
+
+
+class LocalExecutor(BaseExecutor):
+    """Runs nodes on the current host, using a pool of processes."""
+
+    def __init__(self):
+        self._running = {}
+        self._queue = multiprocessing.Queue()
+        self._pool = multiprocessing.Pool(1, _init_worker, (self._queue,))
+
+    @property
+    def handles(self):
+        # multiprocessing.Queue does not expose a selectable handle
+        return [self._queue._reader]
+
+    def set_max_threads(self, max_threads):
+        _update_nprocesses(self._pool, max_threads)
+
+    def start(self, key, node, config):
+        self._running[key] = self._pool.apply_async(_call_run,
+                                                    args=(key, node, config))
+        return True
+
+    def poll(self):
+        finished = []
+        for key in self._get_finished_keys():
+            try:
+                # Re-raise exceptions from the node-process
+                self._running.pop(key).get()
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except Exception, error:
+                finished.append((key, error))
+            else:
+                finished.append((key, None))
+
+        return finished
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def terminate(self):
+        self._pool.terminate()
+
+    def _get_finished_keys(self):
+        """Returns the keys of nodes that have finished running (i.e. the keys
+        written to the queue by '_call_run'), stopping early if an interrupt
+        occurs while reading the queue."""
+        keys = []
+        while True:
+            try:
+                keys.append(self._queue.get(False))
+            except IOError, error:
+                # User pressed ctrl-c (SIGINT), or similar event ...
+                if error.errno != errno.EINTR:
+                    raise
+                break
+            except Queue.Empty:
+                break
+
+        return keys
+
+
+class _RunableNodes(object):
+    """Priority queue of nodes in the RUNABLE state, ordered by the priorities
+    assigned by the NodeGraph (see NodeGraph.get_node_priority). The queue is
+    kept up to date by registering it as an observer of a NodeGraph (see
+    NodeGraph.add_state_observer). This allows the scheduler to only consider
+    nodes that have become runable, rather than re-examining every remaining
+    node whenever a node finishes.
+
+    Nodes are kept in a separate heap for each combination of resources
+    (threads, memory, and I/O weight), so that nodes requiring more resources
+    than are currently idle can be skipped by examining only these heads.
+    """
+
+    def __init__(self):
+        self._nodegraph = None
+        self._nodes = set()
+        # (threads, memory, io_weight) -> heap of (priority, counter, node)
+        self._heaps = {}
+        self._counter = itertools.count()
+
+    def add(self, node):
+        if node not in self._nodes:
+            self._nodes.add(node)
+
+            priority = self._nodegraph.get_node_priority(node)
+            priority = tuple(-value for value in priority)
+            key = (node.threads, node.memory, node.io_weight)
+            heapq.heappush(self._heaps.setdefault(key, []),
+                           (priority, self._counter.next(), node))
+
+    def pop(self, fits=None):
+        """Returns and removes the runable node with the highest priority, for
+        which 'fits(threads, memory, io_weight)' is true, if specified; returns
+        None if there are no such nodes."""
+        best_heap = None
+        for (key, heap) in self._heaps.items():
+            # Entries are removed lazily, and may no longer be runable
+            while heap and heap[0][-1] not in self._nodes:
+                heapq.heappop(heap)
+
+            if not heap:
+                self._heaps.pop(key)
+            elif (fits is None or fits(*key)) \
+                    and (best_heap is None or heap[0] < best_heap[0]):
+                best_heap = heap
+
+        if best_heap is None:
+            return None
+
+        _, _, node = heapq.heappop(best_heap)
+        self._nodes.remove(node)
+        return node
+
+    def refresh(self, nodegraph):
+        self._nodegraph = nodegraph
+        self._nodes.clear()
+        self._heaps.clear()
+
+        for node in nodegraph.iterflat():
+            if nodegraph.get_node_state(node) == nodegraph.RUNABLE:
+                self.add(node)
+
+    def state_changed(self, node, old_state, new_state, _is_primary):
+        if new_state == NodeGraph.RUNABLE:
+            self.add(node)
+        elif old_state == NodeGraph.RUNABLE:
+            self._nodes.discard(node)
+
+    def __len__(self):
+        return len(self._nodes)
 
 
 def _init_worker(queue):
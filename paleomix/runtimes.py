@@ -0,0 +1,194 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Persistent record of the runtimes of nodes.
+
+Runtimes are recorded per node class, together with the total size of the
+input files of each node, and used to estimate the runtime of nodes in later
+runs. Records are stored as JSON objects, one per line, and are only ever
+appended to the file, with the exception of occasional compaction of the file
+when it is read.
+"""
+import collections
+import errno
+import json
+import logging
+import os
+import time
+
+import paleomix.nodegraph
+
+
+# Filename used to store runtimes in the temp root
+FILENAME = "runtimes.jsonl"
+
+# Number of records kept per type of node
+_MAX_RECORDS = 100
+
+
+class RuntimeHistory(object):
+    """Records the runtimes of nodes, and estimates runtimes of nodes based
+    on the recorded runtimes of nodes of the same type (class). The object
+    may be added as a state observer to a NodeGraph, in order to record the
+    runtimes of nodes as they finish running.
+    """
+
+    def __init__(self, filename=None):
+        """If a filename is specified, previously recorded runtimes are read
+        from that file, and newly recorded runtimes are appended to it."""
+        self._filename = filename
+        self._logger = logging.getLogger(__name__)
+        self._records = collections.defaultdict(collections.deque)
+        self._average = None
+        self._started = {}
+
+        if filename is not None:
+            self._read_records(filename)
+
+    def add(self, node, size, runtime):
+        """Records the runtime (in seconds) of a node, for which the total size
+        of input files was 'size' bytes (None if unknown)."""
+        key = _get_node_key(node)
+        self._add_record(key, size, runtime)
+
+        if self._filename is not None:
+            record = {"node": key, "size": size, "runtime": runtime}
+            try:
+                with open(self._filename, "a") as handle:
+                    handle.write(json.dumps(record) + "\n")
+            except (IOError, OSError), error:
+                self._logger.warn("Could not record runtime in %r; runtimes "
+                                  "will not be recorded: %s"
+                                  % (self._filename, error))
+                self._filename = None
+
+    def estimate(self, node, size=None):
+        """Returns the estimated runtime (in seconds) of a node, given the
+        total size of its input files (None if unknown). If no runtimes have
+        been recorded for nodes of the same type, the average runtime of all
+        nodes is returned, or None if no runtimes have been recorded at all.
+        """
+        records = self._records.get(_get_node_key(node))
+        if not records:
+            return self._average_runtime()
+
+        if size:
+            total_size = total_runtime = 0
+            for (record_size, record_runtime) in records:
+                if record_size:
+                    total_size += record_size
+                    total_runtime += record_runtime
+
+            if total_size:
+                return size * (total_runtime / float(total_size))
+
+        return sum(runtime for (_, runtime) in records) / float(len(records))
+
+    def refresh(self, nodegraph):
+        """See NodeGraph.add_state_observer."""
+        self._started = {}
+        for node in nodegraph.iterflat():
+            if nodegraph.get_node_state(node) == nodegraph.RUNNING:
+                self._started[node] = time.time()
+
+    def state_changed(self, node, old_state, new_state, is_primary):
+        """See NodeGraph.add_state_observer; records the runtime of nodes that
+        have finished running."""
+        if not is_primary:
+            return
+        elif new_state == paleomix.nodegraph.NodeGraph.RUNNING:
+            self._started[node] = time.time()
+        elif old_state == paleomix.nodegraph.NodeGraph.RUNNING:
+            start_time = self._started.pop(node, None)
+            if start_time is not None \
+                    and new_state == paleomix.nodegraph.NodeGraph.DONE:
+                cache = paleomix.nodegraph.FileStatusCache()
+                size = cache.file_sizes(node.input_files)
+
+                self.add(node, size, time.time() - start_time)
+
+    def _add_record(self, key, size, runtime):
+        records = self._records[key]
+        records.append((size, runtime))
+        if len(records) > _MAX_RECORDS:
+            records.popleft()
+        self._average = None
+
+    def _average_runtime(self):
+        if self._average is None:
+            total_runtime = total_records = 0
+            for records in self._records.itervalues():
+                total_runtime += sum(runtime for (_, runtime) in records)
+                total_records += len(records)
+
+            if total_records:
+                self._average = total_runtime / float(total_records)
+
+        return self._average
+
+    def _read_records(self, filename):
+        """Reads records from a file; lines that cannot be parsed (e.g. due to
+        the pipeline being killed while writing) are ignored. If the file
+        contains a large number of outdated records, these are removed.
+        """
+        nrecords = 0
+        try:
+            with open(filename) as handle:
+                for line in handle:
+                    try:
+                        record = json.loads(line)
+                        self._add_record(key=record["node"],
+                                         size=record["size"],
+                                         runtime=float(record["runtime"]))
+                        nrecords += 1
+                    except (ValueError, TypeError, KeyError):
+                        pass
+        except IOError, error:
+            if error.errno != errno.ENOENT:
+                raise
+            return
+
+        nkept = sum(len(records) for records in self._records.itervalues())
+        if nrecords > 2 * nkept:
+            self._write_records(filename)
+
+    def _write_records(self, filename):
+        """Atomically replaces the file with the currently kept records."""
+        temp_filename = "%s.%i" % (filename, os.getpid())
+        try:
+            with open(temp_filename, "w") as handle:
+                for (key, records) in sorted(self._records.iteritems()):
+                    for (size, runtime) in records:
+                        record = {"node": key,
+                                  "size": size,
+                                  "runtime": runtime}
+                        handle.write(json.dumps(record) + "\n")
+            os.rename(temp_filename, filename)
+        except (IOError, OSError), error:
+            self._logger.warn("Could not compact runtimes in %r: %s"
+                              % (filename, error))
+
+
+def _get_node_key(node):
+    """Returns the key used to record runtimes for a node."""
+    cls = node.__class__
+    return "%s.%s" % (cls.__module__, cls.__name__)
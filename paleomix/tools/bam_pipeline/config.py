@@ -23,12 +23,15 @@
 import optparse
 
 import paleomix
+import paleomix.batch
 import paleomix.ui
 
 from paleomix.config import \
      ConfigError, \
      PerHostValue, \
      PerHostConfig
+from paleomix.common.text import \
+     parse_size
 
 
 def _run_config_parser(argv, pipeline_variant):
@@ -51,14 +54,61 @@ def _run_config_parser(argv, pipeline_variant):
                           "executed.")
     group.add_option("--max-threads", type=int, default=per_host_cfg.max_threads,
                      help="Maximum number of threads to use in total [%default]")
+    group.add_option("--max-memory", default=PerHostValue("0"),
+                     help="Maximum amount of memory used by simultaneously "
+                          "running tasks, e.g. '64g'; memory usage is "
+                          "currently only known for Java programs (see "
+                          "--jre-option). Set to 0 to disable [%default]")
+    group.add_option("--max-io-jobs", type=int, default=PerHostValue(0),
+                     help="Maximum number of simultaneously running I/O "
+                          "intensive tasks, e.g. the calculation of coverage "
+                          "or depth histograms. Set to 0 to disable "
+                          "[%default]")
+    group.add_option("--worker-port", type=int, default=PerHostValue(0),
+                     help="If set, tasks are not run on the current host, "
+                          "but by workers (see 'paleomix worker') connecting "
+                          "to the pipeline on the specified port; the number "
+                          "of threads used is determined by the workers. Set "
+                          "to 0 to disable [%default]")
+    group.add_option("--batch-system", default=PerHostValue(""),
+                     help="If set, tasks are submitted as jobs to the "
+                          "specified batch system (one of %s); task files "
+                          "are written to the --temp-root, which must be "
+                          "accessible from all hosts [%%default]"
+                          % (", ".join(sorted(paleomix.batch.BATCH_SYSTEMS))))
+    group.add_option("--batch-submit", default=PerHostValue(""),
+                     help="Command used to submit jobs to the batch system, "
+                          "replacing the default command; see "
+                          "paleomix/batch.py for supported fields [%default]")
+    group.add_option("--use-checksums", action="store_true", default=False,
+                     help="Do not re-run tasks if the timestamps of input "
+                          "files have changed, but the contents have not, as "
+                          "determined using checksums recorded for tasks run "
+                          "with this option enabled; checksums of all input "
+                          "files are calculated, which may be slow for large "
+                          "files [%default]")
     group.add_option("--adapterremoval-max-threads", type=int, default=PerHostValue(1),
                      help="Maximum number of threads to use per AdapterRemoval instance [%default]")
+    group.add_option("--fastq-validation-max-threads", type=int, default=PerHostValue(1),
+                     help="Maximum number of threads to use when validating pre-trimmed "
+                          "FASTQ files; files are validated in parallel [%default]")
+    group.add_option("--fasta-validation-max-threads", type=int, default=PerHostValue(1),
+                     help="Maximum number of threads to use when validating reference "
+                          "FASTA files; sequences are validated in parallel [%default]")
     group.add_option("--bowtie2-max-threads", type=int, default=PerHostValue(1),
                      help="Maximum number of threads to use per Bowtie2 instance [%default]")
     group.add_option("--bwa-max-threads", type=int, default=PerHostValue(1),
                      help="Maximum number of threads to use per BWA instance [%default]")
     group.add_option("--gatk-max-threads", type=int, default=PerHostValue(1),
                      help="Maximum number of threads to use per GATK instance [%default]")
+    group.add_option("--bam-stats-max-threads", type=int, default=PerHostValue(1),
+                     help="Maximum number of threads to use when calculating coverage / "
+                          "depth statistics for regions of interest [%default]")
+    group.add_option("--bam-merge-tool", default=PerHostValue("paleomix"),
+                     help="Tool used to merge BAM files for tasks taking "
+                          "multiple BAMs as input; either 'paleomix' (see "
+                          "'paleomix merge') or 'picard' (MergeSamFiles) "
+                          "[%default]")
     parser.add_option_group(group)
 
     group = optparse.OptionGroup(parser, "Required paths")
@@ -85,6 +135,12 @@ def _run_config_parser(argv, pipeline_variant):
     group.add_option("--list-executables", action="store_true", default=False,
                      help="List all executables required by the pipeline, "
                           "with version requirements (if any).")
+    group.add_option("--refresh-version-cache", action="store_true",
+                     default=False,
+                     help="Re-run all version checks for required "
+                          "executables, rather than using the outputs "
+                          "cached in ~/.paleomix/versions.json for "
+                          "executables that have not changed.")
     parser.add_option_group(group)
 
     group = optparse.OptionGroup(parser, "Misc")
@@ -103,4 +159,21 @@ def parse_config(argv, pipeline_variant):
     config, args = _run_config_parser(argv, pipeline_variant)
     paleomix.ui.set_ui_colors(config.ui_colors)
 
+    try:
+        config.max_memory = parse_size(config.max_memory)
+    except ValueError, error:
+        raise ConfigError("Invalid value for --max-memory: %s" % (error,))
+
+    if config.batch_system \
+            and config.batch_system not in paleomix.batch.BATCH_SYSTEMS:
+        raise ConfigError("Unknown --batch-system %r; must be one of %s"
+                          % (config.batch_system,
+                             ", ".join(sorted(paleomix.batch.BATCH_SYSTEMS))))
+    elif config.worker_port and config.batch_system:
+        raise ConfigError("--worker-port and --batch-system cannot be used "
+                          "at the same time")
+    elif config.bam_merge_tool not in ("paleomix", "picard"):
+        raise ConfigError("Unknown --bam-merge-tool %r; must be one of "
+                          "paleomix, picard" % (config.bam_merge_tool,))
+
     return config, args
@@ -46,7 +46,7 @@ class Reads(object):
         if lane_type == "Raw":
             self._init_raw_reads(config, record)
         elif lane_type == "Trimmed":
-            self._init_pretrimmed_reads(record)
+            self._init_pretrimmed_reads(config, record)
         else:
             assert False, "Unexpected data type in Reads(): %s" \
                 % (repr(lane_type))
@@ -55,12 +55,13 @@ class Reads(object):
             if value:
                 self.files.pop(name, None)
 
-    def _init_pretrimmed_reads(self, record):
+    def _init_pretrimmed_reads(self, config, record):
         self.files.update(record["Data"])
         output_file = os.path.join(self.folder, "reads.statistics")
         node = ValidateFASTQFilesNode(input_files=self.files,
                                       output_file=output_file,
-                                      offset=self.quality_offset)
+                                      offset=self.quality_offset,
+                                      threads=config.fastq_validation_max_threads)
         self.nodes = (node,)
         self.validation = output_file
 
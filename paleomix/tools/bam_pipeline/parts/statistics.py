@@ -27,9 +27,9 @@ from paleomix.common.fileutils import \
     swap_ext
 
 from paleomix.nodes.commands import \
+    BAMStatisticsNode, \
     CoverageNode, \
-    MergeCoverageNode, \
-    DepthHistogramNode
+    MergeCoverageNode
 from paleomix.tools.bam_pipeline.parts.summary import \
     SummaryTableNode
 
@@ -37,13 +37,21 @@ from paleomix.tools.bam_pipeline.parts.summary import \
 def add_statistics_nodes(config, makefile, target):
     features = makefile["Options"]["Features"]
 
+    # Without a summary, per-library coverage tables are only used to build
+    # the per-prefix tables; these are instead calculated together with the
+    # depth histograms, since both are calculated from the same BAMs.
+    combine = features["Depths"] and features["Coverage"] \
+        and not features["Summary"]
+
     nodes = []
     if features["Depths"]:
-        nodes.extend(_build_depth(config, target, makefile["Prefixes"]))
+        nodes.extend(_build_depth(config, target, makefile["Prefixes"],
+                                  with_coverage=combine))
 
     if features["Summary"] or features["Coverage"]:
         make_summary = features["Summary"]
-        coverage = _build_coverage(config, target, make_summary)
+        coverage = _build_coverage(config, target, make_summary,
+                                   include_genome=not combine)
         if make_summary:
             summary_node = _build_summary_node(config, makefile,
                                                target, coverage)
@@ -55,7 +63,7 @@ def add_statistics_nodes(config, makefile, target):
 
 
 def _build_summary_node(config, makefile, target, coverage):
-    coverage_by_label = _build_coverage_nodes(target, use_label=True)
+    coverage_by_label = _build_coverage_nodes(config, target, use_label=True)
 
     return SummaryTableNode(config=config,
                             makefile=makefile,
@@ -65,7 +73,7 @@ def _build_summary_node(config, makefile, target, coverage):
                             dependencies=coverage["Nodes"])
 
 
-def _build_depth(config, target, prefixes):
+def _build_depth(config, target, prefixes, with_coverage=False):
     nodes = []
     for prefix in target.prefixes:
         for (roi_name, roi_filename) in _get_roi(prefix, name_prefix="."):
@@ -86,13 +94,26 @@ def _build_depth(config, target, prefixes):
                                                   roi_name)
             output_fpath = os.path.join(config.destination, output_filename)
 
-            node = DepthHistogramNode(config=config,
-                                      target_name=target.name,
-                                      input_files=input_files,
-                                      prefix=prefixes[prefix.name],
-                                      regions_file=roi_filename,
-                                      output_file=output_fpath,
-                                      dependencies=dependencies)
+            coverage_fpath = None
+            if with_coverage and roi_filename is None:
+                coverage_fpath = os.path.join(config.destination,
+                                              "%s.%s.coverage"
+                                              % (target.name, prefix.name))
+
+            # Only ROIs are guaranteed to be processed using an indexed BAM
+            threads = 1
+            if roi_filename is not None:
+                threads = config.bam_stats_max_threads
+
+            node = BAMStatisticsNode(config=config,
+                                     target_name=target.name,
+                                     input_files=input_files,
+                                     prefix=prefixes[prefix.name],
+                                     regions_file=roi_filename,
+                                     depths=output_fpath,
+                                     coverage=coverage_fpath,
+                                     threads=threads,
+                                     dependencies=dependencies)
             nodes.append(node)
 
     return nodes
@@ -107,11 +128,12 @@ def _aggregate_for_prefix(cov, prefix, roi_name=None, into=None):
     return results
 
 
-def _build_coverage(config, target, make_summary):
+def _build_coverage(config, target, make_summary, include_genome=True):
     merged_nodes = []
-    coverage = _build_coverage_nodes(target)
+    coverage = _build_coverage_nodes(config, target,
+                                     include_genome=include_genome)
     for prefix in target.prefixes:
-        for (roi_name, _) in _get_roi(prefix):
+        for (roi_name, _) in _get_roi(prefix, include_genome=include_genome):
             label = _get_prefix_label(prefix.name, roi_name)
             if not roi_name:
                 postfix = prefix.name
@@ -143,13 +165,15 @@ def _build_coverage(config, target, make_summary):
     return coverage
 
 
-def _build_coverage_nodes(target, use_label=False):
+def _build_coverage_nodes(config, target, use_label=False,
+                          include_genome=True):
     coverage = {"Lanes": collections.defaultdict(dict),
                 "Libraries": collections.defaultdict(dict)}
 
     cache = {}
     for prefix in target.prefixes:
-        for (roi_name, roi_filename) in _get_roi(prefix):
+        for (roi_name, roi_filename) in _get_roi(prefix,
+                                                 include_genome=include_genome):
             prefix_label = prefix.label if use_label else prefix.name
             prefix_label = _get_prefix_label(prefix_label, roi_name)
 
@@ -160,7 +184,7 @@ def _build_coverage_nodes(target, use_label=False):
 
                     for lane in library.lanes:
                         for bams in lane.bams.values():
-                            bams = _build_coverage_nodes_cached(bams,
+                            bams = _build_coverage_nodes_cached(config, bams,
                                                                 target.name,
                                                                 roi_name,
                                                                 roi_filename,
@@ -168,18 +192,21 @@ def _build_coverage_nodes(target, use_label=False):
 
                             coverage["Lanes"][key].update(bams)
 
-                    bams = _build_coverage_nodes_cached(library.bams,
+                    bams = _build_coverage_nodes_cached(config, library.bams,
                                                         target.name, roi_name,
                                                         roi_filename, cache)
                     coverage["Libraries"][key].update(bams)
     return coverage
 
 
-def _build_coverage_nodes_cached(files_and_nodes, target_name,
+def _build_coverage_nodes_cached(config, files_and_nodes, target_name,
                                  roi_name, roi_filename, cache):
     output_ext = ".coverage"
+    threads = 1
     if roi_name:
         output_ext = ".%s.coverage" % roi_name
+        # ROIs require indexed BAMs, which may be processed in parallel
+        threads = config.bam_stats_max_threads
 
     coverages = {}
     for (input_filename, node) in files_and_nodes.iteritems():
@@ -191,14 +218,15 @@ def _build_coverage_nodes_cached(files_and_nodes, target_name,
                                             output_file=output_filename,
                                             target_name=target_name,
                                             regions_file=roi_filename,
+                                            threads=threads,
                                             dependencies=node)
 
         coverages[output_filename] = cache[cache_key]
     return coverages
 
 
-def _get_roi(prefix, name_prefix=""):
-    roi = [("", None)]
+def _get_roi(prefix, name_prefix="", include_genome=True):
+    roi = [("", None)] if include_genome else []
     for (name, path) in prefix.roi.iteritems():
         roi.append((name_prefix + name, path))
     return roi
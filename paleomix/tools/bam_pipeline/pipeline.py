@@ -25,9 +25,10 @@ import time
 import logging
 
 import paleomix
+import paleomix.batch
 import paleomix.logger
 import paleomix.resources
-import paleomix.yaml
+import paleomix.workers
 
 from paleomix.common.console import \
     print_err, \
@@ -146,9 +147,10 @@ def index_references(config, makefiles):
                 # Validation of the FASTA file; not blocking for the other
                 # steps, as it is only expected to fail very rarely, but will
                 # block subsequent analyses depending on the FASTA.
-                valid_node = ValidateFASTAFilesNode(input_files=reference,
-                                                    output_file=reference +
-                                                    ".validated")
+                valid_node = ValidateFASTAFilesNode(
+                    input_files=reference,
+                    output_file=reference + ".validated",
+                    threads=config.fasta_validation_max_threads)
                 # Indexing of FASTA file using 'samtools faidx'
                 faidx_node = FastaIndexNode(reference)
                 # Indexing of FASTA file using 'BuildSequenceDictionary.jar'
@@ -191,13 +193,29 @@ def run(config, args, pipeline_variant):
                   % (config.temp_root,))
         return 1
 
+    executor = None
+    if config.worker_port:
+        try:
+            executor = paleomix.workers.WorkerExecutor(("", config.worker_port))
+        except EnvironmentError, error:
+            print_err("ERROR: Could not listen for workers on port %i: %s"
+                      % (config.worker_port, error))
+            return 1
+    elif config.batch_system:
+        submitter = paleomix.batch.CommandSubmitter.from_system(
+            config.batch_system, config.batch_submit or None)
+        executor = paleomix.batch.BatchExecutor(
+            submitter, os.path.join(config.temp_root, "batch"))
+
     # Init worker-threads before reading in any more data
-    pipeline = Pypeline(config)
+    pipeline = Pypeline(config, executor=executor)
+
+    import paleomix.yaml as paleo_yaml
 
     try:
         print_info("Reading makefiles ...")
         makefiles = read_makefiles(config, args, pipeline_variant)
-    except (MakefileError, paleomix.yaml.YAMLError, IOError), error:
+    except (MakefileError, paleo_yaml.YAMLError, IOError), error:
         print_err("Error reading makefiles:",
                   "\n  %s:\n   " % (error.__class__.__name__,),
                   "\n    ".join(str(error).split("\n")))
@@ -257,6 +275,10 @@ def run(config, args, pipeline_variant):
     logger.info("Running BAM pipeline ...")
     if not pipeline.run(dry_run=config.dry_run,
                         max_threads=config.max_threads,
+                        max_memory=config.max_memory,
+                        max_io_jobs=config.max_io_jobs,
+                        use_checksums=config.use_checksums,
+                        refresh_version_cache=config.refresh_version_cache,
                         progress_ui=config.progress_ui):
         return 1
 
@@ -21,10 +21,11 @@
 # SOFTWARE.
 #
 import os
+import sys
+import random
 import argparse
 import collections
-
-import pysam
+import multiprocessing
 
 from paleomix.ui import \
     print_err, \
@@ -33,7 +34,15 @@ from paleomix.ui import \
 
 from paleomix.common.fileutils import \
     swap_ext
+from paleomix.common.timer import \
+    BAMTimer
+from paleomix.common.bamfiles import \
+    BAMIndexedRegionsIter, \
+    BAMRegionsIter, \
+    BAM_PCR_DUPLICATE, \
+    EXCLUDED_FLAGS
 from paleomix.common.bedtools import \
+    BEDIndex, \
     sort_bed_by_bamfile, \
     read_bed_file
 
@@ -86,19 +95,249 @@ def collect_bed_regions(filename):
     return regions
 
 
-def parse_arguments(argv, ext):
-    prog = "paleomix %s" % (ext.strip("."),)
-    usage = "%s [options] sorted.bam [out%s]" % (prog, ext)
-    parser = argparse.ArgumentParser(prog=prog, usage=usage)
+class BAMCollector(object):
+    """Base class for statistics collected while scanning a BAM file; see
+    'scan_bam_file'. Records are passed to collectors one position at a time,
+    for one region (contig or window of a contig) at a time.
+
+    If regions of interest are used, then 'region.index' is a BEDIndex (see
+    paleomix.common.bedtools) and each region corresponds to (part of) a
+    contig, given by 'region.contig'. In that case reads and positions should
+    be attributed to every region of interest they overlap, using the index.
+    Otherwise 'region.index' is None, and statistics are collected for the
+    region as a whole, using the name of the region.
+
+    When using multiple threads, contigs may be split into windows; in that
+    case reads overlapping the start of a window are included when processing
+    that window, even though these have already been processed as part of the
+    previous window. Collectors should therefore ignore records at positions
+    before 'region.owned_start', unless only bases inside the region are
+    counted (e.g. for depth histograms). The same applies to blocks of
+    regions of interest.
+    Collectors are then returned from worker processes and merged (see
+    'merge'), and must therefore be picklable once 'end_region' is called;
+    attributes named '_handle' and '_args' are not pickled.
+    """
+
+    # If true, PCR duplicates are passed to the collector
+    include_duplicates = False
+
+    def begin_region(self, region):
+        """Called prior to processing the records in a region; the name of
+        the region may differ from the contig name (e.g. '<Genome>')."""
+
+    def process_position(self, position, records):
+        """Called with the list of records aligned to a position."""
+
+    def end_region(self):
+        """Called after all records in a region have been processed."""
+
+    def merge(self, other):
+        """Adds the statistics collected by another collector of the same
+        type, built using the same arguments, to this collector."""
+        raise NotImplementedError
+
+    def finalize(self):
+        """Called once the entire file has been processed; this function is
+        expected to write the collected statistics."""
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_handle", None)
+        state.pop("_args", None)
+        return state
+
+
+def scan_bam_file(handle, args, build_func):
+    """Reads a sorted BAM file once, passing the records to the collectors
+    returned by 'build_func(args, handle)', which are then finalized. Returns
+    0 on success, or 1 if the file was not sorted, in which case collectors
+    are not finalized.
+
+    If more than one thread is requested (args.threads), and the BAM file is
+    indexed, contigs / regions are processed in parallel by worker processes,
+    each of which calls 'build_func' to create a set of collectors, which are
+    merged with the collectors in the current process.
+    """
+    timer = BAMTimer(handle, step=1000000)
+    collectors = build_func(args, handle)
+    index = BEDIndex(args.regions) if args.regions else None
+
+    shards = _build_shards(args, handle, index)
+    if shards is None:
+        regions = _iter_regions(args, handle, index, None, collectors)
+        if _scan_regions(collectors, regions, timer):
+            return 1
+    else:
+        # Tasks consist of consecutive shards, so that neighbouring blocks of
+        # regions of interest may be read together
+        ntasks = min(len(shards), args.threads * _TASKS_PER_THREAD)
+        tasks = []
+        for task in xrange(ntasks):
+            first = (len(shards) * task) // ntasks
+            last = (len(shards) * (task + 1)) // ntasks
+            tasks.append((task, shards[first:last]))
+
+        pool = multiprocessing.Pool(args.threads, _init_worker,
+                                    (args, index, build_func))
+        try:
+            for (returncode, nrecords, results) \
+                    in pool.imap(_scan_shards, tasks):
+                if returncode:
+                    pool.terminate()
+                    return returncode
 
-    parser.add_argument("infile", metavar="BAM",
-                        help="Filename of a sorted BAM file. If set to '-' "
-                             "the file is read from STDIN.")
-    parser.add_argument("outfile", metavar="OUTPUT", nargs='?',
-                        help="Filename of output table; defaults to name of "
-                             "the input BAM with a '%s' extension. If "
-                             "set to '-' the table is printed to STDOUT."
-                             % (ext,))
+                timer.increment(count=nrecords)
+                for (collector, other) in zip(collectors, results):
+                    collector.merge(other)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    timer.finalize()
+
+    for collector in collectors:
+        collector.finalize()
+
+    return 0
+
+
+def _iter_regions(args, handle, index, shards, collectors):
+    exclude_flags = EXCLUDED_FLAGS
+    if any(collector.include_duplicates for collector in collectors):
+        exclude_flags &= ~BAM_PCR_DUPLICATE
+
+    if index is not None:
+        regions = BAMIndexedRegionsIter(handle, index, shards, exclude_flags)
+    else:
+        regions = BAMRegionsIter(handle, shards, exclude_flags)
+
+    for region in regions:
+        if region.name is None:
+            # Trailing unmapped reads
+            break
+        elif index is None:
+            if handle.nreferences > args.max_contigs:
+                region.name = '<Genome>'
+
+            region.index = None
+            # Records before this position belong to the previous window
+            region.owned_start = region.start
+
+        yield region
+
+
+def _scan_regions(collectors, regions, timer):
+    include_duplicates = [collector.include_duplicates
+                          for collector in collectors]
+    # PCR duplicates are filtered per collector if only some include them
+    filter_duplicates = any(include_duplicates) and not all(include_duplicates)
+
+    last_tid = 0
+    for region in regions:
+        for collector in collectors:
+            collector.begin_region(region)
+
+        last_pos = 0
+        for (position, records) in region:
+            if (region.tid, position) < (last_tid, last_pos):
+                sys.stderr.write("ERROR: Input BAM file is unsorted\n")
+                return 1
+
+            records = list(records)
+            if position >= region.owned_start:
+                timer.increment(count=len(records), read=records[-1])
+
+            filtered = records
+            if filter_duplicates:
+                filtered = [record for record in records
+                            if not record.flag & BAM_PCR_DUPLICATE]
+
+            for collector in collectors:
+                if collector.include_duplicates:
+                    collector.process_position(position, records)
+                else:
+                    collector.process_position(position, filtered)
+
+            last_pos = position
+            last_tid = region.tid
+
+        for collector in collectors:
+            collector.end_region()
+
+    return 0
+
+
+def _build_shards(args, handle, index):
+    """Returns a list of regions to be processed by worker processes, or
+    None if the BAM file should be processed sequentially. Blocks of
+    (merged) regions of interest are processed individually, while contigs
+    may be split into windows, to allow genomes with few contigs to be
+    processed in parallel.
+    """
+    if args.threads <= 1:
+        return None
+    elif args.infile == "-" or not handle.has_index():
+        print_warn("WARNING: BAM file %r is not indexed; using 1 thread"
+                   % (args.infile,))
+        return None
+    elif index is not None:
+        return index.merged()
+
+    window_size = max(_MIN_WINDOW_SIZE,
+                      sum(handle.lengths) // (args.threads * _TASKS_PER_THREAD))
+
+    shards = []
+    for (name, length) in zip(handle.references, handle.lengths):
+        for start in xrange(0, length, window_size):
+            shards.append(_Shard(name, start, min(length, start + window_size),
+                                 name))
+
+    return shards
+
+
+def _init_worker(args, index, build_func):
+    import pysam
+
+    handle = pysam.Samfile(args.infile)
+    _WORKER_STATE[:] = (args, handle, index, build_func)
+
+
+def _scan_shards(task):
+    """Processes a set of regions in a worker process; returns a tuple of
+    the return-code, the number of records processed, and the collectors."""
+    task, shards = task
+    args, handle, index, build_func = _WORKER_STATE
+
+    # Ensures reproducible results for collectors sampling reads at random,
+    # regardless of which worker processes a given set of regions
+    random.seed(task)
+
+    timer = BAMTimer(None, step=sys.maxsize)
+    collectors = build_func(args, handle)
+    regions = _iter_regions(args, handle, index, shards, collectors)
+    returncode = _scan_regions(collectors, regions, timer)
+
+    return returncode, timer.count, collectors
+
+
+# Min size of windows in which contigs are split when using multiple threads
+_MIN_WINDOW_SIZE = 1000000
+# Number of tasks generated per thread, to balance work between workers
+_TASKS_PER_THREAD = 4
+# (args, handle, index, build_func) used by the current worker process
+_WORKER_STATE = []
+
+# Region processed by a worker process; see BAMRegionsIter
+_Shard = collections.namedtuple("_Shard", ("contig", "start", "end", "name"))
+
+
+def add_common_arguments(parser, what):
+    """Adds arguments shared between BAM statistics tools to an argparse
+    parser; 'what' describes the statistics calculated by the tool."""
     parser.add_argument("--target-name", default=None, metavar="NAME",
                         help="Name used for 'Target' column; defaults to the "
                              "filename of the BAM file.")
@@ -107,7 +346,7 @@ def parse_arguments(argv, ext):
                              "is calculated only for these grouping by the "
                              "name used in the BED file, or the contig name "
                              "if no name has been specified for a record."
-                             % (ext.strip("."),))
+                             % (what,))
     parser.add_argument('--max-contigs', default=100, type=int,
                         help="The maximum number of contigs allowed in a BAM "
                              "file. If this number is exceeded, the entire "
@@ -120,16 +359,19 @@ def parse_arguments(argv, ext):
                              "provide aggregated statistics; this is required "
                              "if readgroup information is missing or partial "
                              "[default: %(default)s]")
+    parser.add_argument('--threads', default=1, type=int,
+                        help="Number of worker processes used to process "
+                             "contigs / regions in parallel; requires that "
+                             "the BAM file is indexed [default: %(default)s]")
     parser.add_argument('--overwrite-output',
                         default=False, action="store_true",
                         help="Overwrite output file if it it exists; by "
                              "default, the script will terminate if the file "
                              "already exists.")
 
-    args = parser.parse_args(argv)
-    if not args.outfile:
-        args.outfile = swap_ext(args.infile, ext)
 
+def finalize_arguments(args):
+    """Sets derived values for arguments added by 'add_common_arguments'."""
     if args.ignore_readgroups:
         args.get_readgroup_func = _get_readgroup_ignored
     else:
@@ -141,6 +383,28 @@ def parse_arguments(argv, ext):
         else:
             args.target_name = os.path.basename(args.infile)
 
+
+def parse_arguments(argv, ext):
+    prog = "paleomix %s" % (ext.strip("."),)
+    usage = "%s [options] sorted.bam [out%s]" % (prog, ext)
+    parser = argparse.ArgumentParser(prog=prog, usage=usage)
+
+    parser.add_argument("infile", metavar="BAM",
+                        help="Filename of a sorted BAM file. If set to '-' "
+                             "the file is read from STDIN.")
+    parser.add_argument("outfile", metavar="OUTPUT", nargs='?',
+                        help="Filename of output table; defaults to name of "
+                             "the input BAM with a '%s' extension. If "
+                             "set to '-' the table is printed to STDOUT."
+                             % (ext,))
+    add_common_arguments(parser, ext.strip("."))
+
+    args = parser.parse_args(argv)
+    if not args.outfile:
+        args.outfile = swap_ext(args.infile, ext)
+
+    finalize_arguments(args)
+
     if os.path.exists(args.outfile) and not args.overwrite_output:
         parser.error("Destination filename already exists (%r); use option "
                      "--overwrite-output to allow overwriting of this file."
@@ -151,6 +415,15 @@ def parse_arguments(argv, ext):
 
 def main_wrapper(process_func, argv, ext):
     args = parse_arguments(argv, ext)
+
+    return process_bam_file(process_func, args)
+
+
+def process_bam_file(process_func, args):
+    """Opens the BAM file specified in 'args.infile', reads regions of
+    interest (if any), and calls 'process_func(handle, args)'."""
+    import pysam
+
     args.regions = None
     if args.regions_fpath:
         try:
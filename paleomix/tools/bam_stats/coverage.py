@@ -28,7 +28,8 @@ from paleomix.common.utilities import \
     get_in, \
     set_in
 from paleomix.common.text import \
-    parse_padded_table
+    read_table_file, \
+    write_binary_table
 
 from paleomix.tools.bam_stats.common import \
     BAMStatsError
@@ -157,28 +158,42 @@ def build_rows(table):
 
 
 def read_table(table, filename):
-    with open(filename) as table_file:
-        for record in parse_padded_table(table_file):
-            key = (record["Name"], record["Sample"],
-                   record["Library"], record["Contig"])
-            if "*" in key:
-                continue
-
-            subtable = get_in(table, key)
-            if subtable is None:
-                subtable = ReadGroup()
-                subtable.Size = int(record["Size"])
-                set_in(table, key, subtable)
-
-            assert int(subtable.Size) == int(record["Size"])
-            for key in ReadGroup.__slots__:
-                if key != "Size":
-                    subtable[key] += int(record.get(key, 0))
+    """Adds the counts in a coverage table to 'table', preferring the binary
+    copy of the table written by 'write_table', if up to date."""
+    header, rows = read_table_file(filename)
+    if not header:
+        return
+
+    key_columns = [header.index(key)
+                   for key in ("Name", "Sample", "Library", "Contig")]
+    size_column = header.index("Size")
+    # (slot, column) for counts included in the table
+    count_columns = [(key, header.index(key))
+                     for key in ReadGroup.__slots__
+                     if key != "Size" and key in header]
+
+    for row in rows:
+        key = tuple(row[column] for column in key_columns)
+        if "*" in key:
+            continue
+
+        subtable = get_in(table, key)
+        if subtable is None:
+            subtable = ReadGroup()
+            subtable.Size = int(row[size_column])
+            set_in(table, key, subtable)
+
+        assert int(subtable.Size) == int(row[size_column])
+        for (key, column) in count_columns:
+            subtable[key] += int(row[column])
 
 
 def write_table(table, filename):
+    """Writes a coverage table to 'filename', along with a binary copy of the
+    table (see paleomix.common.text.write_binary_table), unless the table is
+    written to STDOUT ("-")."""
     table = calculate_totals(table)
-    rows = build_rows(table)
+    rows = list(build_rows(table))
 
     if filename == "-":
         output_handle = sys.stdout
@@ -194,6 +209,9 @@ def write_table(table, filename):
         if output_handle is not sys.stdout:
             output_handle.close()
 
+    if filename != "-":
+        write_binary_table(filename, rows)
+
 
 def _calculate_totals_in(tables, lengths):
     totals = collections.defaultdict(ReadGroup)
@@ -0,0 +1,163 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2018 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Calculates multiple statistics for a BAM file, reading the file once.
+
+The tables written are identical to those produced by the 'coverage',
+'depths', and 'duphist' commands; in addition, a histogram of insert sizes
+may be calculated for paired-end and collapsed reads.
+"""
+import argparse
+import collections
+import os
+import sys
+
+from paleomix.tools.bam_stats.common import \
+    BAMCollector, \
+    add_common_arguments, \
+    finalize_arguments, \
+    process_bam_file, \
+    scan_bam_file
+
+from paleomix.tools.coverage import \
+    CoverageCollector
+from paleomix.tools.depths import \
+    DepthCollector
+from paleomix.tools.duphist import \
+    DuplicateCollector, \
+    get_template_length, \
+    write_histogram
+
+
+class InsertSizeCollector(BAMCollector):
+    """Collects a histogram of insert sizes for properly paired reads (counted
+    once per pair) and for collapsed reads, and writes this to 'filename'."""
+
+    def __init__(self, filename):
+        self._filename = filename
+        self._counts = collections.defaultdict(int)
+        self._owned_start = 0
+
+    def begin_region(self, region):
+        self._owned_start = region.owned_start
+
+    def process_position(self, position, records):
+        if position < self._owned_start:
+            return
+
+        counts = self._counts
+        for record in records:
+            if record.is_paired:
+                if not record.is_proper_pair or record.is_read2:
+                    continue
+
+            length = get_template_length(record)
+            if length is not None:
+                counts[abs(length)] += 1
+
+    def merge(self, other):
+        for (key, count) in other._counts.iteritems():
+            self._counts[key] += count
+
+    def finalize(self):
+        write_histogram(self._counts, self._filename)
+
+
+def build_collectors(args, handle):
+    """Returns collectors for each of the statistics requested."""
+    collectors = []
+    if args.coverage:
+        collectors.append(CoverageCollector(args, handle, args.coverage))
+    if args.depths:
+        collectors.append(DepthCollector(args, handle, args.depths))
+    if args.duphist:
+        collectors.append(DuplicateCollector(args.duphist))
+    if args.insert_sizes:
+        collectors.append(InsertSizeCollector(args.insert_sizes))
+
+    return collectors
+
+
+def process_file(handle, args):
+    return scan_bam_file(handle, args, build_collectors)
+
+
+def parse_arguments(argv):
+    prog = "paleomix bam_stats"
+    usage = "%s [options] sorted.bam" % (prog,)
+    parser = argparse.ArgumentParser(prog=prog, usage=usage)
+
+    parser.add_argument("infile", metavar="BAM",
+                        help="Filename of a sorted BAM file. If set to '-' "
+                             "the file is read from STDIN.")
+
+    group = parser.add_argument_group("Output files")
+    group.add_argument("--coverage", metavar="FILE",
+                       help="Write coverage table (see 'paleomix coverage') "
+                            "to FILE.")
+    group.add_argument("--depths", metavar="FILE",
+                       help="Write depth histogram (see 'paleomix depths') "
+                            "to FILE.")
+    group.add_argument("--duphist", metavar="FILE",
+                       help="Write PCR duplicate histogram (see 'paleomix "
+                            "duphist') to FILE.")
+    group.add_argument("--insert-sizes", metavar="FILE",
+                       help="Write histogram of insert sizes of properly "
+                            "paired and collapsed reads to FILE.")
+
+    add_common_arguments(parser, "statistics")
+
+    args = parser.parse_args(argv)
+    outputs = [filename for filename in (args.coverage,
+                                         args.depths,
+                                         args.duphist,
+                                         args.insert_sizes)
+               if filename is not None]
+
+    if not outputs:
+        parser.error("No output files specified!")
+    elif outputs.count("-") > 1:
+        parser.error("At most one table may be written to STDOUT!")
+
+    if not args.overwrite_output:
+        for filename in outputs:
+            if filename != "-" and os.path.exists(filename):
+                parser.error("Destination filename already exists (%r); use "
+                             "option --overwrite-output to allow overwriting "
+                             "of this file." % (filename,))
+
+    finalize_arguments(args)
+
+    return args
+
+
+def main(argv):
+    args = parse_arguments(argv)
+
+    return process_bam_file(process_file, args)
+
+
+##############################################################################
+##############################################################################
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,51 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Runs a task (node) submitted to a batch system by a pipeline.
+
+This command is used internally by pipelines run with the --batch-system
+option, and is not intended to be invoked directly.
+"""
+import argparse
+import sys
+
+import paleomix.batch
+
+
+def parse_args(argv):
+    prog = "paleomix batch_task"
+    usage = "%s task.pickle" % (prog,)
+    parser = argparse.ArgumentParser(prog=prog, usage=usage)
+    parser.add_argument("task", help="Pickled task written by a pipeline.")
+
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    """Main function; takes a list of arguments equivalent to sys.argv[1:]."""
+    args = parse_args(argv)
+
+    return paleomix.batch.run_task(args.task)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -24,12 +24,40 @@
 Wrapper around cat / zcat / bzcat, which selects the appropriate commmand
 based on the files specified on the command-line. Input files may be a mix
 of different types of compressed / uncompressed files.
+
+If more than one thread is used, gzip files consisting of multiple members
+(e.g. BGZF files) and bzip2 files consisting of multiple streams (e.g. files
+compressed using pbzip2) are split into segments at member / stream
+boundaries, which are decompressed in parallel by worker threads. Files, or
+the remainder of files, that cannot be split are decompressed using pigz /
+pbzip2 if available, and otherwise using gzip / bzip2.
 """
+import bz2
+import collections
 import os
+import struct
 import sys
 import argparse
 import itertools
 import subprocess
+import zlib
+
+from multiprocessing.pool import ThreadPool
+
+from paleomix.common.fileutils import executable_exists
+
+
+# Target size of (compressed) segments decompressed by worker threads
+_SEGMENT_SIZE = 1024 * 1024
+# Decompression is carried out sequentially if no boundary can be found
+_MAX_SEGMENT_SIZE = 8 * _SEGMENT_SIZE
+# Max number of segments being decompressed / waiting to be written per thread
+_SEGMENTS_PER_THREAD = 2
+# Byte appended to segments to determine if the last member ended the segment
+_SENTINEL = "\0"
+# Number of bytes required to identify a gzip / BGZF header
+_GZIP_HEADER_SIZE = 10
+_BGZF_HEADER_SIZE = 18
 
 
 def _select_output(filename):
@@ -55,23 +83,244 @@ def _select_cat(filename):
         return ("cat",)
 
 
-def _call(input_files, output_file):
+def _call(input_files, output_file, threads=1):
     """Call an appropriate cat on each input file, writing the contents to the
     file specified by 'output_file'; if the latter is '-', STDOUT is used.
     """
     with _select_output(output_file) as out_handle:
         for (command, filenames) in itertools.groupby(input_files,
                                                       _select_cat):
-            command = list(command)
-            command.extend(filenames)
+            if threads > 1 and command[0] in _FORMATS:
+                for filename in filenames:
+                    _decompress_parallel(filename, out_handle, command[0],
+                                         threads)
+            else:
+                command = list(command)
+                command.extend(filenames)
 
-            subprocess.check_call(command,
-                                  stdout=out_handle,
-                                  preexec_fn=os.setsid,
-                                  close_fds=True)
+                _check_call(command, out_handle)
     return 0
 
 
+def _check_call(command, out_handle, stdin=None):
+    # Output written by this process must precede that of the command
+    out_handle.flush()
+
+    subprocess.check_call(command,
+                          stdin=stdin,
+                          stdout=out_handle,
+                          preexec_fn=os.setsid,
+                          close_fds=True)
+
+
+def _decompress_parallel(filename, out_handle, fmt, threads):
+    """Decompresses a gzip / bzip2 file using 'threads' worker threads; if
+    the file cannot be split, or if a segment could not be decompressed by
+    itself, the remainder of the file is decompressed using a (parallel)
+    gzip / bzip2 command, starting from the last known member boundary.
+    """
+    find_boundary, decompressor, commands = _FORMATS[fmt]
+
+    pool = ThreadPool(threads)
+    try:
+        with open(filename, "rb") as handle:
+            if fmt == "gzip" and _read_bgzf_block_size(handle.read(
+                    _BGZF_HEADER_SIZE), 0) is not None:
+                find_boundary = _find_bgzf_block
+            handle.seek(0)
+
+            pending = collections.deque()
+            offset = None  # Offset from which to decompress sequentially
+            for (segment_offset, data) in _read_segments(handle,
+                                                         find_boundary):
+                if data is None:
+                    offset = segment_offset
+                    break
+
+                pending.append((segment_offset,
+                                pool.apply_async(_decompress_segment,
+                                                 (decompressor, data))))
+
+                if len(pending) >= threads * _SEGMENTS_PER_THREAD:
+                    offset = _write_segment(pending.popleft(), out_handle)
+                    if offset is not None:
+                        # Later segments are decompressed sequentially
+                        pending.clear()
+                        break
+
+            while pending:
+                segment_offset = _write_segment(pending.popleft(), out_handle)
+                if segment_offset is not None:
+                    offset = segment_offset
+                    break
+    finally:
+        pool.terminate()
+        pool.join()
+
+    if offset is not None:
+        fd = os.open(filename, os.O_RDONLY)
+        try:
+            os.lseek(fd, offset, os.SEEK_SET)
+            _check_call(_select_command(commands, threads), out_handle, fd)
+        finally:
+            os.close(fd)
+
+
+def _write_segment(pending, out_handle):
+    """Writes the result of decompressing a segment; if the segment could not
+    be decompressed by itself, the offset of the segment is returned."""
+    offset, result = pending
+    result = result.get()
+    if result is None:
+        return offset
+
+    out_handle.write(result)
+    return None
+
+
+def _select_command(commands, threads):
+    """Returns the first command for which the executable is available."""
+    for command in commands[:-1]:
+        if executable_exists(command[0]):
+            return [value.format(threads=threads) for value in command]
+
+    return list(commands[-1])
+
+
+def _read_segments(handle, find_boundary):
+    """Reads a file and yields tuples of (offset, data) for segments split at
+    boundaries (the start of gzip members / bzip2 streams) identified by the
+    function 'find_boundary'. If no boundary is found within _MAX_SEGMENT_SIZE
+    bytes, a tuple with 'data' set to None is yielded, and reading stops.
+    """
+    offset, data = 0, ""
+    while True:
+        boundary = None
+        search_from = _SEGMENT_SIZE
+        while len(data) < _MAX_SEGMENT_SIZE:
+            if len(data) > search_from:
+                boundary = find_boundary(data, search_from)
+                if boundary is not None:
+                    break
+                # Allow for headers that are only partially read
+                search_from = max(search_from, len(data) - _BGZF_HEADER_SIZE)
+
+            chunk = handle.read(_SEGMENT_SIZE)
+            if not chunk:
+                break
+            data += chunk
+
+        if boundary is not None:
+            yield offset, data[:boundary]
+            offset += boundary
+            data = data[boundary:]
+        elif len(data) >= _MAX_SEGMENT_SIZE:
+            yield offset, None
+            return
+        else:
+            if data:
+                yield offset, data
+            return
+
+
+def _decompress_segment(decompressor, data):
+    """Decompresses a segment consisting of one or more gzip members / bzip2
+    streams; returns None if the segment is invalid or if the last member /
+    stream continues beyond the end of the segment."""
+    chunks = []
+    data += _SENTINEL
+    while data != _SENTINEL:
+        obj = decompressor()
+        try:
+            chunks.append(obj.decompress(data))
+        except (EOFError, IOError, zlib.error):
+            return None
+
+        data = obj.unused_data
+        if not data:
+            return None
+
+    return "".join(chunks)
+
+
+def _find_gzip_member(data, start):
+    """Returns the offset of the first likely gzip header at or after 'start';
+    false positives are rejected when segments are decompressed."""
+    index = data.find("\x1f\x8b\x08", start)
+    while 0 <= index <= len(data) - _GZIP_HEADER_SIZE:
+        flags = ord(data[index + 3])
+        extra_flags = data[index + 8]
+        operating_system = ord(data[index + 9])
+        if not (flags & 0xE0) and extra_flags in "\x00\x02\x04" \
+                and (operating_system <= 13 or operating_system == 255):
+            return index
+
+        index = data.find("\x1f\x8b\x08", index + 1)
+
+    return None
+
+
+def _find_bgzf_block(data, start):
+    """Returns the offset of the first BGZF block at or after 'start', by
+    following block sizes from the start of 'data'."""
+    offset = 0
+    while offset < start:
+        block_size = _read_bgzf_block_size(data, offset)
+        if block_size is None:
+            return None
+        offset += block_size
+
+    if _read_bgzf_block_size(data, offset) is None:
+        return None
+
+    return offset
+
+
+def _read_bgzf_block_size(data, offset):
+    """Returns the size of the BGZF block at 'offset', or None if the data
+    does not contain a (complete) BGZF header at that offset."""
+    header = data[offset:offset + _BGZF_HEADER_SIZE]
+    if len(header) < _BGZF_HEADER_SIZE or header[:4] != "\x1f\x8b\x08\x04":
+        return None
+
+    # The first extra subfield ('BC') contains the block size minus 1
+    xlen, si1, si2, slen, bsize = struct.unpack("<HccHH", header[10:18])
+    if xlen < 6 or (si1, si2, slen) != ("B", "C", 2):
+        return None
+
+    return bsize + 1
+
+
+def _find_bzip2_stream(data, start):
+    """Returns the offset of the first bzip2 stream header at or after 'start',
+    identified by the stream magic followed by the block magic."""
+    index = data.find("1AY&SY", start + 4)
+    while index != -1:
+        if data[index - 4:index - 1] == "BZh" and "1" <= data[index - 1] <= "9":
+            return index - 4
+
+        index = data.find("1AY&SY", index + 1)
+
+    return None
+
+
+def _gzip_decompressor():
+    # Decompress gzip members, including header and trailer (CRC32)
+    return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+
+# Functions used to find member / stream boundaries, to decompress segments,
+# and commands used to decompress files sequentially, in order of preference
+_FORMATS = {
+    "gzip": (_find_gzip_member, _gzip_decompressor,
+             (("pigz", "-cd", "-p", "{threads}"),
+              ("gzip", "-cd"))),
+    "bzip2": (_find_bzip2_stream, bz2.BZ2Decompressor,
+              (("pbzip2", "-cd", "-p{threads}"),
+               ("bzip2", "-cd"))),
+}
+
+
 def parse_args(argv):
     parser = argparse.ArgumentParser(prog="paleomix cat")
     parser.add_argument("file", nargs="+",
@@ -81,6 +330,10 @@ def parse_args(argv):
     parser.add_argument("--output", default=None,
                         help="Write output to this file; by default, output "
                              "is written to STDOUT.")
+    parser.add_argument("--threads", type=int, default=1,
+                        help="Number of threads used to decompress gzip / "
+                             "bzip2 files consisting of multiple members / "
+                             "streams [%(default)s].")
 
     return parser.parse_args(argv)
 
@@ -88,10 +341,15 @@ def parse_args(argv):
 def main(argv):
     """Main function; takes a list of arguments but excluding sys.argv[0]."""
     args = parse_args(argv)
+    if args.threads < 1:
+        sys.stderr.write("--threads must be 1 or greater, not %r\n"
+                         % (args.threads,))
+        return 1
 
     try:
         return _call(input_files=args.file,
-                     output_file=args.output)
+                     output_file=args.output,
+                     threads=args.threads)
     except Exception, error:
         sys.stderr.write("Error running 'paleomix cat':\n    %s\n\n" % error)
         sys.stderr.write("Command = %s\n" % (" ".join(sys.argv),))
@@ -21,20 +21,25 @@
 # SOFTWARE.
 #
 import sys
-import copy
+import collections
+
+try:
+    import numpy
+except ImportError:
+    # NumPy is optional; the slower, pure-Python implementation is used if
+    # NumPy is not installed. See 'CoverageAccumulator'.
+    numpy = None
 
 from paleomix.common.utilities import \
     get_in, \
     set_in
-from paleomix.common.timer import \
-    BAMTimer
-from paleomix.common.bamfiles import \
-    BAMRegionsIter
 
 from paleomix.tools.bam_stats.common import \
+    BAMCollector, \
     collect_readgroups, \
     collect_references, \
-    main_wrapper
+    main_wrapper, \
+    scan_bam_file
 from paleomix.tools.bam_stats.coverage import \
     ReadGroup, \
     write_table
@@ -55,7 +60,7 @@ def get_region_table(counts, region, template):
     if subtable is not None:
         return subtable
 
-    subtable = copy.deepcopy(template)
+    subtable = dict((key, ReadGroup()) for key in template)
     counts[region] = subtable
 
     return subtable
@@ -101,14 +106,141 @@ def build_table(args, handle, counts):
     return table
 
 
-def print_table(args, handle, counts):
+def print_table(args, handle, counts, filename):
     table = build_table(args, handle, counts)
-    write_table(table, args.outfile)
+    write_table(table, filename)
 
 
 ##############################################################################
 ##############################################################################
 
+# Number of records processed at a time by the NumPy based implementation;
+# see CoverageAccumulator for implementation
+_BATCH_SIZE = 2 ** 16
+
+# Columns in arrays of counts used by CoverageAccumulator
+_FIELDS = ("SE", "PE_1", "PE_2", "Collapsed", "M", "I", "D")
+# Column offset of hits (SE, PE_1, PE_2, Collapsed)
+_HITS_COLUMN = 0
+# Column offset of bases (M, I, D)
+_BASES_COLUMN = 4
+
+
+if numpy is not None:
+    # CIGAR operations that advance the position on the reference; note that
+    # 'P' (6) is treated as not doing so, as in 'process_record'
+    _CIGAR_ADVANCES = numpy.array([1, 0, 1, 1, 0, 0, 0, 1, 1, 0],
+                                  dtype=numpy.bool_)
+    # Column (relative to _BASES_COLUMN) to which bases are added; -1 if not
+    # counted. 0 = 'M', 1 = 'I', 2 = 'D', 7 = '=', 8 = 'X'
+    _CIGAR_COLUMN = numpy.array([0, 1, 2, -1, -1, -1, -1, 0, 0, -1],
+                                dtype=numpy.int64)
+
+
+class CoverageAccumulator(object):
+    """NumPy based alternative to 'process_record'.
+
+    The read-group, type of hit, and CIGAR operations of records are
+    collected in batches. For each batch, the position of every CIGAR
+    operation is calculated using a cumulative sum of the lengths of
+    operations advancing along the reference, and the number of bases inside
+    the bounds given for each record is added to the counts using
+    'numpy.bincount'. Counts are stored in an array with a row for every
+    combination of region and read-group, and a column for every field in
+    _FIELDS.
+    """
+
+    def __init__(self, counts):
+        self._counts = counts
+
+        self._rows = []
+        self._hits = []
+        self._positions = []
+        self._starts = []
+        self._ends = []
+        # Number of CIGAR operations per record
+        self._noperations = []
+        self._cigars = []
+
+    def add_record(self, row, record, start, end):
+        """Records the hit and CIGAR operations of a read, for the given row
+        in the array of counts; only bases in [start, end) are counted."""
+        qname = record.qname
+        flags = record.flag
+        if qname.startswith("M_") or qname.startswith("MT_"):
+            self._hits.append(3)  # Collapsed
+        elif flags & 0x40:  # first of pair
+            self._hits.append(1)
+        elif flags & 0x80:  # second of pair
+            self._hits.append(2)
+        else:  # Singleton
+            self._hits.append(0)
+
+        cigar = record.cigartuples
+        self._rows.append(row)
+        self._positions.append(record.pos)
+        self._starts.append(start)
+        self._ends.append(end)
+        self._noperations.append(len(cigar))
+        self._cigars.extend(cigar)
+
+        if len(self._rows) >= _BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Adds counts for all buffered records to the array of counts."""
+        if not self._rows:
+            return
+
+        counts = self._counts
+        nrows = counts.shape[0]
+        rows = numpy.array(self._rows, dtype=numpy.int64)
+
+        hits = rows * 4 + numpy.array(self._hits, dtype=numpy.int64)
+        hits = numpy.bincount(hits, minlength=nrows * 4)
+        counts[:, _HITS_COLUMN:_HITS_COLUMN + 4] += hits.reshape(-1, 4)
+
+        if self._cigars:
+            noperations = numpy.array(self._noperations, dtype=numpy.int64)
+            cigars = numpy.array(self._cigars, dtype=numpy.int64)
+            operations = cigars[:, 0]
+            lengths = cigars[:, 1]
+
+            # Offset of each operation relative to the start of its read
+            advances = numpy.where(_CIGAR_ADVANCES[operations], lengths, 0)
+            offsets = numpy.cumsum(advances) - advances
+            has_cigar = noperations > 0
+            firsts = (numpy.cumsum(noperations) - noperations)[has_cigar]
+            offsets -= numpy.repeat(offsets[firsts], noperations[has_cigar])
+
+            positions = numpy.array(self._positions, dtype=numpy.int64)
+            positions = numpy.repeat(positions, noperations) + offsets
+
+            starts = numpy.repeat(self._starts, noperations)
+            ends = numpy.repeat(self._ends, noperations)
+            left = numpy.minimum(numpy.maximum(positions, starts), ends)
+            right = numpy.minimum(numpy.maximum(positions + lengths, starts),
+                                  ends)
+
+            columns = _CIGAR_COLUMN[operations]
+            selection = columns >= 0
+            keys = numpy.repeat(rows, noperations)[selection] * 3 \
+                + columns[selection]
+            bases = (right - left)[selection]
+
+            bases = numpy.bincount(keys, weights=bases, minlength=nrows * 3)
+            counts[:, _BASES_COLUMN:_BASES_COLUMN + 3] \
+                += bases.astype(numpy.int64).reshape(-1, 3)
+
+        self._rows = []
+        self._hits = []
+        self._positions = []
+        self._starts = []
+        self._ends = []
+        self._noperations = []
+        self._cigars = []
+
+
 def process_record(subtable, record, flags, region):
     qname = record.qname
     if qname.startswith("M_") or qname.startswith("MT_"):
@@ -141,46 +273,140 @@ def process_record(subtable, record, flags, region):
             position += num
 
 
-def process_file(handle, args):
-    timer = BAMTimer(handle, step=1000000)
-
-    counts = {}
-    last_tid = 0
-    region_template = build_region_template(args, handle)
-    for region in BAMRegionsIter(handle, args.regions):
-        if region.name is None:
-            # Trailing unmapped reads
-            break
-
-        name = region.name
-        if not args.regions and (handle.nreferences > args.max_contigs):
-            name = '<Genome>'
-
-        last_pos = 0
-        region_table = get_region_table(counts, name, region_template)
-        for (position, records) in region:
-            for record in records:
-                readgroup = args.get_readgroup_func(record)
-                readgroup_table = region_table.get(readgroup)
-                if readgroup_table is None:
-                    # Unknown readgroups are treated as missing readgroups
-                    readgroup_table = region_table[None]
-
-                process_record(readgroup_table, record, record.flag, region)
-                timer.increment(read=record)
+# Bounds within which bases are counted; see 'process_record'
+_Bounds = collections.namedtuple("_Bounds", ("start", "end"))
+
+
+def get_alignment_end(record):
+    """Returns the past-the-end position of an alignment, as used by
+    htslib when determining if a read overlaps a region."""
+    end = record.reference_end
+    if end is None or end <= record.pos:
+        return record.pos + 1
+    return end
+
+
+class CoverageCollector(BAMCollector):
+    """Collects coverage statistics for each read-group, and writes these to
+    'filename'; see 'scan_bam_file'."""
+
+    def __init__(self, args, handle, filename):
+        self._args = args
+        self._handle = handle
+        self._filename = filename
+        self._counts = {}
+        self._template = build_region_template(args, handle)
+        self._owned_start = 0
+        self._contig_length = 0
+        self._region = None
+        self._region_table = None
+
+        # The NumPy based implementation stores counts in a single array,
+        # with a row for every combination of region name and read-group
+        self._readgroups = tuple(self._template)
+        self._readgroup_rows = dict((key, row) for (row, key)
+                                    in enumerate(self._readgroups))
+        self._names = tuple(sorted(collect_references(args, handle)))
+        self._name_rows = dict((name, row * len(self._readgroups))
+                               for (row, name) in enumerate(self._names))
+        self._array = None
+        self._accumulator = None
+
+    def begin_region(self, region):
+        self._owned_start = region.owned_start
+        self._region = region
+        if region.index is None:
+            self._contig_length = self._handle.lengths[region.tid]
+
+        if numpy is not None:
+            if self._array is None:
+                shape = (len(self._names) * len(self._readgroups), len(_FIELDS))
+                self._array = numpy.zeros(shape, dtype=numpy.int64)
+
+            self._accumulator = CoverageAccumulator(self._array)
+        elif region.index is None:
+            self._region_table = get_region_table(self._counts, region.name,
+                                                  self._template)
+
+    def process_position(self, position, records):
+        if position < self._owned_start:
+            return
+
+        region = self._region
+        get_readgroup_func = self._args.get_readgroup_func
+        for record in records:
+            readgroup = get_readgroup_func(record)
+            if readgroup not in self._readgroup_rows:
+                # Unknown readgroups are treated as missing readgroups
+                readgroup = None
+
+            if region.index is None:
+                # Reads are counted in full in the window in which they
+                # start, should the contig have been split into windows
+                self._process_record(region.name, readgroup, record,
+                                     0, self._contig_length)
+            else:
+                # Reads are counted for every overlapping region of interest
+                end = get_alignment_end(record)
+                for bed in region.index.overlapping(region.contig,
+                                                    record.pos, end):
+                    self._process_record(bed.name, readgroup, record,
+                                         bed.start, bed.end)
+
+    def end_region(self):
+        if self._accumulator is not None:
+            self._accumulator.flush()
+
+        self._accumulator = None
+        self._region = None
+        self._region_table = None
+
+    def merge(self, other):
+        if other._array is not None:
+            if self._array is None:
+                self._array = other._array
+            else:
+                self._array += other._array
+
+        for (name, other_table) in other._counts.iteritems():
+            table = get_region_table(self._counts, name, self._template)
+            for (key, subtable) in other_table.iteritems():
+                table[key].add(subtable)
+
+    def finalize(self):
+        # Counts collected using NumPy are converted to ReadGroup objects
+        if self._array is not None:
+            rows = iter(self._array.tolist())
+            for name in self._names:
+                table = get_region_table(self._counts, name, self._template)
+                for key in self._readgroups:
+                    subtable = table[key]
+                    for (field, value) in zip(_FIELDS, rows.next()):
+                        subtable[field] += value
+            self._array = None
+
+        print_table(self._args, self._handle, self._counts, self._filename)
+
+    def _process_record(self, name, readgroup, record, start, end):
+        if self._accumulator is not None:
+            row = self._name_rows[name] + self._readgroup_rows[readgroup]
+            self._accumulator.add_record(row, record, start, end)
+        else:
+            if self._region_table is not None:
+                table = self._region_table
+            else:
+                table = get_region_table(self._counts, name, self._template)
 
-            if (region.tid, position) < (last_tid, last_pos):
-                sys.stderr.write("ERROR: Input BAM file is unsorted\n")
-                return 1
+            process_record(table[readgroup], record, record.flag,
+                           _Bounds(start, end))
 
-            last_pos = position
-            last_tid = region.tid
 
-    timer.finalize()
+def build_collectors(args, handle):
+    return [CoverageCollector(args, handle, args.outfile)]
 
-    print_table(args, handle, counts)
 
-    return 0
+def process_file(handle, args):
+    return scan_bam_file(handle, args, build_collectors)
 
 
 def main(argv):
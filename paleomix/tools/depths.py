@@ -25,15 +25,21 @@ import datetime
 import itertools
 import collections
 
-from paleomix.common.timer import \
-    BAMTimer
-from paleomix.common.bamfiles import \
-    BAMRegionsIter
-
+try:
+    import numpy
+except ImportError:
+    # NumPy is optional; the slower, pure-Python implementation is used if
+    # NumPy is not installed. See 'DepthAccumulator'.
+    numpy = None
+
+from paleomix.common.text import \
+    write_binary_table
 from paleomix.tools.bam_stats.common import \
+    BAMCollector, \
     collect_references, \
     collect_readgroups, \
-    main_wrapper
+    main_wrapper, \
+    scan_bam_file
 
 
 ##############################################################################
@@ -45,6 +51,11 @@ _MAX_DEPTH = 200
 # Maximum number of count patterns (numbers of bases per library for a given
 # site) to cache for bulk processing; see MappingsToTotals for implementation
 _MAX_CACHE_SIZE = 10000
+# Number of positions processed at a time by the NumPy based implementation;
+# see DepthAccumulator for implementation
+_BLOCK_SIZE = 2 ** 16
+# Maximum number of aligned segments to buffer before processing positions
+_MAX_SEGMENTS = 2 ** 16
 
 
 # Header prepended to output tables
@@ -164,6 +175,183 @@ class MappingToTotals(object):
         return tuple(mapping)
 
 
+class DepthAccumulator(object):
+    """NumPy based alternative to MappingToTotals / count_bases.
+
+    The start and end of each aligned segment (M, =, and X CIGAR operations)
+    are recorded as +1 / -1 deltas in a buffer of per-library difference
+    arrays covering a block of positions. Once all reads overlapping a block
+    of positions have been seen (as reads are sorted by position), the depths
+    are calculated using a cumulative sum of these deltas, combined for each
+    table of totals, and counted using 'numpy.bincount'.
+    """
+
+    def __init__(self, totals, region, smlbid_to_smlb, mappings=None):
+        """
+          - mappings: Dictionary of (tables, mapping) tuples by region name
+                      (see '_build_mapping'), used as a cache when regions
+                      of interest are used.
+        """
+        self._region = region
+        self._nkeys = len(smlbid_to_smlb)
+        self._smlbid_to_smlb = smlbid_to_smlb
+        self._totals = totals
+        self._mappings = {} if mappings is None else mappings
+
+        # Position corresponding to the first column in the buffer
+        self._offset = None
+        # Depths at the position just before offset
+        self._carry = numpy.zeros(self._nkeys, dtype=numpy.int32)
+        self._deltas = numpy.zeros((self._nkeys, _BLOCK_SIZE + 1),
+                                   dtype=numpy.int32)
+        # Aligned segments not yet added to the buffer
+        self._keys = []
+        self._starts = []
+        self._ends = []
+        # Past-the-end position of the right-most segment seen
+        self._max_end = 0
+
+    def add_record(self, key, record):
+        """Records the aligned segments of a read, for the given sample /
+        library ID (see 'build_rg_to_smlbid_keys')."""
+        position = record.pos
+        if self._offset is None:
+            self._offset = position
+
+        for (cigar, count) in record.cigar:
+            if cigar in (0, 7, 8):
+                self._keys.append(key)
+                self._starts.append(position)
+                position += count
+                self._ends.append(position)
+            elif cigar in (2, 3, 6):
+                position += count
+
+        self._max_end = max(self._max_end, position)
+
+    def process_counts(self, cur_pos):
+        """Processes positions prior to 'cur_pos', if a full block of
+        positions has been collected, or if too many segments are buffered.
+        It is assumed that no reads are added prior to 'cur_pos'."""
+        if self._offset is not None:
+            if cur_pos - self._offset >= _BLOCK_SIZE \
+                    or len(self._starts) >= _MAX_SEGMENTS:
+                self._process_block(cur_pos)
+
+    def finalize(self):
+        """Processes any remaining positions."""
+        if self._offset is not None:
+            self._process_block(self._max_end)
+
+    def _process_block(self, cur_pos):
+        self._add_segments()
+
+        offset = self._offset
+        # Depths are always zero past the last segment
+        ncolumns = min(cur_pos, self._max_end) - offset
+        if ncolumns > 0:
+            depths = numpy.cumsum(self._deltas[:, :ncolumns], axis=1,
+                                  dtype=numpy.int32)
+            depths += self._carry[:, numpy.newaxis]
+            self._carry = depths[:, -1].copy()
+
+            region = self._region
+            start = max(offset, region.start)
+            end = offset + ncolumns
+            if region.end is not None:
+                end = min(end, region.end)
+
+            if start >= end:
+                pass
+            elif region.index is None:
+                self._update_totals(region.name,
+                                    depths[:, start - offset:end - offset])
+            else:
+                # Depths are counted for every overlapping region of interest
+                for (seg_start, seg_end, records) \
+                        in region.index.segments(region.contig, start, end):
+                    segment = depths[:, seg_start - offset:seg_end - offset]
+                    for record in records:
+                        self._update_totals(record.name, segment)
+
+        if cur_pos >= self._max_end:
+            # No segments overlap the remaining positions
+            self._deltas.fill(0)
+            self._carry.fill(0)
+            self._offset = cur_pos
+        else:
+            remaining = self._max_end - cur_pos + 1
+            self._deltas[:, :remaining] \
+                = self._deltas[:, ncolumns:ncolumns + remaining]
+            self._deltas[:, remaining:] = 0
+            self._offset = cur_pos
+
+    def _add_segments(self):
+        if not self._starts:
+            return
+
+        width = self._max_end - self._offset + 1
+        if width > self._deltas.shape[1]:
+            deltas = numpy.zeros((self._nkeys, max(width, 2 * _BLOCK_SIZE)),
+                                 dtype=numpy.int32)
+            deltas[:, :self._deltas.shape[1]] = self._deltas
+            self._deltas = deltas
+
+        # Deltas are counted for all libraries at once, by using indices into
+        # the flattened (row-major) buffer
+        size = self._deltas.size
+        ncolumns = self._deltas.shape[1]
+        keys = numpy.array(self._keys, dtype=numpy.int64) * ncolumns
+        starts = numpy.array(self._starts, dtype=numpy.int64) - self._offset
+        ends = numpy.array(self._ends, dtype=numpy.int64) - self._offset
+
+        deltas = self._deltas.reshape(size)
+        deltas += numpy.bincount(keys + starts, minlength=size) \
+            .astype(numpy.int32)
+        deltas -= numpy.bincount(keys + ends, minlength=size) \
+            .astype(numpy.int32)
+
+        self._keys = []
+        self._starts = []
+        self._ends = []
+
+    def _update_totals(self, name, depths):
+        value = self._mappings.get(name)
+        if value is None:
+            value = self._build_mapping(self._totals, name,
+                                        self._smlbid_to_smlb)
+            self._mappings[name] = value
+
+        for (counts, smlbids) in zip(*value):
+            if len(smlbids) == 1:
+                combined = depths[smlbids[0]]
+            else:
+                combined = depths[smlbids].sum(axis=0)
+
+            histogram = numpy.bincount(combined)
+            for depth in histogram[1:].nonzero()[0]:
+                counts[int(depth) + 1] += int(histogram[depth + 1])
+
+    @classmethod
+    def _build_mapping(cls, totals, name, smlbid_to_smlb):
+        """Returns a list of distinct tables of totals, and for each table
+        the list of sample / library IDs contributing to that table."""
+        totals_by_smlbid, totals_src_and_dst \
+            = MappingToTotals._build_mappings(totals, name, smlbid_to_smlb)
+
+        tables = []
+        mapping = []
+        for (dst_counts, src_count) in totals_src_and_dst:
+            smlbids = [smlbid
+                       for (smlbid, accumulators) in enumerate(totals_by_smlbid)
+                       if any(src_count is value for value in accumulators)]
+
+            tables.append(dst_counts)
+            mapping.append(smlbids)
+
+        return tables, mapping
+
+
 ##############################################################################
 ##############################################################################
 
@@ -186,22 +374,25 @@ def calc_max_depth(counts):
     return "NA"
 
 
-def print_table(handle, args, totals):
+def print_table(handle, args, totals, filename):
     lengths = collect_references(args, handle)
 
-    if args.outfile == "-":
+    if filename == "-":
         output_handle = sys.stdout
     else:
-        output_handle = open(args.outfile, "w")
+        output_handle = open(filename, "w")
 
+    rows = list(build_table(args.target_name, totals, lengths))
     with output_handle:
-        rows = build_table(args.target_name, totals, lengths)
         output_handle.write(_HEADER % datetime.datetime.now().isoformat())
         output_handle.write("\n")
         for line in rows:
             output_handle.write('\t'.join(map(str, line)))
             output_handle.write("\n")
 
+    if filename != "-":
+        write_binary_table(filename, rows)
+
 
 def calculate_depth_pc(counts, length):
     final_counts = [0] * (_MAX_DEPTH + 1)
@@ -297,14 +488,20 @@ def build_totals_dict(args, handle):
     return totals
 
 
-def count_bases(args, counts, record, rg_to_smlbid, template):
-    for _ in xrange(record.alen - len(counts)):
-        counts.append(list(template))
-
+def get_smlbid(args, record, rg_to_smlbid):
+    """Returns the sample / library ID for a record."""
     key = rg_to_smlbid.get(args.get_readgroup_func(record))
     if key is None:
         # Unknown readgroups are treated as missing readgroups
         key = rg_to_smlbid[None]
+    return key
+
+
+def count_bases(args, counts, record, rg_to_smlbid, template):
+    for _ in xrange(record.alen - len(counts)):
+        counts.append(list(template))
+
+    key = get_smlbid(args, record, rg_to_smlbid)
 
     index = 0
     for (cigar, count) in record.cigar:
@@ -339,56 +536,148 @@ def build_rg_to_smlbid_keys(args, handle):
     return rg_to_lbsmid, lbsmid_to_smlb
 
 
-def process_file(handle, args):
-    timer = BAMTimer(handle, step=1000000)
-
-    last_tid = 0
-    totals = build_totals_dict(args, handle)
-    rg_to_smlbid, smlbid_to_smlb = build_rg_to_smlbid_keys(args, handle)
-    template = [0] * len(smlbid_to_smlb)
-
-    for region in BAMRegionsIter(handle, args.regions):
-        if region.name is None:
-            # Trailing unmapped reads
-            break
-        elif not args.regions and (handle.nreferences > args.max_contigs):
-            region.name = '<Genome>'
-
-        last_pos = 0
-        counts = collections.deque()
-        mapping = MappingToTotals(totals, region, smlbid_to_smlb)
-        for (position, records) in region:
-            mapping.process_counts(counts, last_pos, position)
-
+class DepthCollector(BAMCollector):
+    """Collects depth histograms for each sample / library, and writes these
+    to 'filename'; see 'scan_bam_file'."""
+
+    def __init__(self, args, handle, filename):
+        self._args = args
+        self._handle = handle
+        self._filename = filename
+        self._totals = build_totals_dict(args, handle)
+        self._rg_to_smlbid, self._smlbid_to_smlb \
+            = build_rg_to_smlbid_keys(args, handle)
+        self._template = [0] * len(self._smlbid_to_smlb)
+
+        self._accumulator = None
+        # Mappings from sample / library IDs to tables, by region name
+        self._mappings = {}
+        self._mapping = None
+        self._named_mappings = None
+        self._region = None
+        self._counts = None
+        self._last_pos = 0
+
+    def begin_region(self, region):
+        if numpy is not None:
+            self._accumulator = DepthAccumulator(self._totals, region,
+                                                 self._smlbid_to_smlb,
+                                                 self._mappings)
+        else:
+            if region.index is None:
+                self._mapping = MappingToTotals(self._totals, region,
+                                                self._smlbid_to_smlb)
+            else:
+                self._named_mappings = {}
+            self._region = region
+            self._counts = collections.deque()
+            self._last_pos = 0
+
+    def process_position(self, position, records):
+        args = self._args
+        rg_to_smlbid = self._rg_to_smlbid
+        if numpy is not None:
+            accumulator = self._accumulator
+            accumulator.process_counts(position)
+            for record in records:
+                key = get_smlbid(args, record, rg_to_smlbid)
+                accumulator.add_record(key, record)
+        else:
+            counts = self._counts
+            self._process_counts(position)
             for record in records:
-                timer.increment(read=record)
-                count_bases(args, counts, record, rg_to_smlbid, template)
-
-            if (region.tid, position) < (last_tid, last_pos):
-                sys.stderr.write("ERROR: Input BAM file is unsorted\n")
-                return 1
-
-            last_pos = position
-            last_tid = region.tid
-
-        # Process columns in region after last read
-        mapping.process_counts(counts, last_pos, float("inf"))
-        mapping.finalize()
-    timer.finalize()
-
-    if not args.ignore_readgroups:
-        # Exclude counts for reads with no read-groups, if none such were seen
-        for (key, _, _), value in totals.iteritems():
-            if key == '<NA>' and value:
-                break
+                count_bases(args, counts, record, rg_to_smlbid,
+                            self._template)
+            self._last_pos = position
+
+    def end_region(self):
+        if numpy is not None:
+            self._accumulator.finalize()
         else:
-            for key in totals.keys():
-                if key[0] == '<NA>':
-                    totals.pop(key)
+            # Process columns in region after last read
+            self._process_counts(float("inf"))
+            if self._mapping is not None:
+                self._mapping.finalize()
+            else:
+                for mapping in self._named_mappings.itervalues():
+                    mapping.finalize()
+
+        self._accumulator = None
+        self._mapping = None
+        self._named_mappings = None
+        self._region = None
+        self._counts = None
+
+    def _process_counts(self, cur_pos):
+        """Processes counts for positions prior to 'cur_pos', using the pure
+        Python implementation; see 'MappingToTotals'."""
+        if self._mapping is not None:
+            self._mapping.process_counts(self._counts, self._last_pos, cur_pos)
+            return
+
+        # Counts are attributed to every overlapping region of interest
+        region = self._region
+        counts = self._counts
+        last_pos = self._last_pos
+        cur_pos = min(cur_pos, last_pos + len(counts))
+        columns = [counts.popleft() for _ in xrange(cur_pos - last_pos)]
+
+        start = max(last_pos, region.start)
+        end = min(cur_pos, region.end)
+        if start >= end:
+            return
+
+        for (seg_start, seg_end, records) \
+                in region.index.segments(region.contig, start, end):
+            segment = columns[seg_start - last_pos:seg_end - last_pos]
+            for record in records:
+                mapping = self._named_mappings.get(record.name)
+                if mapping is None:
+                    mapping = MappingToTotals(self._totals,
+                                              _Region(record.name, 0,
+                                                      float("inf")),
+                                              self._smlbid_to_smlb)
+                    self._named_mappings[record.name] = mapping
+
+                mapping.process_counts(collections.deque(segment),
+                                       seg_start, seg_end)
+
+    def merge(self, other):
+        # Tables may be shared between keys, so each is only merged once
+        observed = set()
+        for (key, counts) in self._totals.iteritems():
+            if id(counts) not in observed:
+                observed.add(id(counts))
+                for (depth, count) in other._totals[key].iteritems():
+                    counts[depth] += count
+
+    def finalize(self):
+        totals = self._totals
+        if not self._args.ignore_readgroups:
+            # Exclude counts for reads with no read-groups, if none such were
+            # seen
+            for (key, _, _), value in totals.iteritems():
+                if key == '<NA>' and value:
+                    break
+            else:
+                for key in totals.keys():
+                    if key[0] == '<NA>':
+                        totals.pop(key)
 
-    print_table(handle, args, totals)
+        print_table(self._handle, self._args, totals, self._filename)
 
-    return 0
+
+# Region passed to MappingToTotals for regions of interest, for which counts
+# are selected by DepthCollector; see 'DepthCollector._process_counts'
+_Region = collections.namedtuple("_Region", ("name", "start", "end"))
+
+
+def build_collectors(args, handle):
+    return [DepthCollector(args, handle, args.outfile)]
+
+
+def process_file(handle, args):
+    return scan_bam_file(handle, args, build_collectors)
 
 
 def main(argv):
@@ -71,6 +71,10 @@ def parse_args(argv):
                         help="Only print the number of BAM records where 1 or "
                              "more potential duplicates duplicates were "
                              "identified.")
+    parser.add_argument("--threads", default=1, type=int,
+                        help="Number of worker processes used to check "
+                             "contigs in parallel; requires that all BAM "
+                             "files are indexed [default: %(default)s]")
 
     return parser.parse_args(argv)
 
@@ -79,7 +83,7 @@ def main(argv):
     """Main function; takes a list of arguments but excluding sys.argv[0]."""
     args = parse_args(argv)
     handler = ErrHandler(quiet=args.quiet)
-    validation.check_bam_files(args.files, handler)
+    validation.check_bam_files(args.files, handler, threads=args.threads)
 
     if args.quiet:
         print('%i' % (handler.duplicate_reads,))
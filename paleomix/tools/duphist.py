@@ -37,6 +37,9 @@ import pysam
 
 import paleomix.common.bamfiles as bamfiles
 
+from paleomix.tools.bam_stats.common import \
+    BAMCollector
+
 
 def get_template_length(record):
     """Returns the template length of the given record for paired or collapsed
@@ -78,6 +81,48 @@ def process_records(records, counts):
         counts[count] += 1
 
 
+def write_histogram(counts, filename):
+    """Writes a histogram (count -> number of occurrences) to 'filename',
+    or to STDOUT if 'filename' is '-'."""
+    if filename == "-":
+        handle = sys.stdout
+    else:
+        handle = open(filename, "w")
+
+    try:
+        for (key, count) in sorted(counts.iteritems()):
+            handle.write("%i\t%i\n" % (key, count))
+    finally:
+        if handle is not sys.stdout:
+            handle.close()
+
+
+class DuplicateCollector(BAMCollector):
+    """Collects a histogram of PCR duplicates, and writes this to 'filename';
+    see 'paleomix.tools.bam_stats.common.scan_bam_file'."""
+
+    include_duplicates = True
+
+    def __init__(self, filename):
+        self._filename = filename
+        self._counts = collections.defaultdict(int)
+        self._owned_start = 0
+
+    def begin_region(self, region):
+        self._owned_start = region.owned_start
+
+    def process_position(self, position, records):
+        if position >= self._owned_start:
+            process_records(records, self._counts)
+
+    def merge(self, other):
+        for (key, count) in other._counts.iteritems():
+            self._counts[key] += count
+
+    def finalize(self):
+        write_histogram(self._counts, self._filename)
+
+
 def parse_args(argv):
     prog = "paleomix duphist"
     usage = "%s sorted.bam > out.histogram" % (prog,)
@@ -99,8 +144,7 @@ def main(argv):
             for (_, records) in region:
                 process_records(records, counts)
 
-    for (key, count) in sorted(counts.iteritems()):
-        print "%i\t%i" % (key, count)
+    write_histogram(counts, "-")
 
 
 if __name__ == '__main__':
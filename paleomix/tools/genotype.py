@@ -45,6 +45,7 @@ import multiprocessing
 import pysam
 
 from paleomix.common.bedtools import \
+    BEDIndex, \
     read_bed_file, \
     sort_bed_by_bamfile
 
@@ -296,30 +297,6 @@ def init_worker_thread():
 ###############################################################################
 ###############################################################################
 
-def merge_bed_regions(regions):
-    """Takes a sequence of bed regions [(contig, start, end), ...], which is
-    assumed to be sorted by contig and coordiates, and returns a list in which
-    overlapping records are merged into one larger region.
-    """
-    merged = []
-    last_contig = last_start = last_end = None
-    for record in regions:
-        if (record.contig != last_contig) or (record.start > last_end):
-            if last_contig is not None:
-                merged.append((last_contig, last_start, last_end))
-            last_contig = record.contig
-            last_start = record.start
-            last_end = record.end
-        else:
-            last_start = min(last_start or 0, record.start)
-            last_end = max(last_end, record.end)
-
-    if last_contig is not None:
-        merged.append((last_contig, last_start, last_end))
-
-    return merged
-
-
 def create_batches(args, regions):
     """Yields a sequence of batches that may be passed to the 'run_batch'
     function; each batch consists of the 'args' object, a set of BED regions,
@@ -409,7 +386,7 @@ def collect_regions(bedfile, bam_input_handle):
     if bedfile is not None:
         regions = list(read_bed_file(bedfile))
         sort_bed_by_bamfile(bam_input_handle, regions)
-        regions = merge_bed_regions(regions)
+        regions = BEDIndex(regions).merged()
     else:
         regions = []
         for (name, length) in zip(bam_input_handle.references,
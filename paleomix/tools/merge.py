@@ -0,0 +1,236 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""paleomix merge [options] in1.bam in2.bam [...] > out.bam
+
+Merges one or more coordinate-sorted BAM files into a single sorted BAM file,
+using a k-way merge of the reads in each file. The resulting header contains
+the union of the read-groups, programs, and comments in each file; all files
+must have identical sequence dictionaries.
+
+By default, the merged BAM is written without compression (BGZip blocks with
+compression level 0) and is intended to be piped directly into another tool.
+"""
+import argparse
+import sys
+
+import pysam
+
+from paleomix.common.utilities import \
+    chain_sorted
+
+
+class BAMMergeError(RuntimeError):
+    pass
+
+
+def merge_headers(headers):
+    """Returns a header containing the union of the read-groups (RG),
+    programs (PG), and comments (CO) in a list of BAM headers (as returned by
+    pysam), and a list of dictionaries containing the program IDs that were
+    renamed for each header. Read-groups sharing an ID must be identical,
+    while programs with conflicting IDs are renamed by adding a numeric
+    suffix, as done by Picard MergeSamFiles.
+    """
+    headers = [_header_to_dict(header) for header in headers]
+    sequences = headers[0].get("SQ", [])
+    for header in headers[1:]:
+        if header.get("SQ", []) != sequences:
+            raise BAMMergeError("BAM files contain different sequences; "
+                                "cannot merge files aligned against "
+                                "different reference genomes")
+
+    merged = {"HD": {"VN": headers[0].get("HD", {}).get("VN", "1.0"),
+                     "SO": "coordinate"},
+              "SQ": sequences}
+
+    readgroups = []
+    readgroups_by_id = {}
+    for header in headers:
+        for record in header.get("RG", ()):
+            other = readgroups_by_id.get(record["ID"])
+            if other is None:
+                readgroups_by_id[record["ID"]] = record
+                readgroups.append(record)
+            elif other != record:
+                raise BAMMergeError("Conflicting @RG records with ID %r"
+                                    % (record["ID"],))
+
+    programs = []
+    programs_by_id = {}
+    renamed_programs = []
+    for header in headers:
+        renamed = _rename_programs(programs_by_id, header.get("PG", ()))
+        for record in header.get("PG", ()):
+            record = _update_program(record, renamed)
+            if record["ID"] not in programs_by_id:
+                programs_by_id[record["ID"]] = record
+                programs.append(record)
+
+        renamed_programs.append(renamed)
+
+    comments = []
+    for header in headers:
+        for comment in header.get("CO", ()):
+            if comment not in comments:
+                comments.append(comment)
+
+    for (key, values) in (("RG", readgroups),
+                          ("PG", programs),
+                          ("CO", comments)):
+        if values:
+            merged[key] = values
+
+    return merged, renamed_programs
+
+
+def _rename_programs(programs_by_id, records):
+    """Returns a dictionary of new IDs for program records conflicting with
+    previously merged records; records referring to a renamed record (PP)
+    may themselves need to be renamed, so this is repeated until no further
+    records are renamed."""
+    renamed = {}
+    while True:
+        updated = {}
+        for record in records:
+            key = record["ID"]
+            record = _update_program(record, renamed)
+            record["ID"] = key
+            suffix = 0
+            while programs_by_id.get(record["ID"], record) != record:
+                suffix += 1
+                record["ID"] = "%s.%i" % (key, suffix)
+
+            if suffix:
+                updated[key] = record["ID"]
+
+        if updated == renamed:
+            return renamed
+
+        renamed = updated
+
+
+def _update_program(record, renamed):
+    record = dict(record)
+    if "PP" in record:
+        record["PP"] = renamed.get(record["PP"], record["PP"])
+
+    record["ID"] = renamed.get(record["ID"], record["ID"])
+
+    return record
+
+
+def merge_records(handles, renamed_programs):
+    """Yields the records in a set of sorted BAM handles, sorted by reference
+    ID and position; unmapped reads without coordinates are returned last.
+    Raises BAMMergeError if a file is not sorted."""
+    sequences = [_read_sorted(handle, renamed)
+                 for (handle, renamed) in zip(handles, renamed_programs)]
+
+    return chain_sorted(*sequences, key=_key_by_tid_pos)
+
+
+def _read_sorted(handle, renamed_programs):
+    last_key = (-1, -1)
+    for record in handle:
+        key = _key_by_tid_pos(record)
+        if key < last_key:
+            raise BAMMergeError("BAM file %r is not sorted by coordinate"
+                                % (handle.filename,))
+        elif renamed_programs and record.has_tag("PG"):
+            program = record.get_tag("PG")
+            record.set_tag("PG", renamed_programs.get(program, program), "Z")
+
+        last_key = key
+        yield record
+
+
+def _header_to_dict(header):
+    # Pysam v0.14+ returns AlignmentHeader objects rather than dicts
+    if hasattr(header, "to_dict"):
+        return header.to_dict()
+
+    return header
+
+
+def _key_by_tid_pos(record):
+    tid = record.reference_id
+    if tid < 0:
+        # Unmapped reads without coordinates are placed last
+        return (sys.maxsize, 0)
+
+    return (tid, record.reference_start)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="paleomix merge",
+                                     usage=__doc__.split("\n", 1)[0])
+    parser.add_argument("files", nargs="+",
+                        help="One or more coordinate-sorted BAM files.")
+    parser.add_argument("--output", default="-",
+                        help="Output BAM file; if not set, the merged BAM is "
+                             "written to STDOUT [default: %(default)s].")
+    parser.add_argument("--compress", default=False, action="store_true",
+                        help="Compress the output BAM using the default "
+                             "compression level; by default output is not "
+                             "compressed [default: %(default)s].")
+
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    if args.output == "-" and sys.stdout.isatty():
+        sys.stderr.write("STDOUT is a terminal, terminating!\n")
+        return 1
+
+    handles = []
+    try:
+        for filename in args.files:
+            handles.append(pysam.AlignmentFile(filename, "rb"))
+
+        for handle in handles:
+            sort_order = handle.header.get("HD", {}).get("SO")
+            if sort_order != "coordinate":
+                sys.stderr.write("ERROR: BAM file %r is not sorted by "
+                                 "coordinate (SO:%s)\n"
+                                 % (handle.filename, sort_order))
+                return 1
+
+        header, renamed_programs \
+            = merge_headers([handle.header for handle in handles])
+        mode = "wb" if args.compress else "wb0"
+        with pysam.AlignmentFile(args.output, mode, header=header) as output:
+            for record in merge_records(handles, renamed_programs):
+                output.write(record)
+    except BAMMergeError, error:
+        sys.stderr.write("ERROR: %s\n" % (error,))
+        return 1
+    finally:
+        for handle in handles:
+            handle.close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -23,6 +23,7 @@
 import optparse
 
 import paleomix
+import paleomix.batch
 
 import paleomix.tools.phylo_pipeline.parts.genotype as genotype
 import paleomix.tools.phylo_pipeline.parts.msa as msa
@@ -34,6 +35,8 @@ from paleomix.config import \
      ConfigError, \
      PerHostValue, \
      PerHostConfig
+from paleomix.common.text import \
+     parse_size
 
 
 _DESCRIPTION = \
@@ -105,6 +108,31 @@ def _run_config_parser(argv):
                      help = "Maximum number of threads to use for each instance of ExaML [%default]")
     group.add_option("--max-threads",        default = per_host_cfg.max_threads, type = int,
                      help = "Maximum number of threads to use in total [%default]")
+    group.add_option("--max-memory",         default = PerHostValue("0"),
+                     help = "Maximum amount of memory used by simultaneously running tasks, "
+                            "e.g. '64g'; memory usage is currently only known for Java "
+                            "programs. Set to 0 to disable [%default]")
+    group.add_option("--max-io-jobs",        default = PerHostValue(0), type = int,
+                     help = "Maximum number of simultaneously running I/O intensive tasks. "
+                            "Set to 0 to disable [%default]")
+    group.add_option("--worker-port",        default = PerHostValue(0), type = int,
+                     help = "If set, tasks are not run on the current host, but by workers "
+                            "(see 'paleomix worker') connecting to the pipeline on the "
+                            "specified port. Set to 0 to disable [%default]")
+    group.add_option("--batch-system",       default = PerHostValue(""),
+                     help = "If set, tasks are submitted as jobs to the specified batch "
+                            "system (one of %s); task files are written to the --temp-root, "
+                            "which must be accessible from all hosts [%%default]"
+                            % (", ".join(sorted(paleomix.batch.BATCH_SYSTEMS))))
+    group.add_option("--batch-submit",       default = PerHostValue(""),
+                     help = "Command used to submit jobs to the batch system, replacing the "
+                            "default command; see paleomix/batch.py for supported fields "
+                            "[%default]")
+    group.add_option("--use-checksums",      default = False, action="store_true",
+                     help = "Do not re-run tasks if the timestamps of input files have "
+                            "changed, but the contents have not, as determined using "
+                            "checksums recorded for tasks run with this option enabled "
+                            "[%default]")
     group.add_option("--dry-run",            default = False, action="store_true",
                      help = "If passed, only a dry-run in performed, the dependency tree is printed, "
                             "and no tasks are executed.")
@@ -136,6 +164,12 @@ def _run_config_parser(argv):
     group.add_option("--list-executables", action="store_true", default=False,
                      help="List all executables required by the pipeline, "
                           "with version requirements (if any).")
+    group.add_option("--refresh-version-cache", action="store_true",
+                     default=False,
+                     help="Re-run all version checks for required "
+                          "executables, rather than using the outputs "
+                          "cached in ~/.paleomix/versions.json for "
+                          "executables that have not changed.")
     parser.add_option_group(group)
 
     parser.add_option("--to-dot-file", dest="dot_file",
@@ -148,6 +182,20 @@ def parse_config(argv):
     options, args = _run_config_parser(argv)
     paleomix.ui.set_ui_colors(options.ui_colors)
 
+    try:
+        options.max_memory = parse_size(options.max_memory)
+    except ValueError, error:
+        raise ConfigError("Invalid value for --max-memory: %s" % (error,))
+
+    if options.batch_system \
+            and options.batch_system not in paleomix.batch.BATCH_SYSTEMS:
+        raise ConfigError("Unknown --batch-system %r; must be one of %s"
+                          % (options.batch_system,
+                             ", ".join(sorted(paleomix.batch.BATCH_SYSTEMS))))
+    elif options.worker_port and options.batch_system:
+        raise ConfigError("--worker-port and --batch-system cannot be used "
+                          "at the same time")
+
     if args and args[0] in ("example", "examples"):
         return options, args
     elif (len(args) < 2) and (args != ["mkfile"] and args != ["makefile"]):
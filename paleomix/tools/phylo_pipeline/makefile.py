@@ -21,7 +21,6 @@
 # SOFTWARE.
 #
 import os
-import pysam
 import types
 
 import paleomix.common.makefile
@@ -55,7 +54,7 @@ from paleomix.common.console import \
     print_info, \
     print_warn
 from paleomix.common.text import \
-    parse_padded_table
+    read_table_file
 from paleomix.common.bedtools import \
     read_bed_file, \
     BEDError
@@ -331,6 +330,8 @@ def _check_bam_sequences(options, mkfile, steps):
     overhead of reading the BAM file headers.
 
     """
+    import pysam
+
     if ("genotype" not in steps) and ("genotyping" not in steps):
         return
 
@@ -484,20 +485,21 @@ def _read_max_depth(filename, prefix, sample):
     max_depth = None
     max_depths = {}
     try:
-        with open(filename) as handle:
-            for row in parse_padded_table(handle):
-                if row["Name"] != "*" and \
-                        row["Sample"] == "*" and \
-                        row["Library"] == "*" and \
-                        row["Contig"] == "*":
-
-                    if row["Name"] in max_depths:
-                        raise MakefileError("Depth histogram %r contains "
-                                            "multiple 'MaxDepth' records for "
-                                            "sample %r; please rebuild!"
-                                            % (filename, row["Name"]))
-
-                    max_depths[row["Name"]] = row["MaxDepth"]
+        header, rows = read_table_file(filename)
+        for values in rows:
+            row = dict(zip(header, values))
+            if row["Name"] != "*" and \
+                    row["Sample"] == "*" and \
+                    row["Library"] == "*" and \
+                    row["Contig"] == "*":
+
+                if row["Name"] in max_depths:
+                    raise MakefileError("Depth histogram %r contains "
+                                        "multiple 'MaxDepth' records for "
+                                        "sample %r; please rebuild!"
+                                        % (filename, row["Name"]))
+
+                max_depths[row["Name"]] = str(row["MaxDepth"])
     except (OSError, IOError), error:
         raise MakefileError("Error reading depth-histogram (%s): %s"
                             % (filename, error))
@@ -25,11 +25,12 @@ import os
 import sys
 import time
 
+import paleomix.batch
 import paleomix.logger
 import paleomix.resources
 import paleomix.tools.phylo_pipeline.mkfile as mkfile
 import paleomix.ui
-import paleomix.yaml
+import paleomix.workers
 
 from paleomix.pipeline import Pypeline
 from paleomix.common.console import print_err
@@ -89,12 +90,28 @@ def main(argv):
                   % (config.temp_root,))
         return 1
 
+    executor = None
+    if config.worker_port:
+        try:
+            executor = paleomix.workers.WorkerExecutor(("", config.worker_port))
+        except EnvironmentError, error:
+            print_err("ERROR: Could not listen for workers on port %i: %s"
+                      % (config.worker_port, error))
+            return 1
+    elif config.batch_system:
+        submitter = paleomix.batch.CommandSubmitter.from_system(
+            config.batch_system, config.batch_submit or None)
+        executor = paleomix.batch.BatchExecutor(
+            submitter, os.path.join(config.temp_root, "batch"))
+
     # Init worker-threads before reading in any more data
-    pipeline = Pypeline(config)
+    pipeline = Pypeline(config, executor=executor)
+
+    import paleomix.yaml as paleo_yaml
 
     try:
         makefiles = read_makefiles(config, args, commands)
-    except (MakefileError, paleomix.yaml.YAMLError, IOError), error:
+    except (MakefileError, paleo_yaml.YAMLError, IOError), error:
         print_err("Error reading makefiles:",
                   "\n  %s:\n   " % (error.__class__.__name__,),
                   "\n    ".join(str(error).split("\n")))
@@ -131,6 +148,10 @@ def main(argv):
         return 0
 
     if not pipeline.run(max_threads=config.max_threads,
+                        max_memory=config.max_memory,
+                        max_io_jobs=config.max_io_jobs,
+                        use_checksums=config.use_checksums,
+                        refresh_version_cache=config.refresh_version_cache,
                         dry_run=config.dry_run,
                         progress_ui=config.progress_ui):
         return 1
@@ -19,10 +19,19 @@ using the BAM record flags, are not filtered, but simply written to the output.
 By default, filtered reads are flagged using the "duplicate" flag (0x400), and
 written to the output. Use the --remove-duplicates command-line option to
 instead remove these records from the output.
+
+If the input BAM is indexed, the --threads option may be used to process sets
+of contigs in parallel; the resulting BAMs are concatenated in order, followed
+by any unmapped reads. The records written are identical to those written when
+using a single thread.
 """
 import collections
+import multiprocessing
+import os
 import random
+import shutil
 import sys
+import tempfile
 
 from argparse import ArgumentParser
 
@@ -38,6 +47,16 @@ _FILTERED_FLAGS |= 0x800  # Chimeric alignment
 _CIGAR_SOFTCLIP = 4
 _CIGAR_HARDCLIP = 5
 
+# Empty BGZip block terminating BAM files
+_BGZF_EOF = "\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00\x42" \
+    "\x43\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+# Number of tasks generated per thread, to balance work between workers
+_TASKS_PER_THREAD = 4
+
+
+class BAMConcatError(RuntimeError):
+    pass
+
 
 def read_quality(read):
     qualities = read.query_alignment_qualities
@@ -48,6 +67,17 @@ def read_quality(read):
     return sum(qualities)
 
 
+def seed_for_reference(args, reference_id):
+    """Re-seeds the RNG used to select among reads without quality scores
+    when a new contig is processed, if a seed was specified; this ensures that
+    the same reads are selected regardless of how contigs are split between
+    worker processes (see --threads).
+    """
+    if args.seed is not None and args.seeded_reference_id != reference_id:
+        random.seed((args.seed, reference_id))
+        args.seeded_reference_id = reference_id
+
+
 def copy_number(read):
     # has_tag is faster than try/except, since most reads lack the tag.
     if read.has_tag('XP'):
@@ -71,21 +101,23 @@ def mark_duplicate_reads(reads):
                                      for cigar, values in by_cigar.iteritems())
     best_cigar_len = -best_cigar_len
 
-    best_read = None
-    best_quality = -1
     copies = len(reads)
-
+    best_candidates = []
     for cigar, candidates in by_cigar.iteritems():
         if len(cigar) == best_cigar_len and len(candidates) == best_count:
-            for read in candidates:
-                copies += copy_number(read)
-                quality = read_quality(read)
+            best_candidates.extend(candidates)
 
-                if quality > best_quality:
-                    best_read = read
-                    best_quality = quality
-        else:
-            copies += sum(copy_number(read) for read in candidates)
+        copies += sum(copy_number(read) for read in candidates)
+
+    # Qualities are only summed if there is more than one candidate
+    best_read = best_candidates[0]
+    if len(best_candidates) > 1:
+        best_quality = -1
+        for read in best_candidates:
+            quality = read_quality(read)
+            if quality > best_quality:
+                best_read = read
+                best_quality = quality
 
     best_read.set_tag('XP', copies, 'i')
     for read in reads:
@@ -99,6 +131,7 @@ def write_read(args, out, read_and_alignment, duplicates_by_alignment):
 
         if len(duplicates) > 1:
             # Select the best read and mark the others as duplicates.
+            seed_for_reference(args, alignment[0])
             mark_duplicate_reads(duplicates)
         else:
             duplicates[0].is_duplicate = False
@@ -215,6 +248,124 @@ def process(args, infile, outfile):
     return 0
 
 
+def build_tasks(args, infile):
+    """Splits contigs into sets of consecutive contigs of roughly equal total
+    length, processed by worker processes; reads that have not been mapped to
+    a contig ("*") are processed last."""
+    total = sum(infile.lengths)
+    ntasks = max(1, min(infile.nreferences, args.threads * _TASKS_PER_THREAD))
+
+    tasks = [[]]
+    cumulative = 0
+    for (name, length) in zip(infile.references, infile.lengths):
+        if tasks[-1] and cumulative >= (total * len(tasks)) // ntasks:
+            tasks.append([])
+
+        tasks[-1].append(name)
+        cumulative += length
+
+    if not tasks[-1]:
+        tasks.pop()
+    tasks.append(["*"])
+
+    return tasks
+
+
+def process_contigs(task):
+    """Processes a set of contigs in a worker process, writing the resulting
+    BAM to 'filename'; returns the return-code of 'process'."""
+    args, filename, contigs = task
+    if args.seed is None:
+        # Avoid worker processes inheriting the same state from the parent
+        random.seed()
+
+    with pysam.AlignmentFile(args.input, "rb") as infile:
+        with pysam.AlignmentFile(filename, "wb", template=infile) as outfile:
+            for contig in contigs:
+                if process(args, infile.fetch(contig), outfile):
+                    return 1
+
+    return 0
+
+
+def concatenate_bam_files(header_fname, filenames, outfile):
+    """Writes the BAM in 'header_fname' to 'outfile', followed by the records
+    in each of 'filenames', by concatenating the BGZip compressed data, and
+    terminates the output with an empty BGZip block. All files must have been
+    written using the same header as 'header_fname', which is expected to
+    contain no records.
+
+    This works as htslib flushes the BGZip stream after writing the header,
+    so that records always start in a new BGZip block.
+    """
+    with open(header_fname, "rb") as handle:
+        header = handle.read()
+
+    if not header.endswith(_BGZF_EOF):
+        raise BAMConcatError("BAM header not terminated by EOF block")
+
+    header = header[:-len(_BGZF_EOF)]
+    outfile.write(header)
+
+    for filename in filenames:
+        size = os.path.getsize(filename) - len(header) - len(_BGZF_EOF)
+        with open(filename, "rb") as handle:
+            if handle.read(len(header)) != header or size < 0:
+                raise BAMConcatError("BAM header of %r does not match "
+                                     "expected header" % (filename,))
+
+            while size > 0:
+                block = handle.read(min(size, 64 * 1024))
+                if not block:
+                    raise BAMConcatError("Unexpected end of file in %r"
+                                         % (filename,))
+                outfile.write(block)
+                size -= len(block)
+
+            if handle.read() != _BGZF_EOF:
+                raise BAMConcatError("BAM %r not terminated by EOF block"
+                                     % (filename,))
+
+    outfile.write(_BGZF_EOF)
+
+
+def process_parallel(args, infile, outfile):
+    """Processes sets of contigs in worker processes, and writes the resulting
+    (BGZip compressed) BAM to the file object 'outfile'; see 'process'. The
+    input BAM must be indexed."""
+    tasks = build_tasks(args, infile)
+    temp_root = tempfile.mkdtemp(prefix="rmdup_collapsed_")
+    try:
+        header_fname = os.path.join(temp_root, "header.bam")
+        with pysam.AlignmentFile(header_fname, "wb", template=infile):
+            pass
+
+        filenames = []
+        for (index, contigs) in enumerate(tasks):
+            filename = os.path.join(temp_root, "%06i.bam" % (index,))
+            filenames.append(filename)
+            tasks[index] = (args, filename, contigs)
+
+        pool = multiprocessing.Pool(args.threads)
+        try:
+            for returncode in pool.imap(process_contigs, tasks):
+                if returncode:
+                    pool.terminate()
+                    return returncode
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+        concatenate_bam_files(header_fname, filenames, outfile)
+    finally:
+        shutil.rmtree(temp_root)
+
+    return 0
+
+
 def parse_args(argv):
     parser = ArgumentParser(usage=__doc__)
     parser.add_argument("input", default="-", nargs="?",
@@ -227,8 +378,16 @@ def parse_args(argv):
                         help="Seed used for randomly selecting representative "
                              "reads when no reads have quality scores assigned"
                              "[default: initialized using system time].")
+    parser.add_argument("--threads", default=1, type=int,
+                        help="Number of worker processes used to process "
+                             "contigs in parallel; requires that the BAM file "
+                             "is indexed [default: %(default)s]")
+
+    args = parser.parse_args(argv)
+    # Contig for which the RNG was last seeded; see 'seed_for_reference'
+    args.seeded_reference_id = None
 
-    return parser.parse_args(argv)
+    return args
 
 
 def main(argv):
@@ -245,6 +404,13 @@ def main(argv):
         return 1
 
     with pysam.AlignmentFile(args.input, "rb") as infile:
+        if args.threads > 1:
+            if args.input != "-" and infile.has_index():
+                return process_parallel(args, infile, sys.stdout)
+
+            sys.stderr.write("WARNING: BAM file %r is not indexed; using 1 "
+                             "thread\n" % (args.input,))
+
         with pysam.AlignmentFile("-", "wb", template=infile) as outfile:
             return process(args, infile, outfile)
 
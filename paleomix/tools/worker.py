@@ -0,0 +1,91 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Worker process for running tasks on behalf of pipelines on other hosts.
+
+Pipelines started with the --worker-port option listen for connections from
+workers, and send tasks to connected workers instead of running these on the
+local host. The worker must be able to access the same files (paths) as the
+pipeline, e.g. via a shared / network file-system.
+"""
+import argparse
+import multiprocessing
+import sys
+
+import paleomix.logger
+import paleomix.workers
+
+
+def parse_address(value):
+    """Parses an address in the form "host[:port]"."""
+    host, _, port = value.partition(":")
+    if not port:
+        return (host, paleomix.workers.DEFAULT_PORT)
+
+    try:
+        return (host, int(port))
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid port %r" % (port,))
+
+
+def parse_args(argv):
+    prog = "paleomix worker"
+    usage = "%s [options] host[:port]" % (prog,)
+    parser = argparse.ArgumentParser(prog=prog, usage=usage)
+    parser.add_argument("address", type=parse_address,
+                        help="Address of host running the pipeline, and the "
+                             "port specified using --worker-port (default "
+                             "port is %i)." % (paleomix.workers.DEFAULT_PORT,))
+    parser.add_argument("--threads", type=int,
+                        default=multiprocessing.cpu_count(),
+                        help="Max number of threads used to run tasks "
+                             "[%(default)s].")
+    parser.add_argument("--log-file", default=None,
+                        help="Write log messages to the specified file, in "
+                             "addition to STDERR.")
+    parser.add_argument("--log-level", default="info",
+                        choices=("info", "warning", "error", "debug"),
+                        help="Log messages to the log-file at and above the "
+                             "specified level [%(default)s].")
+
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    """Main function; takes a list of arguments equivalent to sys.argv[1:]."""
+    args = parse_args(argv)
+    if args.threads < 1:
+        sys.stderr.write("ERROR: --threads must be at least 1\n")
+        return 1
+
+    paleomix.logger.initialize(args)
+
+    try:
+        return paleomix.workers.run_worker(args.address, args.threads)
+    except (IOError, OSError), error:
+        sys.stderr.write("ERROR: Could not connect to pipeline at %s:%i: %s\n"
+                         % (args.address + (error,)))
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
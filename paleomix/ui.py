@@ -113,6 +113,11 @@ class CommandLine(object):
             # Restore settings (re-enable echo)
             termios.tcsetattr(sys.stdin, termios.TCSADRAIN, self._tty_settings)
 
+    @property
+    def is_interactive(self):
+        """True if key-presses are read from STDIN; see process_key_presses."""
+        return bool(self._tty_settings)
+
     def process_key_presses(self, nodegraph, max_threads, ui):
         if not self._tty_settings:
             return max_threads
@@ -173,6 +178,8 @@ class BaseUI(object):
       - states  -- List containing the observed number of states
                    for a state-value corresponding to the index
       - threads -- Est. number of threads used by running nodes.
+      - remaining_work -- Est. amount of work (in thread-seconds) remaining
+                   for unfinished nodes, or None if no estimate is available.
 
     These properties should be treated as read-only.
     """
@@ -183,8 +190,13 @@ class BaseUI(object):
         self.threads = 0
         self.max_threads = 0
         self.start_time = None
+        self.remaining_work = None
         self._end_time = None
         self._updated = True
+        # Estimated work (runtime * threads) for unfinished nodes
+        self._estimates = {}
+        # Start time of running nodes for which estimates are available
+        self._running = {}
 
     def flush(self):
         """Called by the user of the UI to ensure that the UI to print
@@ -236,6 +248,22 @@ class BaseUI(object):
         self.states, self.threads \
             = self._count_states(nodegraph, nodegraph.iterflat())
 
+        self._estimates = {}
+        self._running = {}
+        self.remaining_work = None
+        for node in nodegraph.iterflat():
+            state = nodegraph.get_node_state(node)
+            if state not in (self.DONE, self.ERROR):
+                estimate = nodegraph.get_runtime_estimate(node)
+                if estimate is not None:
+                    self._estimates[node] = estimate * node.threads
+
+                    if state == self.RUNNING:
+                        self._running[node] = time.time()
+
+        if self._estimates:
+            self.remaining_work = sum(self._estimates.itervalues())
+
     def state_changed(self, node, old_state, new_state, _is_primary):
         """Observer function for NodeGraph; counts states of nodes."""
         self._updated = True
@@ -244,8 +272,16 @@ class BaseUI(object):
         self.states[new_state] += 1
         if old_state == self.RUNNING:
             self.threads -= node.threads
+            self._running.pop(node, None)
         elif new_state == self.RUNNING:
             self.threads += node.threads
+            if node in self._estimates:
+                self._running[node] = time.time()
+
+        if new_state in (self.DONE, self.ERROR):
+            estimate = self._estimates.pop(node, None)
+            if estimate is not None:
+                self.remaining_work -= estimate
 
         if self.start_time is None:
             self.start_time = time.time()
@@ -288,11 +324,33 @@ class BaseUI(object):
 
         fields.extend(('%i done of %i tasks' % (self.states[self.DONE],
                                                 sum(self.states),),
-                       ' in ', _fmt_runtime(runtime),
-                       '; press \'h\' for help.'))
+                       ' in ', _fmt_runtime(runtime)))
+
+        eta = self._estimate_time_remaining()
+        if eta is not None:
+            fields.append(', ~%s remaining' % (_fmt_runtime(eta),))
+
+        fields.append('; press \'h\' for help.')
 
         return ''.join(fields)
 
+    def _estimate_time_remaining(self):
+        """Returns the estimated time remaining (in seconds) until all nodes
+        have finished running, based on runtimes recorded in previous runs
+        (see NodeGraph.get_runtime_estimate), or None if no estimate could
+        be made."""
+        if self.remaining_work is None:
+            return None
+
+        # Subtract work already carried out by running nodes
+        current_time = time.time()
+        remaining_work = self.remaining_work
+        for (node, start_time) in self._running.iteritems():
+            elapsed = (current_time - start_time) * node.threads
+            remaining_work -= min(elapsed, self._estimates[node])
+
+        return max(0, remaining_work) / max(1, self.max_threads)
+
     DONE = paleomix.nodegraph.NodeGraph.DONE
     RUNNING = paleomix.nodegraph.NodeGraph.RUNNING
     RUNABLE = paleomix.nodegraph.NodeGraph.RUNABLE
@@ -0,0 +1,404 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Execution of nodes by worker processes on other hosts.
+
+A pipeline using a WorkerExecutor listens for connections from workers (see
+'paleomix worker'), which may be run on any host sharing the file-system with
+the host running the pipeline. Nodes are sent to workers (pickled) as long
+as they have enough idle threads, and workers report back when nodes have
+finished running. Workers send regular heartbeats, and nodes running on
+workers that disconnect or stop responding are re-queued.
+
+Connections are authenticated using a key stored in the users' home folder
+(see 'get_authkey'), which is assumed to be shared between hosts.
+"""
+import Queue
+import collections
+import errno
+import io
+import logging
+import multiprocessing.connection
+import os
+import pickle
+import select
+import socket
+import threading
+import time
+
+import paleomix.pipeline
+
+from paleomix.node import \
+    NodeUnhandledException
+
+
+# Default port used by pipelines to listen for workers
+DEFAULT_PORT = 48219
+
+# Interval (in seconds) between heartbeats sent by workers
+HEARTBEAT_INTERVAL = 10
+
+# Number of seconds without messages after which a worker is assumed dead
+_HEARTBEAT_TIMEOUT = 6 * HEARTBEAT_INTERVAL
+
+# Location of the key used to authenticate workers, relative to home folder
+_AUTHKEY_PATH = os.path.join(".paleomix", "worker.key")
+
+
+class WorkerExecutor(paleomix.pipeline.BaseExecutor):
+    """Executor that runs nodes using workers connecting to the pipeline; the
+    number of available threads is the sum of threads offered by workers.
+    """
+
+    timeout = HEARTBEAT_INTERVAL
+
+    def __init__(self, address=("", DEFAULT_PORT), authkey=None,
+                 heartbeat_timeout=_HEARTBEAT_TIMEOUT):
+        if authkey is None:
+            authkey = get_authkey()
+
+        self._logger = logging.getLogger(__name__)
+        self._authkey = authkey
+        # Authentication is performed by handshake threads (see '_accept')
+        self._listener = multiprocessing.connection.Listener(address)
+        # Connections / errors from handshake threads: (conn, message / error)
+        self._accepted = Queue.Queue()
+        # Connections for which the handshake has not yet completed
+        self._handshakes = set()
+        # Pipe written to by handshake threads, to wake up the pipeline; the
+        # lock prevents writes to the pipe once it has been closed
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        self._wakeup_lock = threading.Lock()
+        self._heartbeat_timeout = heartbeat_timeout
+        # Connection -> _WorkerState
+        self._workers = {}
+        # Nodes taken from dead workers: (key, node, config)
+        self._requeued = collections.deque()
+        # Nodes that have finished running: (key, error)
+        self._finished = []
+        self._waiting_for_workers = False
+
+    @property
+    def address(self):
+        """Returns the (host, port) that workers should connect to."""
+        return self._listener.address
+
+    @property
+    def handles(self):
+        # multiprocessing.connection.Listener does not expose its socket
+        return [self._listener._listener._socket, self._wakeup_r] \
+            + list(self._workers)
+
+    def get_max_threads(self, _max_threads):
+        return sum(state.threads for state in self._workers.itervalues())
+
+    def start(self, key, node, config):
+        if self._requeued or not self._dispatch(key, node, config):
+            return False
+
+        return True
+
+    def poll(self):
+        readable = self._select(self.handles, 0)
+        if self._listener._listener._socket in readable:
+            self._accept()
+        if self._wakeup_r in readable:
+            os.read(self._wakeup_r, io.DEFAULT_BUFFER_SIZE)
+        self._add_accepted_workers()
+
+        if not (self._workers or self._waiting_for_workers):
+            self._logger.info("Waiting for workers to connect to %s:%i"
+                              % self.address)
+            self._waiting_for_workers = True
+
+        current_time = time.time()
+        for (conn, state) in self._workers.items():
+            try:
+                while conn.poll():
+                    self._handle_message(state, conn.recv())
+            except (EOFError, IOError, OSError), error:
+                self._remove_worker(conn, "connection lost (%s)" % (error,))
+                continue
+
+            if current_time - state.last_seen > self._heartbeat_timeout:
+                self._remove_worker(conn, "no heartbeat")
+
+        while self._requeued:
+            if not self._dispatch(*self._requeued[0]):
+                break
+            self._requeued.popleft()
+
+        finished, self._finished = self._finished, []
+        return finished
+
+    def close(self):
+        for conn in self._workers:
+            try:
+                conn.send(("shutdown",))
+            except (IOError, OSError):
+                pass  # Worker has already terminated
+        self.terminate()
+
+    def terminate(self):
+        for conn in self._workers:
+            conn.close()
+        self._workers.clear()
+        self._listener.close()
+
+        with self._wakeup_lock:
+            # Wake up handshake threads blocked on stalled connections
+            for conn in self._handshakes:
+                _shutdown_connection(conn)
+
+            while not self._accepted.empty():
+                conn, _ = self._accepted.get()
+                if conn is not None:
+                    conn.close()
+
+            if self._wakeup_w is not None:
+                os.close(self._wakeup_r)
+                os.close(self._wakeup_w)
+                self._wakeup_r = self._wakeup_w = None
+
+    def _accept(self):
+        """Accepts a connection, and authenticates it in a daemon thread, so
+        that peers that stall during the handshake cannot block the pipeline;
+        the result is collected by '_add_accepted_workers'."""
+        try:
+            # Accepts the connection without performing the handshake
+            conn = self._listener._listener.accept()
+        except (EnvironmentError, socket.error), error:
+            self._logger.warn("Failed to accept worker: %s" % (error,))
+            return
+
+        with self._wakeup_lock:
+            self._handshakes.add(conn)
+
+        thread = threading.Thread(target=self._handshake, args=(conn,))
+        thread.daemon = True
+        thread.start()
+
+    def _handshake(self, conn):
+        """Authenticates a connection and receives the 'hello' message from the
+        worker; runs in a daemon thread."""
+        try:
+            multiprocessing.connection.deliver_challenge(conn, self._authkey)
+            multiprocessing.connection.answer_challenge(conn, self._authkey)
+            result = (conn, conn.recv())
+        except (EOFError, IOError, OSError,
+                multiprocessing.AuthenticationError), error:
+            result = (None, error)
+
+        with self._wakeup_lock:
+            self._handshakes.discard(conn)
+            # The pipe is closed if the executor has been terminated
+            if result[0] is None or self._wakeup_w is None:
+                conn.close()
+
+            if self._wakeup_w is not None:
+                self._accepted.put(result)
+                os.write(self._wakeup_w, "\0")
+
+    def _add_accepted_workers(self):
+        while not self._accepted.empty():
+            conn, message = self._accepted.get()
+            if conn is None:
+                self._logger.warn("Failed to accept worker: %s" % (message,))
+                continue
+
+            try:
+                command, hostname, threads = message
+                if command != "hello" or threads < 1:
+                    raise ValueError(message)
+            except (TypeError, ValueError):
+                self._logger.warn("Invalid message from worker: %r"
+                                  % (message,))
+                conn.close()
+                continue
+
+            self._logger.info("Worker connected from %r with %i thread(s)"
+                              % (hostname, threads))
+            self._workers[conn] = _WorkerState(hostname, threads)
+            self._waiting_for_workers = False
+
+    def _dispatch(self, key, node, config):
+        """Sends a node to the worker with the most idle threads; returns
+        false if no worker has enough idle threads to run the node. Nodes
+        using more threads than any worker offers are sent to idle workers.
+        """
+        while self._workers:
+            conn, state = max(self._workers.iteritems(),
+                              key=lambda item: item[1].idle_threads)
+
+            if state.idle_threads < node.threads \
+                    and state.idle_threads < state.threads:
+                return False
+
+            try:
+                conn.send(("run", key, node, config))
+            except (IOError, OSError), error:
+                self._remove_worker(conn, "connection lost (%s)" % (error,))
+                continue
+
+            state.running[key] = (node, config)
+            state.idle_threads -= node.threads
+            return True
+
+        return False
+
+    def _handle_message(self, state, message):
+        state.last_seen = time.time()
+        if message[0] == "finished":
+            _, key, error = message
+            node, _ = state.running.pop(key)
+            state.idle_threads += node.threads
+            self._finished.append((key, error))
+        elif message[0] != "heartbeat":
+            self._logger.warn("Invalid message from worker %r: %r"
+                              % (state.hostname, message))
+
+    def _remove_worker(self, conn, reason):
+        state = self._workers.pop(conn)
+        conn.close()
+
+        self._logger.warn("Lost worker %r (%s); re-queuing %i task(s)"
+                          % (state.hostname, reason, len(state.running)))
+        for (key, (node, config)) in state.running.iteritems():
+            self._requeued.append((key, node, config))
+
+    @classmethod
+    def _select(cls, handles, timeout):
+        try:
+            return select.select(handles, [], [], timeout)[0]
+        except select.error, error:
+            # User pressed ctrl-c (SIGINT), or similar event ...
+            if error.args[0] != errno.EINTR:
+                raise
+            return []
+
+
+def _shutdown_connection(conn):
+    """Shuts down the socket used by a multiprocessing Connection, waking up
+    any thread blocked reading from or writing to that connection."""
+    try:
+        sock = socket.fromfd(conn.fileno(), socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        finally:
+            sock.close()
+    except (IOError, OSError, socket.error):
+        pass  # Connection already closed
+
+
+class _WorkerState(object):
+    """State of a worker connected to a WorkerExecutor."""
+
+    def __init__(self, hostname, threads):
+        self.hostname = hostname
+        self.threads = threads
+        self.idle_threads = threads
+        self.last_seen = time.time()
+        # Key -> (node, config)
+        self.running = {}
+
+
+def run_worker(address, threads, authkey=None):
+    """Connects to a pipeline listening on 'address', and runs nodes sent by
+    that pipeline using up to 'threads' threads, until the pipeline has
+    finished. Returns 0 if the pipeline shut down the worker, and 1 if the
+    connection was lost."""
+    if authkey is None:
+        authkey = get_authkey()
+
+    logger = logging.getLogger(__name__)
+    conn = multiprocessing.connection.Client(address, authkey=authkey)
+    conn.send(("hello", socket.gethostname(), threads))
+
+    executor = paleomix.pipeline.LocalExecutor()
+    executor.set_max_threads(threads)
+    last_heartbeat = time.time()
+
+    try:
+        while True:
+            handles = [conn] + executor.handles
+            WorkerExecutor._select(handles, HEARTBEAT_INTERVAL)
+
+            while conn.poll():
+                message = conn.recv()
+                if message[0] == "run":
+                    _, key, node, config = message
+                    logger.info("Running %s" % (node,))
+                    executor.start(key, node, config)
+                elif message[0] == "shutdown":
+                    executor.close()
+                    return 0
+
+            for (key, error) in executor.poll():
+                conn.send(("finished", key, _picklable_error(error)))
+
+            if time.time() - last_heartbeat >= HEARTBEAT_INTERVAL:
+                conn.send(("heartbeat",))
+                last_heartbeat = time.time()
+    except (EOFError, IOError, OSError), error:
+        logger.error("Lost connection to pipeline: %s" % (error,))
+        executor.terminate()
+        return 1
+
+
+def get_authkey():
+    """Returns the key used to authenticate workers, creating a new random key
+    if it does not already exist; the key is stored in the users' home folder,
+    which is assumed to be shared between the hosts running the pipeline and
+    the workers."""
+    filename = os.path.join(os.path.expanduser("~"), _AUTHKEY_PATH)
+    try:
+        with open(filename) as handle:
+            return handle.read().strip()
+    except IOError, error:
+        if error.errno != errno.ENOENT:
+            raise
+
+    dirname = os.path.dirname(filename)
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+
+    try:
+        handle = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0600)
+    except OSError, error:
+        # Key created by another process in the mean time
+        if error.errno != errno.EEXIST:
+            raise
+        return get_authkey()
+
+    with os.fdopen(handle, "w") as handle:
+        handle.write(os.urandom(32).encode("hex"))
+
+    return get_authkey()
+
+
+def _picklable_error(error):
+    """Returns the error, or an equivalent error if it cannot be pickled."""
+    try:
+        pickle.dumps(error)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return NodeUnhandledException(str(error))
+    return error
@@ -797,6 +797,24 @@ def test_atomiccmd__commit_with_pipes(temp_folder):
     assert_equal(set(os.listdir(temp_folder)), set())
 
 
+###############################################################################
+###############################################################################
+# memory
+
+def test_atomiccmd__memory():
+    def _do_test_atomiccmd__memory(call, expected):
+        assert_equal(AtomicCmd(call).memory, expected)
+
+    yield _do_test_atomiccmd__memory, ("ls",), 0
+    yield _do_test_atomiccmd__memory, ("java", "-Xmx4g", "-jar", "x"), \
+        4 * 1024 ** 3
+    yield _do_test_atomiccmd__memory, ("java", "-Xmx512M", "-jar", "x"), \
+        512 * 1024 ** 2
+    # The last -Xmx option takes precedence
+    yield _do_test_atomiccmd__memory, \
+        ("java", "-Xmx1g", "-Xmx2g", "-jar", "x"), 2 * 1024 ** 3
+
+
 ###############################################################################
 ###############################################################################
 # __str__
@@ -155,6 +155,17 @@ def test_atomicsets__duplicate_cmds():
     yield _do_test_atomicsets__duplicate_cmds, SequentialCmds
 
 
+def test_atomicsets__memory():
+    cmd_1 = AtomicCmd(("java", "-Xmx2g", "-jar", "a.jar"))
+    cmd_2 = AtomicCmd(("java", "-Xmx512m", "-jar", "b.jar"))
+    cmd_3 = AtomicCmd("true")
+
+    assert_equal(ParallelCmds([cmd_1, cmd_2, cmd_3]).memory,
+                 2 * 1024 ** 3 + 512 * 1024 ** 2)
+    assert_equal(SequentialCmds([cmd_1, cmd_2, cmd_3]).memory,
+                 2 * 1024 ** 3)
+
+
 ###############################################################################
 ###############################################################################
 # Parallel commands
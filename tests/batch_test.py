@@ -0,0 +1,245 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2018 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is herby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Disable warning for missing docstring
+# pylint: disable=C0111
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+import optparse
+import os
+import time
+
+from nose.tools import \
+    assert_equal, \
+    assert_is_instance
+
+from paleomix.common.testing import \
+    with_temp_folder, \
+    get_file_contents, \
+    set_file_contents
+
+from paleomix.atomiccmd.command import \
+    AtomicCmd
+
+from paleomix.node import \
+    CommandNode, \
+    NodeError
+
+from paleomix.batch import \
+    BATCH_SYSTEMS, \
+    BatchExecutor, \
+    CommandSubmitter, \
+    LocalSubmitter, \
+    run_task
+
+
+class _RecordingSubmitter(LocalSubmitter):
+    """Records submitted jobs, optionally without running them."""
+
+    def __init__(self, run=True):
+        LocalSubmitter.__init__(self)
+        self.submitted = []
+        self._run = run
+
+    def submit(self, script, count, threads, memory, output):
+        self.submitted.append((script, count, threads, memory))
+        if self._run:
+            return LocalSubmitter.submit(self, script, count, threads, memory,
+                                         output)
+
+        job_id = str(len(self.submitted))
+        self._jobs[job_id] = []
+        return job_id
+
+
+def _new_config(root):
+    # Config objects must be importable in the process running the task
+    return optparse.Values({"temp_root": root})
+
+
+def _new_node(root, filename, command="cat"):
+    in_file = os.path.join(root, "in.txt")
+    set_file_contents(in_file, "foo\n")
+    cmd = AtomicCmd((command, "%(IN_FILE)s"),
+                    IN_FILE=in_file,
+                    OUT_STDOUT=os.path.join(root, filename))
+    return CommandNode(cmd, description=filename)
+
+
+def _new_executor(root, submitter, **kwargs):
+    kwargs.setdefault("poll_interval", 0.05)
+    kwargs.setdefault("job_poll_interval", 0.05)
+    return BatchExecutor(submitter, os.path.join(root, "batch"), **kwargs)
+
+
+def _wait_for(executor, nresults):
+    results = []
+    deadline = time.time() + 30
+    while len(results) < nresults and time.time() < deadline:
+        results.extend(executor.poll())
+        time.sleep(executor.timeout)
+    return dict(results)
+
+
+###############################################################################
+###############################################################################
+# CommandSubmitter
+
+def test_command_submitter__from_system():
+    for (name, options) in BATCH_SYSTEMS.iteritems():
+        submitter = CommandSubmitter.from_system(name)
+        assert_equal(submitter.index_var, options["index_var"])
+        assert_equal(submitter.index_offset, options["index_offset"])
+
+
+def test_command_submitter__submit():
+    submitter = CommandSubmitter(submit="echo 1234;cluster {script}",
+                                 poll="true",
+                                 cancel="true",
+                                 index_var="TASK_ID")
+    assert_equal(submitter.submit("job.sh", 2, 1, 0, "job.log"), "1234")
+
+
+def test_command_submitter__submit__memory():
+    submitter = CommandSubmitter(submit="echo {threads} --mem={memory}M "
+                                        "{memory_per_thread}",
+                                 poll="true",
+                                 cancel="true",
+                                 index_var="TASK_ID")
+    # Memory is rounded up to whole MB per job / per thread
+    memory = 3 * 1024 * 1024 + 1
+    assert_equal(submitter.submit("job.sh", 2, 2, memory, "job.log"),
+                 "2 --mem=4M 2")
+    submitter = CommandSubmitter(submit="echo --mem={memory}M {threads}",
+                                 poll="true",
+                                 cancel="true",
+                                 index_var="TASK_ID")
+    # Arguments using memory fields are omitted if memory is unknown
+    assert_equal(submitter.submit("job.sh", 2, 3, 0, "job.log"), "3")
+
+
+def test_command_submitter__is_active():
+    submitter = CommandSubmitter(submit="true",
+                                 poll="echo {job_id}",
+                                 cancel="true",
+                                 index_var="TASK_ID")
+    assert submitter.is_active("1234")
+    submitter = CommandSubmitter(submit="true",
+                                 poll="false",
+                                 cancel="true",
+                                 index_var="TASK_ID")
+    assert not submitter.is_active("1234")
+
+
+###############################################################################
+###############################################################################
+# run_task / BatchExecutor
+
+@with_temp_folder
+def test_run_task__writes_result(temp_folder):
+    executor = _new_executor(temp_folder, _RecordingSubmitter(run=False))
+    node = _new_node(temp_folder, "out.txt")
+    assert executor.start("key", node, _new_config(temp_folder))
+    assert_equal(executor.poll(), [])
+
+    root = os.path.join(temp_folder, "batch")
+    (job_root,) = os.listdir(root)
+    filename = os.path.join(root, job_root, "task_0.pickle")
+    assert_equal(run_task(filename), 0)
+    assert os.path.exists(filename + ".result")
+    assert_equal(get_file_contents(os.path.join(temp_folder, "out.txt")),
+                 "foo\n")
+
+
+@with_temp_folder
+def test_batch_executor__run_nodes(temp_folder):
+    submitter = _RecordingSubmitter()
+    executor = _new_executor(temp_folder, submitter)
+    config = _new_config(temp_folder)
+    for key in xrange(3):
+        node = _new_node(temp_folder, "out_%i.txt" % (key,))
+        assert executor.start(key, node, config)
+
+    assert_equal(_wait_for(executor, 3), {0: None, 1: None, 2: None})
+    for key in xrange(3):
+        filename = os.path.join(temp_folder, "out_%i.txt" % (key,))
+        assert_equal(get_file_contents(filename), "foo\n")
+
+    # All tasks are submitted as a single job array; files are then removed
+    assert_equal([count for (_, count, _, _) in submitter.submitted], [3])
+    assert_equal(os.listdir(os.path.join(temp_folder, "batch")), [])
+
+
+@with_temp_folder
+def test_batch_executor__failed_node(temp_folder):
+    executor = _new_executor(temp_folder, _RecordingSubmitter())
+    node = _new_node(temp_folder, "out.txt", command="false")
+    assert executor.start("key", node, _new_config(temp_folder))
+
+    results = _wait_for(executor, 1)
+    assert_is_instance(results["key"], NodeError)
+    # Files are kept for failed jobs
+    assert_equal(len(os.listdir(os.path.join(temp_folder, "batch"))), 1)
+
+
+@with_temp_folder
+def test_batch_executor__lost_job(temp_folder):
+    executor = _new_executor(temp_folder, _RecordingSubmitter(run=False))
+    node = _new_node(temp_folder, "out.txt")
+    assert executor.start("key", node, _new_config(temp_folder))
+
+    results = _wait_for(executor, 1)
+    assert_is_instance(results["key"], NodeError)
+    assert "terminated without reporting results" in str(results["key"])
+
+
+@with_temp_folder
+def test_batch_executor__groups_by_resources(temp_folder):
+    submitter = _RecordingSubmitter(run=False)
+    executor = _new_executor(temp_folder, submitter, max_array_size=2,
+                             job_poll_interval=60)
+    config = _new_config(temp_folder)
+    for (key, threads) in enumerate((1, 2, 1, 1, 2)):
+        node = _new_node(temp_folder, "out_%i.txt" % (key,))
+        node.threads = threads
+        node.memory = 1024 if key == 4 else 0
+        assert executor.start(key, node, config)
+
+    assert_equal(executor.poll(), [])
+    assert_equal([(count, threads, memory)
+                  for (_, count, threads, memory) in submitter.submitted],
+                 [(2, 1, 0), (1, 1, 0), (1, 2, 0), (1, 2, 1024)])
+
+
+@with_temp_folder
+def test_batch_executor__job_script(temp_folder):
+    submitter = _RecordingSubmitter(run=False)
+    executor = _new_executor(temp_folder, submitter)
+    node = _new_node(temp_folder, "out.txt")
+    assert executor.start("key", node, _new_config(temp_folder))
+    executor.poll()
+
+    ((script, _, _, _),) = submitter.submitted
+    contents = get_file_contents(script)
+    assert "PALEOMIX_TASK_ID" in contents
+    assert "batch_task" in contents
+    assert os.path.join(os.path.dirname(script), "task_0.pickle") in contents
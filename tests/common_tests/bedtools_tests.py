@@ -32,6 +32,7 @@ from nose.tools import \
     assert_raises
 
 from paleomix.common.bedtools import \
+    BEDIndex, \
     BEDRecord
 
 
@@ -240,3 +241,66 @@ def test_bedrecord__deepcopy():
 
     assert_equal(str(record_1), record_1_txt + "\t['foo']")
     assert_equal(str(record_2), record_1_txt + "\t['bar']")
+
+
+###############################################################################
+###############################################################################
+# BEDIndex
+
+def _build_index(*lines):
+    return BEDIndex([BEDRecord(line) for line in lines])
+
+
+_INDEX_RECORDS = ("chr2\t10\t20\ta",
+                  "chr1\t50\t60\tb",
+                  "chr1\t0\t100\tc",
+                  "chr1\t100\t150\td",
+                  "chr1\t200\t210\te")
+
+
+def test_bedindex__contigs():
+    index = _build_index(*_INDEX_RECORDS)
+    assert_equal(index.contigs(), ["chr2", "chr1"])
+
+
+def test_bedindex__overlapping():
+    index = _build_index(*_INDEX_RECORDS)
+
+    def _names(contig, start, end):
+        return [record.name for record in index.overlapping(contig, start, end)]
+
+    assert_equal(_names("chr1", 55, 56), ["c", "b"])
+    assert_equal(_names("chr1", 60, 101), ["c", "d"])
+    assert_equal(_names("chr1", 150, 200), [])
+    assert_equal(_names("chr1", 0, 1000), ["c", "b", "d", "e"])
+    assert_equal(_names("chr2", 0, 10), [])
+    assert_equal(_names("chr3", 0, 10), [])
+
+
+def test_bedindex__merged():
+    index = _build_index(*_INDEX_RECORDS)
+    assert_equal(index.merged("chr1"), [("chr1", 0, 150), ("chr1", 200, 210)])
+    assert_equal(index.merged("chr3"), [])
+    assert_equal(index.merged(), [("chr2", 10, 20),
+                                  ("chr1", 0, 150),
+                                  ("chr1", 200, 210)])
+
+
+def test_bedindex__preceding_end():
+    index = _build_index(*_INDEX_RECORDS)
+    assert_equal(index.preceding_end("chr1", 0), 0)
+    assert_equal(index.preceding_end("chr1", 150), 150)
+    assert_equal(index.preceding_end("chr1", 200), 150)
+    assert_equal(index.preceding_end("chr1", 300), 210)
+
+
+def test_bedindex__segments():
+    index = _build_index(*_INDEX_RECORDS)
+    segments = [(start, end, [record.name for record in records])
+                for (start, end, records) in index.segments("chr1", 40, 205)]
+
+    assert_equal(segments, [(40, 50, ["c"]),
+                            (50, 60, ["c", "b"]),
+                            (60, 100, ["c"]),
+                            (100, 150, ["d"]),
+                            (200, 205, ["e"])])
@@ -0,0 +1,132 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Disable warning for missing docstring
+# pylint: disable=C0111
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+import os
+import signal
+import sys
+
+from nose.tools import \
+    assert_equal
+
+from paleomix.common.testing import \
+    with_temp_folder
+
+import paleomix.main
+import paleomix.common.forkserver as forkserver
+import paleomix.common.procs as procs
+
+
+def _paleomix_call(*args):
+    return (sys.executable, paleomix.main.__file__) + args
+
+
+def test_is_paleomix_call():
+    assert forkserver.is_paleomix_call(_paleomix_call("cat", "foo"))
+    assert not forkserver.is_paleomix_call(_paleomix_call())
+    assert not forkserver.is_paleomix_call(("cat", "foo"))
+
+
+@with_temp_folder
+def test_open_proc__stdout_pipe(temp_folder):
+    filename = os.path.join(temp_folder, "input.txt")
+    with open(filename, "w") as handle:
+        handle.write("foo\nbar\n")
+
+    call = _paleomix_call("cat", filename)
+    proc = forkserver.open_proc(call, stdout=procs.PIPE)
+
+    assert_equal(proc.call, call)
+    assert_equal(proc.stdout.read(), "foo\nbar\n")
+    assert_equal(proc.wait(), 0)
+    assert_equal(proc.returncode, 0)
+
+
+@with_temp_folder
+def test_open_proc__cwd_and_files(temp_folder):
+    with open(os.path.join(temp_folder, "input.txt"), "w") as handle:
+        handle.write("foo\n")
+
+    output = os.path.join(temp_folder, "output.txt")
+    with open(output, "w") as handle:
+        proc = forkserver.open_proc(_paleomix_call("cat", "input.txt"),
+                                    stdout=handle,
+                                    cwd=temp_folder)
+
+    assert_equal(proc.wait(), 0)
+    with open(output) as handle:
+        assert_equal(handle.read(), "foo\n")
+
+
+def test_open_proc__return_code():
+    proc = forkserver.open_proc(_paleomix_call("cat", "/does/not/exist"),
+                                stderr=procs.PIPE)
+
+    assert_equal(proc.wait(), 1)
+    assert "No such file or directory" in proc.stderr.read()
+
+
+def test_open_proc__terminate():
+    proc = forkserver.open_proc(_paleomix_call("cat", "/dev/stdin"),
+                                stdin=procs.PIPE)
+    assert_equal(proc.poll(), None)
+
+    # Commands are run in a new session, like AtomicCmd processes
+    os.killpg(proc.pid, signal.SIGTERM)
+    assert_equal(proc.wait(), -signal.SIGTERM)
+
+
+def test_open_proc__sentinel():
+    proc = forkserver.open_proc(_paleomix_call("cat", "/dev/stdin"),
+                                stdin=procs.PIPE)
+    assert proc.sentinel is not None
+
+    proc.stdin.close()
+    assert_equal(procs.wait_any([proc]), [proc])
+    assert_equal(proc.returncode, 0)
+    # Closed once the exit code has been received
+    assert_equal(proc.sentinel, None)
+
+
+def test_wait_any__mixed_procs():
+    forked = forkserver.open_proc(_paleomix_call("cat", "/dev/stdin"),
+                                  stdin=procs.PIPE)
+    child = procs.open_proc(("sleep", "10"))
+    try:
+        forked.stdin.close()
+        assert_equal(procs.wait_any([child, forked]), [forked])
+    finally:
+        child.kill()
+        child.wait()
+
+    assert_equal(procs.wait_any([child, forked]), [child, forked])
+
+
+def test_open_proc__non_paleomix_call():
+    proc = forkserver.open_proc(("echo", "foo"), stdout=procs.PIPE)
+
+    assert not isinstance(proc, forkserver._ForkedProc)
+    assert_equal(proc.stdout.read(), "foo\n")
+    assert_equal(proc.wait(), 0)
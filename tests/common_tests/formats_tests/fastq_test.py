@@ -0,0 +1,76 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Disable warning for missing docstring
+# pylint: disable=C0111
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+from nose.tools import assert_equal
+
+import paleomix.common.formats.fastq as fastq
+
+
+###############################################################################
+###############################################################################
+# find_quality_ranges
+
+def test_find_quality_ranges__empty():
+    assert_equal(fastq.find_quality_ranges(""), (False, False, False))
+
+
+def test_find_quality_ranges__boundaries():
+    assert_equal(fastq.find_quality_ranges(chr(33)), (True, False, False))
+    assert_equal(fastq.find_quality_ranges(chr(58)), (True, False, False))
+    assert_equal(fastq.find_quality_ranges(chr(59)), (False, True, False))
+    assert_equal(fastq.find_quality_ranges(chr(74)), (False, True, False))
+    assert_equal(fastq.find_quality_ranges(chr(75)), (False, False, True))
+    assert_equal(fastq.find_quality_ranges(chr(104)), (False, False, True))
+
+
+def test_find_quality_ranges__ignores_other_characters():
+    assert_equal(fastq.find_quality_ranges(" \n\r\x00" + chr(105)),
+                 (False, False, False))
+
+
+###############################################################################
+###############################################################################
+# classify_quality_strings
+
+def test_classify_quality_strings():
+    def _do_test_classify_quality_strings(strings, expected):
+        assert_equal(fastq.classify_quality_strings(strings), expected)
+
+    for (strings, expected) in ((["!!5I\n", "III"], fastq.OFFSET_33),
+                                (["hhh", "JJh\n"], fastq.OFFSET_64),
+                                (["@@", "JJ"], fastq.OFFSET_AMBIGIOUS),
+                                (["!!", "hh"], fastq.OFFSET_BOTH),
+                                (["  \n"], fastq.OFFSET_MISSING),
+                                ([], fastq.OFFSET_MISSING)):
+        yield _do_test_classify_quality_strings, strings, expected
+
+
+def test_classify_quality_ranges():
+    assert_equal(fastq.classify_quality_ranges((True, True, False)),
+                 fastq.OFFSET_33)
+    assert_equal(fastq.classify_quality_ranges((False, True, True)),
+                 fastq.OFFSET_64)
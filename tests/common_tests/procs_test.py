@@ -0,0 +1,101 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Disable warning for missing docstring
+# pylint: disable=C0111
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+import signal
+import StringIO
+import threading
+import time
+
+from nose.tools import \
+    assert_equal
+
+import paleomix.common.procs as procs
+
+
+###############################################################################
+###############################################################################
+# wait_any
+
+def test_wait_any__no_procs():
+    assert_equal(procs.wait_any([]), [])
+
+
+def test_wait_any__returns_finished():
+    proc_1 = procs.open_proc(("sleep", "10"))
+    proc_2 = procs.open_proc(("true",))
+    try:
+        assert_equal(procs.wait_any([proc_1, proc_2]), [proc_2])
+        assert_equal(proc_1.returncode, None)
+        assert_equal(proc_2.returncode, 0)
+    finally:
+        proc_1.kill()
+        proc_1.wait()
+
+
+def test_wait_any__does_not_sleep():
+    proc = procs.open_proc(("sleep", "0.2"))
+
+    start = time.time()
+    assert_equal(procs.wait_any([proc]), [proc])
+    assert time.time() - start < 0.5
+
+
+def test_wait_any__restores_sigchld_handler():
+    proc = procs.open_proc(("true",))
+    procs.wait_any([proc])
+
+    assert_equal(signal.getsignal(signal.SIGCHLD), signal.SIG_DFL)
+    assert_equal(signal.set_wakeup_fd(-1), -1)
+
+
+def test_wait_any__outside_main_thread():
+    proc = procs.open_proc(("true",))
+    results = []
+
+    thread = threading.Thread(target=lambda: results.extend(procs.wait_any([proc])))
+    thread.start()
+    thread.join()
+
+    assert_equal(results, [proc])
+
+
+###############################################################################
+###############################################################################
+# join_procs
+
+def test_join_procs__success():
+    procs_ = [procs.open_proc(("true",)), procs.open_proc(("sleep", "0.1"))]
+
+    assert_equal(procs.join_procs(procs_, StringIO.StringIO()), [0, 0])
+
+
+def test_join_procs__failure_terminates_remaining():
+    procs_ = [procs.open_proc(("sleep", "10")), procs.open_proc(("false",))]
+
+    start = time.time()
+    assert_equal(procs.join_procs(procs_, StringIO.StringIO()),
+                 [-signal.SIGTERM, 1])
+    assert time.time() - start < 5
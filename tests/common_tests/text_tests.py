@@ -25,16 +25,23 @@
 
 
 import collections
+import os
 
 import nose.tools
 from nose.tools import assert_equal
 
+from paleomix.common.testing import \
+    with_temp_folder
 from paleomix.common.text import \
     TableError, \
+    binary_table_path, \
     padded_table, \
     parse_padded_table, \
     parse_lines, \
-    parse_lines_by_contig
+    parse_lines_by_contig, \
+    parse_size, \
+    read_table_file, \
+    write_binary_table
 
 
 ###############################################################################
@@ -273,3 +280,96 @@ def test_parse_lines__two_contigs():
     expected = {"abc": [_RecordMock("abc", "line1")],
                 "def": [_RecordMock("def", "line2")]}
     assert_equal(parse_lines_by_contig(lines, _parse), expected)
+
+
+###############################################################################
+###############################################################################
+# Tests for 'parse_size'
+
+def test_parse_size():
+    def _do_test_parse_size(value, expected):
+        assert_equal(parse_size(value), expected)
+
+    yield _do_test_parse_size, "0", 0
+    yield _do_test_parse_size, "100", 100
+    yield _do_test_parse_size, "2k", 2 * 1024
+    yield _do_test_parse_size, "512m", 512 * 1024 ** 2
+    yield _do_test_parse_size, "4G", 4 * 1024 ** 3
+    yield _do_test_parse_size, "4gb", 4 * 1024 ** 3
+    yield _do_test_parse_size, "1T", 1024 ** 4
+
+
+def test_parse_size__invalid():
+    def _do_test_parse_size__invalid(value):
+        nose.tools.assert_raises(ValueError, parse_size, value)
+
+    yield _do_test_parse_size__invalid, ""
+    yield _do_test_parse_size__invalid, "-1"
+    yield _do_test_parse_size__invalid, "1.5g"
+    yield _do_test_parse_size__invalid, "4x"
+
+
+###############################################################################
+###############################################################################
+# Tests for 'write_binary_table' / 'read_table_file'
+
+_TABLE_ROWS = [("Name", "Size", "Value"),
+               "#",
+               ("foo", 10, 0.5),
+               ("bar", 20, "NA")]
+_TABLE_HEADER = ("Name", "Size", "Value")
+_TABLE_TEXT = (_TABLE_HEADER, [("foo", "10", "0.5"), ("bar", "20", "NA")])
+_TABLE_BINARY = (_TABLE_HEADER, [("foo", 10, 0.5), ("bar", 20, "NA")])
+
+
+def _write_text_table(filename, rows):
+    with open(filename, "w") as handle:
+        for line in padded_table(rows):
+            handle.write("%s\n" % (line,))
+
+
+@with_temp_folder
+def test_read_table_file__text_only(temp_folder):
+    filename = os.path.join(temp_folder, "table.txt")
+    _write_text_table(filename, _TABLE_ROWS)
+
+    assert_equal(read_table_file(filename), _TABLE_TEXT)
+
+
+@with_temp_folder
+def test_read_table_file__empty(temp_folder):
+    filename = os.path.join(temp_folder, "table.txt")
+    _write_text_table(filename, [])
+
+    assert_equal(read_table_file(filename), ((), []))
+
+
+@with_temp_folder
+def test_read_table_file__binary(temp_folder):
+    filename = os.path.join(temp_folder, "table.txt")
+    # Binary copy is preferred to the (empty) text table
+    _write_text_table(filename, [])
+    os.utime(filename, (0, 0))
+    write_binary_table(filename, _TABLE_ROWS)
+
+    assert_equal(read_table_file(filename), _TABLE_BINARY)
+
+
+@with_temp_folder
+def test_read_table_file__binary_outdated(temp_folder):
+    filename = os.path.join(temp_folder, "table.txt")
+    write_binary_table(filename, _TABLE_ROWS[:3])
+    _write_text_table(filename, _TABLE_ROWS)
+    os.utime(binary_table_path(filename), (0, 0))
+
+    assert_equal(read_table_file(filename), _TABLE_TEXT)
+
+
+@with_temp_folder
+def test_read_table_file__binary_invalid(temp_folder):
+    filename = os.path.join(temp_folder, "table.txt")
+    _write_text_table(filename, _TABLE_ROWS)
+    with open(binary_table_path(filename), "w") as handle:
+        handle.write("Name\tSize\tValue\n")
+
+    assert_equal(read_table_file(filename), _TABLE_TEXT)
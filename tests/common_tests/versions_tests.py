@@ -22,6 +22,7 @@
 #
 # pylint: disable=missing-docstring,too-few-public-methods
 #
+import os
 import pickle
 import operator
 
@@ -33,6 +34,9 @@ from nose.tools import \
     assert_not_equal, \
     assert_raises
 
+from paleomix.common.testing import \
+    with_temp_folder
+
 import paleomix.common.versions as versions
 
 
@@ -766,3 +770,135 @@ def test_requirement_highest_priority_retained():
     obj2 = versions.Requirement("echo", "", versions.LT(1), priority=0)
     assert_is(obj1, obj2)
     assert_equal(obj2.priority, 5)
+
+
+###############################################################################
+###############################################################################
+# VersionCache / prefetch
+
+def _write_script(temp_folder, version):
+    filename = os.path.join(temp_folder, "tool")
+    with open(filename, "w") as handle:
+        handle.write("#!/bin/sh\necho 'tool %s'\n" % (version,))
+    os.chmod(filename, 0755)
+
+    return (filename, "--version")
+
+
+@with_temp_folder
+def test_version_cache__set_and_get(temp_folder):
+    call = _write_script(temp_folder, "v1.2.3")
+    cache = versions.VersionCache(os.path.join(temp_folder, "cache.json"))
+    assert_equal(cache.get(call), None)
+    cache.set(call, "tool v1.2.3\n")
+    assert_equal(cache.get(call), "tool v1.2.3\n")
+
+
+@with_temp_folder
+def test_version_cache__save_and_load(temp_folder):
+    call = _write_script(temp_folder, "v1.2.3")
+    filename = os.path.join(temp_folder, "subdir", "cache.json")
+    cache = versions.VersionCache(filename)
+    cache.set(call, "tool v1.2.3\n\xff")
+    cache.save()
+
+    cache = versions.VersionCache(filename)
+    assert_equal(cache.get(call), "tool v1.2.3\n\xff")
+
+
+@with_temp_folder
+def test_version_cache__refresh(temp_folder):
+    call = _write_script(temp_folder, "v1.2.3")
+    filename = os.path.join(temp_folder, "cache.json")
+    cache = versions.VersionCache(filename)
+    cache.set(call, "tool v1.2.3\n")
+    cache.save()
+
+    cache = versions.VersionCache(filename, refresh=True)
+    assert_equal(cache.get(call), None)
+
+
+@with_temp_folder
+def test_version_cache__executable_changed(temp_folder):
+    call = _write_script(temp_folder, "v1.2.3")
+    cache = versions.VersionCache(os.path.join(temp_folder, "cache.json"))
+    cache.set(call, "tool v1.2.3\n")
+
+    _write_script(temp_folder, "v1.22.3")
+    assert_equal(cache.get(call), None)
+
+
+@with_temp_folder
+def test_version_cache__executable_not_found(temp_folder):
+    call = (os.path.join(temp_folder, "tool"), "--version")
+    cache = versions.VersionCache(os.path.join(temp_folder, "cache.json"))
+    cache.set(call, "tool v1.2.3\n")
+    assert_equal(cache.get(call), None)
+
+
+@with_temp_folder
+def test_version_cache__invalid_cache(temp_folder):
+    filename = os.path.join(temp_folder, "cache.json")
+    with open(filename, "w") as handle:
+        handle.write("{not json")
+
+    call = _write_script(temp_folder, "v1.2.3")
+    cache = versions.VersionCache(filename)
+    assert_equal(cache.get(call), None)
+
+
+@with_temp_folder
+def test_prefetch__output_is_cached(temp_folder):
+    call = _write_script(temp_folder, "v1.2.3")
+    filename = os.path.join(temp_folder, "cache.json")
+    obj = versions.RequirementObj(call, r"v(\d+)\.(\d+)", versions.Any())
+
+    versions.prefetch([obj], versions.VersionCache(filename))
+    assert_equal(obj.version, (1, 2))
+    assert_equal(versions.VersionCache(filename).get(call), "tool v1.2.3\n")
+
+
+@with_temp_folder
+def test_prefetch__output_read_from_cache(temp_folder):
+    call = _write_script(temp_folder, "v1.2.3")
+    cache = versions.VersionCache(os.path.join(temp_folder, "cache.json"))
+    cache.set(call, "tool v4.5.6\n")
+    obj = versions.RequirementObj(call, r"v(\d+)\.(\d+)", versions.Any())
+
+    versions.prefetch([obj], cache)
+    assert_equal(obj.version, (4, 5))
+
+
+@with_temp_folder
+def test_prefetch__multiple_calls(temp_folder):
+    objs = []
+    for index in range(3):
+        folder = os.path.join(temp_folder, str(index))
+        os.mkdir(folder)
+        call = _write_script(folder, "v%i.0" % (index,))
+        objs.append(versions.RequirementObj(call, r"v(\d+)\.(\d+)",
+                                            versions.Any()))
+
+    versions.prefetch(objs)
+    assert_equal([obj.version for obj in objs], [(0, 0), (1, 0), (2, 0)])
+
+
+@with_temp_folder
+def test_prefetch__unmatched_output_is_not_cached(temp_folder):
+    call = _write_script(temp_folder, "error: try again later")
+    filename = os.path.join(temp_folder, "cache.json")
+    obj = versions.RequirementObj(call, r"v(\d+)\.(\d+)", versions.Any())
+
+    versions.prefetch([obj], versions.VersionCache(filename))
+    assert_equal(versions.VersionCache(filename).get(call), None)
+
+
+@with_temp_folder
+def test_prefetch__output_matched_by_any_requirement_is_cached(temp_folder):
+    call = _write_script(temp_folder, "v1.2.3")
+    filename = os.path.join(temp_folder, "cache.json")
+    obj_1 = versions.RequirementObj(call, r"V(\d+)", versions.Any())
+    obj_2 = versions.RequirementObj(call, r"v(\d+)\.(\d+)", versions.Any())
+
+    versions.prefetch([obj_1, obj_2], versions.VersionCache(filename))
+    assert_equal(versions.VersionCache(filename).get(call), "tool v1.2.3\n")
@@ -0,0 +1,71 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2026 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+import subprocess
+import sys
+
+from nose.tools import assert_equal
+
+
+# Modules that are slow to import, and which should therefore only be loaded
+# by the commands (or the functions) that make use of them
+_SLOW_MODULES = ("numpy", "pysam", "paleomix.yaml")
+
+# Script used to list the slow modules loaded by a statement
+_SCRIPT = """
+import sys
+%s
+print(" ".join(sorted(name for name in %r if name in sys.modules)))
+"""
+
+
+def _loaded_slow_modules(statement):
+    proc = subprocess.Popen([sys.executable, "-c",
+                             _SCRIPT % (statement, _SLOW_MODULES)],
+                            stdout=subprocess.PIPE,
+                            close_fds=True)
+    stdout, _ = proc.communicate()
+    assert_equal(proc.returncode, 0)
+
+    return stdout.split()
+
+
+def test_main__requirements_do_not_import_pysam():
+    statement = "import paleomix.main as m; assert m._are_requirements_met()"
+    assert_equal(_loaded_slow_modules(statement), [])
+
+
+def test_main__lightweight_commands():
+    def _do_test_main__lightweight_commands(module):
+        statement = "import %s" % (module,)
+        assert_equal(_loaded_slow_modules(statement), [])
+
+    for module in ("paleomix.common.forkserver",
+                   "paleomix.tools.bam_pipeline.pipeline",
+                   "paleomix.tools.bam_pipeline.trim_pipeline",
+                   "paleomix.tools.batch_task",
+                   "paleomix.tools.cat",
+                   "paleomix.tools.dupcheck",
+                   "paleomix.tools.phylo_pipeline.pipeline",
+                   "paleomix.tools.retable",
+                   "paleomix.tools.worker"):
+        yield _do_test_main__lightweight_commands, module
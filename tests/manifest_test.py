@@ -0,0 +1,198 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2018 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is herby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Disable warning for missing docstring
+# pylint: disable=C0111
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+import os
+
+from flexmock import \
+    flexmock
+
+from nose.tools import \
+    assert_equal
+
+from paleomix.common.testing import \
+    with_temp_folder, \
+    set_file_contents
+
+from paleomix.nodegraph import \
+    FileStatusCache, \
+    NodeGraph
+
+from paleomix.manifest import \
+    FileManifest
+
+
+def _setup_files(temp_folder):
+    input_file = os.path.join(temp_folder, "input.txt")
+    output_file = os.path.join(temp_folder, "output.txt")
+    set_file_contents(input_file, "input")
+    set_file_contents(output_file, "output")
+    # Input is younger than the output
+    os.utime(output_file, (1000190760, 1000190760))
+    os.utime(input_file, (1120719000, 1120719000))
+
+    node = flexmock(input_files=frozenset((input_file,)),
+                    output_files=frozenset((output_file,)))
+
+    return node, input_file, output_file
+
+
+###############################################################################
+###############################################################################
+# FileManifest
+
+@with_temp_folder
+def test_manifest__not_recorded(temp_folder):
+    node, _, _ = _setup_files(temp_folder)
+    manifest = FileManifest()
+    cache = FileStatusCache(manifest)
+    assert cache.are_files_outdated(node.input_files, node.output_files)
+
+
+@with_temp_folder
+def test_manifest__input_touched(temp_folder):
+    node, input_file, _ = _setup_files(temp_folder)
+    manifest = FileManifest()
+    manifest.add(node, FileStatusCache())
+
+    os.utime(input_file, (1220719000, 1220719000))
+    cache = FileStatusCache(manifest)
+    assert not cache.are_files_outdated(node.input_files, node.output_files)
+
+
+@with_temp_folder
+def test_manifest__input_changed(temp_folder):
+    node, input_file, _ = _setup_files(temp_folder)
+    manifest = FileManifest()
+    manifest.add(node, FileStatusCache())
+
+    set_file_contents(input_file, "changed")
+    cache = FileStatusCache(manifest)
+    assert cache.are_files_outdated(node.input_files, node.output_files)
+
+
+@with_temp_folder
+def test_manifest__output_changed(temp_folder):
+    node, _, output_file = _setup_files(temp_folder)
+    manifest = FileManifest()
+    manifest.add(node, FileStatusCache())
+
+    set_file_contents(output_file, "changed")
+    os.utime(output_file, (1000190760, 1000190760))
+    cache = FileStatusCache(manifest)
+    assert cache.are_files_outdated(node.input_files, node.output_files)
+
+
+@with_temp_folder
+def test_manifest__input_files_changed(temp_folder):
+    node, _, output_file = _setup_files(temp_folder)
+    manifest = FileManifest()
+    manifest.add(node, FileStatusCache())
+
+    extra_file = os.path.join(temp_folder, "extra.txt")
+    set_file_contents(extra_file, "extra")
+    input_files = node.input_files | frozenset((extra_file,))
+    cache = FileStatusCache(manifest)
+    assert cache.are_files_outdated(input_files, node.output_files)
+
+
+@with_temp_folder
+def test_manifest__persistent(temp_folder):
+    node, input_file, _ = _setup_files(temp_folder)
+    filename = os.path.join(temp_folder, "manifest.jsonl")
+    FileManifest(filename).add(node, FileStatusCache())
+
+    os.utime(input_file, (1220719000, 1220719000))
+    cache = FileStatusCache(FileManifest(filename))
+    assert not cache.are_files_outdated(node.input_files, node.output_files)
+
+
+@with_temp_folder
+def test_manifest__compaction(temp_folder):
+    node, input_file, _ = _setup_files(temp_folder)
+    filename = os.path.join(temp_folder, "manifest.jsonl")
+    manifest = FileManifest(filename)
+    for _ in xrange(10):
+        manifest.add(node, FileStatusCache())
+
+    os.utime(input_file, (1220719000, 1220719000))
+    cache = FileStatusCache(FileManifest(filename))
+    assert not cache.are_files_outdated(node.input_files, node.output_files)
+    with open(filename) as handle:
+        # One record for the node, one for the current checksums, and one for
+        # the checksum recalculated above
+        assert_equal(len(handle.readlines()), 3)
+
+
+@with_temp_folder
+def test_manifest__bad_lines_ignored(temp_folder):
+    node, input_file, _ = _setup_files(temp_folder)
+    filename = os.path.join(temp_folder, "manifest.jsonl")
+    set_file_contents(filename, "{\"inputs\": [1, 2]}\n{\"inputs\n")
+    FileManifest(filename).add(node, FileStatusCache())
+
+    os.utime(input_file, (1220719000, 1220719000))
+    cache = FileStatusCache(FileManifest(filename))
+    assert not cache.are_files_outdated(node.input_files, node.output_files)
+
+
+@with_temp_folder
+def test_manifest__input_changed__same_size(temp_folder):
+    node, input_file, _ = _setup_files(temp_folder)
+    contents = "N" * (1024 * 1024 * 3)
+    set_file_contents(input_file, contents)
+    manifest = FileManifest()
+    manifest.add(node, FileStatusCache())
+
+    middle = len(contents) // 2 + 12345
+    set_file_contents(input_file,
+                      contents[:middle] + "A" + contents[middle + 1:])
+    cache = FileStatusCache(manifest)
+    assert cache.are_files_outdated(node.input_files, node.output_files)
+
+
+@with_temp_folder
+def test_manifest__state_changed__recorded_on_close(temp_folder):
+    node, input_file, _ = _setup_files(temp_folder)
+    filename = os.path.join(temp_folder, "manifest.jsonl")
+    manifest = FileManifest(filename)
+    manifest.state_changed(node, NodeGraph.RUNNING, NodeGraph.DONE, True)
+    manifest.close()
+
+    os.utime(input_file, (1220719000, 1220719000))
+    cache = FileStatusCache(FileManifest(filename))
+    assert not cache.are_files_outdated(node.input_files, node.output_files)
+
+
+@with_temp_folder
+def test_manifest__state_changed__not_done(temp_folder):
+    node, input_file, _ = _setup_files(temp_folder)
+    manifest = FileManifest()
+    manifest.state_changed(node, NodeGraph.RUNABLE, NodeGraph.RUNNING, True)
+    manifest.close()
+
+    os.utime(input_file, (1220719000, 1220719000))
+    cache = FileStatusCache(manifest)
+    assert cache.are_files_outdated(node.input_files, node.output_files)
@@ -243,6 +243,83 @@ def test_constructor__threads_invalid_type():
         yield _do_test_constructor__threads_invalid_type, cls, 2.7
 
 
+###############################################################################
+###############################################################################
+# *Node: Constructor tests: #priority
+
+def test_constructor__priority():
+    def _do_test_constructor__priority(cls, priority):
+        node = cls(priority=priority)
+        assert_equal(node.priority, priority)
+    for cls in (Node, _CommandNodeWrap):
+        yield _do_test_constructor__priority, cls, -1
+        yield _do_test_constructor__priority, cls, 0
+        yield _do_test_constructor__priority, cls, 10L
+
+
+def test_constructor__priority__default():
+    def _do_test_constructor__priority__default(cls):
+        assert_equal(cls().priority, 0)
+    for cls in (Node, _CommandNodeWrap):
+        yield _do_test_constructor__priority__default, cls
+
+
+def test_constructor__priority_invalid_type():
+    def _do_test_constructor__priority_invalid_type(cls, priority):
+        assert_raises(TypeError, cls, priority=priority)
+    for cls in (Node, _CommandNodeWrap):
+        yield _do_test_constructor__priority_invalid_type, cls, "1"
+        yield _do_test_constructor__priority_invalid_type, cls, None
+        yield _do_test_constructor__priority_invalid_type, cls, 2.7
+
+
+###############################################################################
+###############################################################################
+# *Node: Constructor tests: #memory, #io_weight
+
+def test_constructor__resources():
+    def _do_test_constructor__resources(cls, key, value):
+        node = cls(**{key: value})
+        assert_equal(getattr(node, key), value)
+    for cls in (Node, _CommandNodeWrap):
+        for key in ("memory", "io_weight"):
+            yield _do_test_constructor__resources, cls, key, 0
+            yield _do_test_constructor__resources, cls, key, 1024L
+
+
+def test_constructor__resources__default():
+    def _do_test_constructor__resources__default(cls, key):
+        assert_equal(getattr(cls(), key), 0)
+    for cls in (Node, _CommandNodeWrap):
+        for key in ("memory", "io_weight"):
+            yield _do_test_constructor__resources__default, cls, key
+
+
+def test_constructor__resources_invalid():
+    def _do_test_constructor__resources_invalid(cls, key, value, exception):
+        assert_raises(exception, cls, **{key: value})
+    for cls in (Node, _CommandNodeWrap):
+        for key in ("memory", "io_weight"):
+            yield _do_test_constructor__resources_invalid, cls, key, -1, \
+                ValueError
+            yield _do_test_constructor__resources_invalid, cls, key, "1", \
+                TypeError
+            yield _do_test_constructor__resources_invalid, cls, key, 2.7, \
+                TypeError
+
+
+def test_commandnode_constructor__memory_from_command():
+    cmd = AtomicCmd(("java", "-Xmx2g", "-jar", "foo.jar"))
+    node = CommandNode(cmd)
+    assert_equal(node.memory, 2 * 1024 ** 3)
+
+
+def test_commandnode_constructor__memory_overrides_command():
+    cmd = AtomicCmd(("java", "-Xmx2g", "-jar", "foo.jar"))
+    node = CommandNode(cmd, memory=1024)
+    assert_equal(node.memory, 1024)
+
+
 ###############################################################################
 ###############################################################################
 # Node: Run
@@ -32,12 +32,17 @@ import os
 from flexmock import \
     flexmock
 
+from nose.tools import \
+    assert_equal, \
+    assert_raises
+
 from paleomix.common.testing import \
     with_temp_folder, \
     set_file_contents
 
 from paleomix.nodegraph import \
     NodeGraph, \
+    NodeGraphError, \
     FileStatusCache
 
 
@@ -144,3 +149,181 @@ def test_nodegraph_is_outdated__updates():
     my_node = flexmock(input_files=(test_file("timestamp_a_younger"),),
                        output_files=(test_file("timestamp_a_older"),))
     assert NodeGraph.is_outdated(my_node, FileStatusCache())
+
+
+###############################################################################
+###############################################################################
+# NodeGraph: set_node_state
+
+def _build_node(temp_folder, name, dependencies=(), threads=1, priority=0):
+    input_files = [iter(node.output_files).next() for node in dependencies]
+    if not input_files:
+        input_files = [test_file("empty_file_1")]
+
+    return flexmock(input_files=frozenset(input_files),
+                    output_files=frozenset([os.path.join(temp_folder, name)]),
+                    auxiliary_files=frozenset(),
+                    executables=frozenset(),
+                    requirements=frozenset(),
+                    dependencies=frozenset(dependencies),
+                    threads=threads,
+                    priority=priority)
+
+
+@with_temp_folder
+def test_nodegraph_set_node_state__propagates_to_dependants(temp_folder):
+    node_a = _build_node(temp_folder, "a")
+    node_b = _build_node(temp_folder, "b", [node_a])
+    node_c = _build_node(temp_folder, "c", [node_a])
+    node_d = _build_node(temp_folder, "d", [node_b, node_c])
+    graph = NodeGraph([node_d])
+
+    states = lambda: [graph.get_node_state(node)
+                      for node in (node_a, node_b, node_c, node_d)]
+    assert_equal(states(), [NodeGraph.RUNABLE, NodeGraph.QUEUED,
+                            NodeGraph.QUEUED, NodeGraph.QUEUED])
+
+    set_file_contents(os.path.join(temp_folder, "a"), "a")
+    graph.set_node_state(node_a, NodeGraph.DONE)
+    assert_equal(states(), [NodeGraph.DONE, NodeGraph.RUNABLE,
+                            NodeGraph.RUNABLE, NodeGraph.QUEUED])
+
+    set_file_contents(os.path.join(temp_folder, "b"), "b")
+    graph.set_node_state(node_b, NodeGraph.DONE)
+    graph.set_node_state(node_c, NodeGraph.ERROR)
+    assert_equal(states(), [NodeGraph.DONE, NodeGraph.DONE,
+                            NodeGraph.ERROR, NodeGraph.ERROR])
+
+
+@with_temp_folder
+def test_nodegraph_set_node_state__observers_notified(temp_folder):
+    node_a = _build_node(temp_folder, "a")
+    node_b = _build_node(temp_folder, "b", [node_a])
+    graph = NodeGraph([node_b])
+
+    observer = flexmock()
+    observer.should_receive("refresh").with_args(graph).once()
+    observer.should_receive("state_changed") \
+        .with_args(node_a, NodeGraph.RUNABLE, NodeGraph.ERROR, True).once()
+    observer.should_receive("state_changed") \
+        .with_args(node_b, NodeGraph.QUEUED, NodeGraph.ERROR, False).once()
+    graph.add_state_observer(observer)
+
+    graph.set_node_state(node_a, NodeGraph.ERROR)
+
+
+###############################################################################
+###############################################################################
+# NodeGraph: get_node_priority
+
+@with_temp_folder
+def test_nodegraph_get_node_priority__critical_path(temp_folder):
+    node_a = _build_node(temp_folder, "a")
+    node_b = _build_node(temp_folder, "b", [node_a], threads=4)
+    node_c = _build_node(temp_folder, "c", [node_a])
+    node_d = _build_node(temp_folder, "d", [node_c])
+    node_e = _build_node(temp_folder, "e", [node_b, node_d])
+    graph = NodeGraph([node_e])
+
+    assert_equal(graph.get_node_priority(node_e), (0, 1))
+    assert_equal(graph.get_node_priority(node_d), (0, 2))
+    assert_equal(graph.get_node_priority(node_c), (0, 3))
+    assert_equal(graph.get_node_priority(node_b), (0, 5))
+    assert_equal(graph.get_node_priority(node_a), (0, 6))
+
+
+@with_temp_folder
+def test_nodegraph_get_node_priority__hint_takes_precedence(temp_folder):
+    node_a = _build_node(temp_folder, "a")
+    node_b = _build_node(temp_folder, "b", [node_a])
+    node_c = _build_node(temp_folder, "c", priority=1)
+    graph = NodeGraph([node_b, node_c])
+
+    assert graph.get_node_priority(node_c) > graph.get_node_priority(node_a)
+
+
+###############################################################################
+###############################################################################
+# FileStatusCache: invalidate
+
+@with_temp_folder
+def test_file_status_cache__invalidate(temp_folder):
+    temp_file = os.path.join(temp_folder, "file.txt")
+    cache = FileStatusCache()
+    assert not cache.files_exist((temp_file,))
+    set_file_contents(temp_file, "foo")
+    assert not cache.files_exist((temp_file,))
+    cache.invalidate((temp_file,))
+    assert cache.files_exist((temp_file,))
+
+
+###############################################################################
+###############################################################################
+# FileStatusCache: prefetch
+
+@with_temp_folder
+def test_file_status_cache__prefetch(temp_folder):
+    file_1 = os.path.join(temp_folder, "file_1.txt")
+    file_2 = os.path.join(temp_folder, "file_2.txt")
+    file_3 = os.path.join(temp_folder, "missing", "file_3.txt")
+    set_file_contents(file_1, "foo")
+    cache = FileStatusCache()
+    cache.prefetch((file_1, file_2, file_3))
+
+    # Prefetched state is used, even if files have been changed
+    set_file_contents(file_2, "bar")
+    assert_equal(cache.missing_files((file_1, file_2, file_3)),
+                 [file_2, file_3])
+    assert_equal(cache.file_sizes((file_1,)), 3)
+
+
+@with_temp_folder
+def test_file_status_cache__prefetch__single_file(temp_folder):
+    file_1 = os.path.join(temp_folder, "file_1.txt")
+    file_2 = os.path.join(temp_folder, "missing", "file_2.txt")
+    set_file_contents(file_1, "foo")
+    cache = FileStatusCache()
+    cache.prefetch((file_1,))
+    cache.prefetch((file_2,))
+    assert cache.files_exist((file_1,))
+    assert not cache.files_exist((file_2,))
+
+
+###############################################################################
+###############################################################################
+# NodeGraph: Graph construction
+
+@with_temp_folder
+def test_nodegraph__deep_graph(temp_folder):
+    nodes = [_build_node(temp_folder, "node_0")]
+    for idx in xrange(1, 5000):
+        nodes.append(_build_node(temp_folder, "node_%i" % (idx,),
+                                 [nodes[-1]]))
+
+    graph = NodeGraph([nodes[-1]])
+    assert_equal(graph.get_node_state(nodes[0]), NodeGraph.RUNABLE)
+    assert_equal(graph.get_node_state(nodes[-1]), NodeGraph.QUEUED)
+    assert_equal(graph.get_node_priority(nodes[0]), (0, 5000))
+
+
+@with_temp_folder
+def test_nodegraph__indirect_file_dependency(temp_folder):
+    node_a = _build_node(temp_folder, "a")
+    node_b = _build_node(temp_folder, "b", [node_a])
+    node_c = _build_node(temp_folder, "c", [node_b])
+    # Node depends on the output of 'a' only via 'b'
+    node_c.input_files |= node_a.output_files
+
+    graph = NodeGraph([node_c])
+    assert_equal(graph.get_node_state(node_c), NodeGraph.QUEUED)
+
+
+@with_temp_folder
+def test_nodegraph__missing_file_dependency(temp_folder):
+    node_a = _build_node(temp_folder, "a")
+    node_b = _build_node(temp_folder, "b")
+    node_c = _build_node(temp_folder, "c", [node_b])
+    # Node depends on the output of 'a', but not on 'a' itself
+    node_c.input_files |= node_a.output_files
+
+    assert_raises(NodeGraphError, NodeGraph, [node_a, node_c])
@@ -0,0 +1,246 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Disable warning for missing docstring
+# pylint: disable=C0111
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+import gzip
+import os
+
+from nose.tools import \
+    assert_equal, \
+    assert_in, \
+    assert_raises
+
+from paleomix.node import NodeError
+from paleomix.common.testing import \
+    Monkeypatch, \
+    with_temp_folder
+
+import paleomix.nodes.validation as validation
+
+
+_RECORDS = ("@read_1\nACGTA\n+\nIIII#\n"
+            "@read_2\nAC\n+read_2\n55\n"
+            "@read_3\n\n+\n\n"
+            "@read_4\nACGTACGT\n+\n!!!!IIII\n")
+
+
+def _write_fastq(temp_folder, data, filename="reads.fastq"):
+    filename = os.path.join(temp_folder, filename)
+    handle = (gzip.open if filename.endswith(".gz") else open)(filename, "wb")
+    handle.write(data)
+    handle.close()
+
+    return filename
+
+
+def _check_fastq(filename, file_type="Single", offset=33, **kwargs):
+    return validation.check_fastq_files([(file_type, filename)], offset,
+                                        **kwargs)
+
+
+def _assert_error(filename, message, **kwargs):
+    with assert_raises(NodeError) as context:
+        _check_fastq(filename, **kwargs)
+    assert_in(message, str(context.exception))
+
+
+###############################################################################
+###############################################################################
+# check_fastq_files
+
+@with_temp_folder
+def test_check_fastq_files__stats(temp_folder):
+    filename = _write_fastq(temp_folder, _RECORDS)
+    # Nucleotide counts include newlines
+    expected = {"seq_retained_nts": 19,
+                "seq_retained_reads": 4,
+                "seq_collapsed": 0}
+
+    assert_equal(_check_fastq(filename), expected)
+
+
+@with_temp_folder
+def test_check_fastq_files__collapsed(temp_folder):
+    filename = _write_fastq(temp_folder, _RECORDS)
+    expected = {"seq_retained_nts": 19,
+                "seq_retained_reads": 4,
+                "seq_collapsed": 4}
+
+    assert_equal(_check_fastq(filename, "Collapsed"), expected)
+
+
+@with_temp_folder
+def test_check_fastq_files__gzip(temp_folder):
+    filename = _write_fastq(temp_folder, _RECORDS, "reads.fastq.gz")
+
+    assert_equal(_check_fastq(filename)["seq_retained_reads"], 4)
+
+
+@with_temp_folder
+def test_check_fastq_files__records_across_blocks(temp_folder):
+    filename = _write_fastq(temp_folder, _RECORDS * 10)
+    expected = _check_fastq(filename)
+
+    for block_size in (1, 3, 7, 16, 64):
+        with Monkeypatch("paleomix.nodes.validation._FASTQ_BLOCK_SIZE",
+                         block_size):
+            assert_equal(_check_fastq(filename), expected)
+
+
+@with_temp_folder
+def test_check_fastq_files__multiple_files_in_parallel(temp_folder):
+    filenames = [("Single", _write_fastq(temp_folder, _RECORDS, "1.fastq")),
+                 ("Collapsed", _write_fastq(temp_folder, _RECORDS * 2,
+                                            "2.fastq.gz")),
+                 ("Single", _write_fastq(temp_folder, _RECORDS, "3.fastq"))]
+
+    expected = validation.check_fastq_files(filenames, 33)
+    assert_equal(expected["seq_retained_reads"], 16)
+    assert_equal(expected["seq_collapsed"], 8)
+    assert_equal(validation.check_fastq_files(filenames, 33, threads=3),
+                 expected)
+
+
+@with_temp_folder
+def test_check_fastq_files__empty_file(temp_folder):
+    filename = _write_fastq(temp_folder, "")
+
+    assert_equal(_check_fastq(filename, allow_empty=True),
+                 {"seq_retained_nts": 0,
+                  "seq_retained_reads": 0,
+                  "seq_collapsed": 0})
+    _assert_error(filename, "did not contain quality scores")
+
+
+@with_temp_folder
+def test_check_fastq_files__wrong_offset(temp_folder):
+    filename = _write_fastq(temp_folder, _RECORDS)
+
+    _assert_error(filename, "wrong quality score offset (33)", offset=64)
+
+
+@with_temp_folder
+def test_check_fastq_files__mixed_offsets(temp_folder):
+    filename = _write_fastq(temp_folder, _RECORDS + "@read_5\nA\n+\nh\n")
+
+    _assert_error(filename, "both quality offsets")
+
+
+@with_temp_folder
+def test_check_fastq_files__fasta_file(temp_folder):
+    filename = _write_fastq(temp_folder, ">read_1\nACGT\n")
+
+    _assert_error(filename, "appears to be in FASTA format")
+
+
+@with_temp_folder
+def test_check_fastq_files__invalid_header(temp_folder):
+    filename = _write_fastq(temp_folder, _RECORDS + "read_5\nA\n+\nI\n")
+
+    _assert_error(filename, "lacks FASTQ header")
+
+
+@with_temp_folder
+def test_check_fastq_files__invalid_seperator(temp_folder):
+    filename = _write_fastq(temp_folder, _RECORDS + "@read_5\nA\n-\nI\n")
+
+    _assert_error(filename, "lacks FASTQ seperator")
+
+
+@with_temp_folder
+def test_check_fastq_files__mismatched_lengths(temp_folder):
+    filename = _write_fastq(temp_folder, _RECORDS + "@read_5\nA\n+\nII\n")
+
+    _assert_error(filename, "Record = '@read_5'")
+
+
+@with_temp_folder
+def test_check_fastq_files__partial_record(temp_folder):
+    filename = _write_fastq(temp_folder, _RECORDS + "@read_5\nA\n+\n")
+
+    _assert_error(filename, "Partial record found")
+
+
+###############################################################################
+###############################################################################
+# check_fasta_file
+
+_FASTA = (">chr1 description\nACGTA\nCGTAN\nAC\n"
+          ">chr2\nacgtn\nRYSWK\n\n"
+          ">chr3\nMBDHV\nA\n")
+
+
+def _write_fasta(temp_folder, data):
+    return _write_fastq(temp_folder, data, "reference.fasta")
+
+
+def _assert_fasta_error(filename, message, threads=1):
+    with assert_raises(NodeError) as context:
+        validation.check_fasta_file(filename, threads)
+    assert_in(message, str(context.exception))
+
+
+@with_temp_folder
+def test_check_fasta_file__valid(temp_folder):
+    filename = _write_fasta(temp_folder, _FASTA)
+
+    for block_size in (1, 2, 3, 7, 64):
+        with Monkeypatch("paleomix.nodes.validation._FASTA_BLOCK_SIZE",
+                         block_size):
+            for threads in (1, 3):
+                validation.check_fasta_file(filename, threads)
+
+
+@with_temp_folder
+def test_check_fasta_file__no_trailing_newline(temp_folder):
+    filename = _write_fasta(temp_folder, _FASTA.rstrip())
+
+    validation.check_fasta_file(filename)
+
+
+def test_check_fasta_file__errors():
+    @with_temp_folder
+    def _do_test_check_fasta_file__errors(temp_folder, data, message):
+        filename = _write_fasta(temp_folder, data)
+
+        for threads in (1, 3):
+            _assert_fasta_error(filename, message, threads)
+
+    for (data, message) in (
+            ("", "File does not contain any sequences"),
+            ("ACGT\n", "Expected FASTA header, found 'ACGT'"),
+            (_FASTA + ">chr4\n", "File ends with an empty sequence"),
+            (">chr1\n>chr2\nACGT\n", "Empty sequences not allowed"),
+            (">chr1\n\nACGT\n", "Expected FASTA sequence, found empty line"),
+            (">\nACGT\n", "FASTA sequence must have non-empty name"),
+            (">*chr1\nACGT\n", "Invalid name for FASTA sequence: '*chr1'"),
+            (_FASTA + ">chr1\nACGT\n", "FASTA sequences have identical name"),
+            (">chr1\nACGT\n\nACGT\n", "Empty lines not allowed in sequences"),
+            (">chr1\nACGT\r\nACGT\r\n", "contains carriage-returns"),
+            (">chr1\nACGT\nACXT\n", "Invalid characters = 'X'"),
+            (">chr1\nACGT\nACGTA\n", "Line = 3"),
+            (">chr1\nACGT\nACG\nACG\n", "Line = 4")):
+        yield _do_test_check_fasta_file__errors, data, message
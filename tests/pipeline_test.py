@@ -0,0 +1,110 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2018 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is herby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Disable warning for missing docstring
+# pylint: disable=C0111
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+# Disable warning caused by accessing protected members
+# pylint: disable=W0212
+from flexmock import \
+    flexmock
+
+from nose.tools import \
+    assert_equal, \
+    assert_is_none
+
+from paleomix.nodegraph import \
+    NodeGraph
+
+from paleomix.pipeline import \
+    _RunableNodes
+
+
+def _new_node(priority, threads=1, memory=0, io_weight=0):
+    return flexmock(priority=priority,
+                    threads=threads,
+                    memory=memory,
+                    io_weight=io_weight)
+
+
+def _new_runable(nodes):
+    nodegraph = flexmock(RUNABLE=NodeGraph.RUNABLE,
+                         iterflat=lambda: iter(nodes),
+                         get_node_state=lambda _node: NodeGraph.RUNABLE,
+                         get_node_priority=lambda node: (node.priority,))
+
+    runable = _RunableNodes()
+    runable.refresh(nodegraph)
+    return runable
+
+
+###############################################################################
+###############################################################################
+# _RunableNodes
+
+def test_runable_nodes__pop__by_priority():
+    nodes = [_new_node(1), _new_node(3, threads=2), _new_node(2, memory=10)]
+    runable = _new_runable(nodes)
+
+    assert_equal(len(runable), 3)
+    assert_equal([runable.pop() for _ in nodes],
+                 [nodes[1], nodes[2], nodes[0]])
+    assert_equal(len(runable), 0)
+    assert_is_none(runable.pop())
+
+
+def test_runable_nodes__pop__only_nodes_that_fit():
+    nodes = [_new_node(1), _new_node(3, threads=4), _new_node(2, io_weight=1)]
+    runable = _new_runable(nodes)
+    checked = []
+
+    def _fits(threads, memory, io_weight):
+        checked.append((threads, memory, io_weight))
+        return threads <= 2 and io_weight == 0
+
+    assert_equal(runable.pop(_fits), nodes[0])
+    # Only the head of each group of nodes is examined
+    assert_equal(sorted(checked), [(1, 0, 0), (1, 0, 1), (4, 0, 0)])
+    assert_is_none(runable.pop(_fits))
+    assert_equal(len(runable), 2)
+
+
+def test_runable_nodes__state_changed__removes_nodes():
+    nodes = [_new_node(1), _new_node(2)]
+    runable = _new_runable(nodes)
+    runable.state_changed(nodes[1], NodeGraph.RUNABLE, NodeGraph.RUNNING,
+                          True)
+
+    assert_equal(len(runable), 1)
+    assert_equal(runable.pop(), nodes[0])
+    assert_is_none(runable.pop())
+
+
+def test_runable_nodes__state_changed__adds_nodes():
+    nodes = [_new_node(1), _new_node(2)]
+    runable = _new_runable(nodes[:1])
+    runable.state_changed(nodes[1], NodeGraph.QUEUED, NodeGraph.RUNABLE,
+                          True)
+
+    assert_equal(runable.pop(), nodes[1])
+    assert_equal(runable.pop(), nodes[0])
@@ -0,0 +1,155 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2018 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is herby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Disable warning for missing docstring
+# pylint: disable=C0111
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+import os
+
+from nose.tools import \
+    assert_equal, \
+    assert_is_none, \
+    assert_almost_equal
+
+from paleomix.common.testing import \
+    with_temp_folder, \
+    set_file_contents, \
+    get_file_contents
+
+from paleomix.nodegraph import \
+    NodeGraph
+
+from paleomix.runtimes import \
+    RuntimeHistory
+
+
+class _NodeA(object):
+    pass
+
+
+class _NodeB(object):
+    pass
+
+
+###############################################################################
+###############################################################################
+# RuntimeHistory: estimate
+
+def test_runtimes__estimate__no_records():
+    history = RuntimeHistory()
+    assert_is_none(history.estimate(_NodeA()))
+    assert_is_none(history.estimate(_NodeA(), 1000))
+
+
+def test_runtimes__estimate__average_for_type():
+    history = RuntimeHistory()
+    history.add(_NodeA(), None, 10.0)
+    history.add(_NodeA(), None, 20.0)
+    history.add(_NodeB(), None, 60.0)
+    assert_almost_equal(history.estimate(_NodeA()), 15.0)
+    assert_almost_equal(history.estimate(_NodeB()), 60.0)
+
+
+def test_runtimes__estimate__scaled_by_size():
+    history = RuntimeHistory()
+    history.add(_NodeA(), 100, 10.0)
+    history.add(_NodeA(), 300, 30.0)
+    assert_almost_equal(history.estimate(_NodeA(), 1000), 100.0)
+    assert_almost_equal(history.estimate(_NodeA()), 20.0)
+
+
+def test_runtimes__estimate__unknown_type_uses_average():
+    history = RuntimeHistory()
+    history.add(_NodeA(), None, 10.0)
+    history.add(_NodeA(), None, 20.0)
+    history.add(_NodeA(), None, 60.0)
+    assert_almost_equal(history.estimate(_NodeB()), 30.0)
+
+
+###############################################################################
+###############################################################################
+# RuntimeHistory: persistence
+
+@with_temp_folder
+def test_runtimes__persistence(temp_folder):
+    filename = os.path.join(temp_folder, "runtimes.jsonl")
+    history = RuntimeHistory(filename)
+    history.add(_NodeA(), 100, 10.0)
+    history.add(_NodeB(), None, 20.0)
+
+    history = RuntimeHistory(filename)
+    assert_almost_equal(history.estimate(_NodeA(), 200), 20.0)
+    assert_almost_equal(history.estimate(_NodeB()), 20.0)
+
+
+@with_temp_folder
+def test_runtimes__persistence__invalid_lines_ignored(temp_folder):
+    filename = os.path.join(temp_folder, "runtimes.jsonl")
+    set_file_contents(filename,
+                      '{"node": "foo.Bar", "size": null, "runtime": 5}\n'
+                      '{"node": "foo.Bar", "size": null, "run\n'
+                      'garbage\n'
+                      '{"node": "foo.Bar", "size": null}\n')
+
+    history = RuntimeHistory(filename)
+    assert_almost_equal(history.estimate(_NodeA()), 5.0)
+
+
+@with_temp_folder
+def test_runtimes__persistence__compacted(temp_folder):
+    filename = os.path.join(temp_folder, "runtimes.jsonl")
+    history = RuntimeHistory(filename)
+    for runtime in xrange(250):
+        history.add(_NodeA(), None, runtime)
+
+    RuntimeHistory(filename)
+    assert_equal(len(get_file_contents(filename).split("\n")), 101)
+    assert_almost_equal(RuntimeHistory(filename).estimate(_NodeA()), 199.5)
+
+
+###############################################################################
+###############################################################################
+# RuntimeHistory: state_changed
+
+@with_temp_folder
+def test_runtimes__state_changed__records_finished_nodes(temp_folder):
+    input_file = os.path.join(temp_folder, "input")
+    set_file_contents(input_file, "x" * 100)
+
+    node = _NodeA()
+    node.input_files = frozenset([input_file])
+    history = RuntimeHistory()
+    history.state_changed(node, NodeGraph.RUNABLE, NodeGraph.RUNNING, True)
+    history.state_changed(node, NodeGraph.RUNNING, NodeGraph.DONE, True)
+
+    estimate = history.estimate(node, 100)
+    assert estimate is not None and estimate >= 0
+
+
+def test_runtimes__state_changed__failed_nodes_ignored():
+    node = _NodeA()
+    history = RuntimeHistory()
+    history.state_changed(node, NodeGraph.RUNABLE, NodeGraph.RUNNING, True)
+    history.state_changed(node, NodeGraph.RUNNING, NodeGraph.ERROR, True)
+
+    assert_is_none(history.estimate(node))
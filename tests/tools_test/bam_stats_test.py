@@ -0,0 +1,189 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2018 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Disable warning for missing docstring
+# pylint: disable=C0111
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+import os
+import random
+import sys
+
+from nose.tools import \
+    assert_equal, \
+    assert_raises
+
+from paleomix.common.testing import \
+    with_temp_folder, \
+    get_file_contents, \
+    set_file_contents, \
+    write_random_bam
+
+import paleomix.tools.coverage as coverage
+import paleomix.tools.depths as depths
+import paleomix.tools.duphist as duphist
+import paleomix.tools.bam_stats.common as common
+import paleomix.tools.bam_stats.scanner as scanner
+
+
+_CONTIGS = (("chr1", 5000), ("chr2", 3000))
+_READGROUPS = (("rg1", "sample1", "lib1"),
+               ("rg2", "sample1", "lib2"),
+               ("rg3", "sample2", "lib3"))
+
+
+def _read_table(filename):
+    # Skip timestamp
+    return get_file_contents(filename).split("\n", 1)[1]
+
+
+def _run_duphist(bam_file, out_file):
+    random.seed(1234)
+    stdout = sys.stdout
+    try:
+        with open(out_file, "w") as sys.stdout:
+            assert_equal(duphist.main([bam_file]), None)
+    finally:
+        sys.stdout = stdout
+
+
+@with_temp_folder
+def test_bam_stats__matches_individual_tools(temp_folder):
+    bam_file = os.path.join(temp_folder, "test.bam")
+    write_random_bam(bam_file, _CONTIGS, _READGROUPS)
+
+    def _path(name):
+        return os.path.join(temp_folder, name)
+
+    assert_equal(coverage.main([bam_file, _path("a.coverage")]), 0)
+    assert_equal(depths.main([bam_file, _path("a.depths")]), 0)
+    _run_duphist(bam_file, _path("a.duphist"))
+
+    random.seed(1234)
+    assert_equal(scanner.main([bam_file,
+                               "--coverage", _path("b.coverage"),
+                               "--depths", _path("b.depths"),
+                               "--duphist", _path("b.duphist"),
+                               "--insert-sizes", _path("b.insert_sizes")]),
+                 0)
+
+    assert_equal(_read_table(_path("a.coverage")),
+                 _read_table(_path("b.coverage")))
+    assert_equal(_read_table(_path("a.depths")),
+                 _read_table(_path("b.depths")))
+    assert_equal(get_file_contents(_path("a.duphist")),
+                 get_file_contents(_path("b.duphist")))
+    assert get_file_contents(_path("b.insert_sizes"))
+
+
+def _run_bam_stats(bam_file, prefix, options=()):
+    outputs = []
+    argv = [bam_file, "--overwrite-output"] + list(options)
+    for key in ("coverage", "depths", "insert-sizes"):
+        outputs.append("%s.%s" % (prefix, key))
+        argv.extend(("--" + key, outputs[-1]))
+
+    assert_equal(scanner.main(argv), 0)
+
+    return [_read_table(filename) for filename in outputs]
+
+
+def _check_threads(temp_folder, options=(), regions=None):
+    bam_file = os.path.join(temp_folder, "test.bam")
+    write_random_bam(bam_file, _CONTIGS, _READGROUPS)
+    if regions is not None:
+        bed_file = os.path.join(temp_folder, "regions.bed")
+        set_file_contents(bed_file, regions)
+        options = list(options) + ["--regions-file", bed_file]
+
+    window_size = common._MIN_WINDOW_SIZE
+    try:
+        # Ensure that contigs are split into multiple windows
+        common._MIN_WINDOW_SIZE = 700
+
+        expected = _run_bam_stats(bam_file, os.path.join(temp_folder, "a"),
+                                  options)
+        result = _run_bam_stats(bam_file, os.path.join(temp_folder, "b"),
+                                list(options) + ["--threads", "3"])
+    finally:
+        common._MIN_WINDOW_SIZE = window_size
+
+    assert_equal(expected, result)
+
+
+@with_temp_folder
+def test_bam_stats__threads(temp_folder):
+    _check_threads(temp_folder)
+
+
+@with_temp_folder
+def test_bam_stats__threads__max_contigs(temp_folder):
+    _check_threads(temp_folder, options=["--max-contigs", "1"])
+
+
+@with_temp_folder
+def test_bam_stats__threads__regions(temp_folder):
+    _check_threads(temp_folder,
+                   regions="chr1\t100\t700\tfoo\n"
+                           "chr1\t650\t900\tbar\n"
+                           "chr2\t0\t3000\n")
+
+
+def test_insert_size_collector():
+    class _Record(object):
+        def __init__(self, qname, tlen, alen, flag=0):
+            self.qname = qname
+            self.tlen = tlen
+            self.alen = alen
+            self.is_paired = bool(flag & 0x1)
+            self.is_proper_pair = bool(flag & 0x2)
+            self.is_read2 = bool(flag & 0x80)
+
+    records = [_Record("read_1", 0, 50),          # Single-end; ignored
+               _Record("M_read_2", 0, 75),        # Collapsed
+               _Record("read_3", 200, 50, 0x43),  # Mate 1
+               _Record("read_3", -200, 50, 0x83),  # Mate 2; ignored
+               _Record("read_4", -150, 50, 0x43),  # Mate 1, reverse
+               _Record("read_5", 300, 50, 0x41)]  # Improper pair; ignored
+
+    collector = scanner.InsertSizeCollector("-")
+    collector.process_position(0, records)
+    assert_equal(dict(collector._counts), {75: 1, 150: 1, 200: 1})
+
+
+def test_bam_stats__requires_output():
+    assert_raises(SystemExit, scanner.parse_arguments, ["test.bam"])
+
+
+def test_bam_stats__single_stdout():
+    assert_raises(SystemExit, scanner.parse_arguments,
+                  ["test.bam", "--depths", "-", "--coverage", "-"])
+
+
+@with_temp_folder
+def test_bam_stats__threads__many_regions(temp_folder):
+    # Blocks separated by small gaps, such that reads overlap several blocks
+    regions = []
+    for start in xrange(0, 2800, 150):
+        regions.append("chr1\t%i\t%i\tfoo_%i\n" % (start, start + 100,
+                                                    start % 3))
+    _check_threads(temp_folder, regions="".join(regions))
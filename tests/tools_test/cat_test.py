@@ -0,0 +1,142 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Disable warning for missing docstring
+# pylint: disable=C0111
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+import bz2
+import os
+import random
+import struct
+import zlib
+
+from nose.tools import \
+    assert_equal
+
+from paleomix.common.testing import \
+    with_temp_folder
+
+import paleomix.tools.cat as cat
+
+
+def _random_reads(count, seed=12345):
+    rng = random.Random(seed)
+    lines = []
+    for index in xrange(count):
+        sequence = "".join(rng.choice("ACGT") for _ in xrange(50))
+        lines.append("@read_%i\n%s\n+\n%s\n" % (index, sequence, "I" * 50))
+    return "".join(lines)
+
+
+def _gzip_member(data, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _write_members(filename, data, compress_func, size):
+    with open(filename, "wb") as handle:
+        for start in xrange(0, len(data), size):
+            handle.write(compress_func(data[start:start + size]))
+
+
+def _run_cat(temp_folder, filenames, threads):
+    output = os.path.join(temp_folder, "output")
+    args = ["--threads", str(threads), "--output", output]
+    assert_equal(cat.main(args + list(filenames)), 0)
+
+    with open(output, "rb") as handle:
+        return handle.read()
+
+
+def test_cat__parallel():
+    @with_temp_folder
+    def _do_test_cat__parallel(temp_folder, compress_func, size, threads):
+        data = _random_reads(2000)
+        filename = os.path.join(temp_folder, "input")
+        _write_members(filename, data, compress_func, size)
+
+        assert_equal(_run_cat(temp_folder, [filename], threads), data)
+
+    # Segments consisting of multiple members/streams, or a single one
+    cat._SEGMENT_SIZE = 1024
+    cat._MAX_SEGMENT_SIZE = 4096
+    try:
+        for threads in (1, 3):
+            for size in (1000, 10000, 10 ** 6):
+                yield _do_test_cat__parallel, _gzip_member, size, threads
+                yield _do_test_cat__parallel, bz2.compress, size, threads
+    finally:
+        cat._SEGMENT_SIZE = 1024 * 1024
+        cat._MAX_SEGMENT_SIZE = 8 * 1024 * 1024
+
+
+@with_temp_folder
+def test_cat__parallel__false_positive_gzip_header(temp_folder):
+    # Uncompressed (stored) data containing what appears to be a gzip header
+    data = os.urandom(2048) + "\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\x03" \
+        + os.urandom(2048)
+    filename = os.path.join(temp_folder, "input.gz")
+    with open(filename, "wb") as handle:
+        handle.write(_gzip_member(data, level=0))
+        handle.write(_gzip_member(data))
+
+    cat._SEGMENT_SIZE = 1024
+    try:
+        assert_equal(_run_cat(temp_folder, [filename], 2), data + data)
+    finally:
+        cat._SEGMENT_SIZE = 1024 * 1024
+
+
+@with_temp_folder
+def test_cat__parallel__mixed_files(temp_folder):
+    data = _random_reads(100)
+    filenames = []
+    for (ext, compress_func) in (("gz", _gzip_member),
+                                 ("txt", str),
+                                 ("bz2", bz2.compress)):
+        filename = os.path.join(temp_folder, "input." + ext)
+        _write_members(filename, data, compress_func, 1000)
+        filenames.append(filename)
+
+    assert_equal(_run_cat(temp_folder, filenames, 2), data * 3)
+
+
+def test_find_bgzf_block():
+    blocks = []
+    for data in ("foo", "bar" * 100, "zod" * 20):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        deflated = compressor.compress(data) + compressor.flush()
+        header = "\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+        blocks.append(header
+                      + struct.pack("<H", 18 + len(deflated) + 8 - 1)
+                      + deflated
+                      + struct.pack("<iI", zlib.crc32(data), len(data)))
+
+    data = "".join(blocks)
+    assert_equal(cat._find_bgzf_block(data, 1), len(blocks[0]))
+    assert_equal(cat._find_bgzf_block(data, len(blocks[0]) + 1),
+                 len(blocks[0]) + len(blocks[1]))
+    assert_equal(cat._find_bgzf_block(data, len(data) - 1), None)
+    assert_equal(cat._decompress_segment(cat._gzip_decompressor, data),
+                 "foo" + "bar" * 100 + "zod" * 20)
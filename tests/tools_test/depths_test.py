@@ -0,0 +1,129 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2018 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Disable warning for missing docstring
+# pylint: disable=C0111
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+import os
+
+import nose
+import pysam
+
+from nose.tools import \
+    assert_equal
+
+from paleomix.common.testing import \
+    with_temp_folder, \
+    get_file_contents, \
+    set_file_contents, \
+    write_random_bam
+
+from paleomix.common.bedtools import \
+    sort_bed_by_bamfile
+
+import paleomix.tools.depths as depths
+
+from paleomix.tools.bam_stats.common import \
+    collect_bed_regions, \
+    parse_arguments
+
+
+_CONTIGS = (("chr1", 5000), ("chr2", 3000), ("chr3", 10000))
+_READGROUPS = (("rg1", "sample1", "lib1"),
+               ("rg2", "sample1", "lib1"),
+               ("rg3", "sample1", "lib2"),
+               ("rg4", "sample2", "lib3"))
+
+
+def _run_depths(bam_file, out_file, use_numpy, options=(), regions=None):
+    args = parse_arguments([bam_file, out_file] + list(options), ".depths")
+    args.regions = None
+    if regions is not None:
+        args.regions = collect_bed_regions(regions)
+
+    numpy = depths.numpy
+    try:
+        if not use_numpy:
+            depths.numpy = None
+
+        with pysam.AlignmentFile(bam_file) as handle:
+            sort_bed_by_bamfile(handle, args.regions)
+            assert_equal(depths.process_file(handle, args), 0)
+    finally:
+        depths.numpy = numpy
+
+    # Skip timestamp
+    return get_file_contents(out_file).split("\n", 1)[1]
+
+
+def _check_engines(temp_folder, options=(), regions=None):
+    if depths.numpy is None:
+        raise nose.SkipTest("NumPy is not installed")
+
+    bam_file = os.path.join(temp_folder, "test.bam")
+    write_random_bam(bam_file, _CONTIGS, _READGROUPS)
+    if regions is not None:
+        bed_file = os.path.join(temp_folder, "regions.bed")
+        set_file_contents(bed_file, regions)
+        regions = bed_file
+
+    expected = _run_depths(bam_file, os.path.join(temp_folder, "a.depths"),
+                           False, options, regions)
+    result = _run_depths(bam_file, os.path.join(temp_folder, "b.depths"),
+                         True, options, regions)
+
+    assert_equal(expected, result)
+
+
+@with_temp_folder
+def test_depths__numpy_matches_python(temp_folder):
+    _check_engines(temp_folder)
+
+
+@with_temp_folder
+def test_depths__numpy_matches_python__ignore_readgroups(temp_folder):
+    _check_engines(temp_folder, options=["--ignore-readgroups"])
+
+
+@with_temp_folder
+def test_depths__numpy_matches_python__max_contigs(temp_folder):
+    _check_engines(temp_folder, options=["--max-contigs", "1"])
+
+
+@with_temp_folder
+def test_depths__numpy_matches_python__regions(temp_folder):
+    _check_engines(temp_folder,
+                   regions="chr1\t100\t700\tfoo\n"
+                           "chr1\t650\t900\tbar\n"
+                           "chr3\t0\t300\n"
+                           "chr3\t2000\t9000\tfoo\n")
+
+
+@with_temp_folder
+def test_depths__numpy_matches_python__small_blocks(temp_folder):
+    sizes = (depths._BLOCK_SIZE, depths._MAX_SEGMENTS)
+    try:
+        depths._BLOCK_SIZE, depths._MAX_SEGMENTS = 64, 16
+        _check_engines(temp_folder)
+    finally:
+        depths._BLOCK_SIZE, depths._MAX_SEGMENTS = sizes
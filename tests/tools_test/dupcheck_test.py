@@ -0,0 +1,92 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Disable warning for missing docstring
+# pylint: disable=C0111
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+import os
+
+from nose.tools import \
+    assert_equal
+
+from paleomix.common.testing import \
+    with_temp_folder, \
+    write_random_bam
+
+import paleomix.tools.dupcheck as dupcheck
+
+
+_CONTIGS = (("chr1", 5000), ("chr2", 3000), ("chr3", 1000))
+
+
+class _Collector(object):
+    def __init__(self):
+        self.duplicates = []
+
+    def __call__(self, chrom, pos, records, name, seq, qual):
+        counts = dict((key, len(value)) for (key, value) in records.iteritems())
+        self.duplicates.append((chrom, pos, name, counts))
+
+
+def _write_bams(temp_folder, seeds):
+    filenames = []
+    for (index, seed) in enumerate(seeds):
+        filename = os.path.join(temp_folder, "%i.bam" % (index,))
+        write_random_bam(filename, _CONTIGS, (("rg1", "sm", "lb"),),
+                         nreads=500, seed=seed)
+        filenames.append(filename)
+
+    return filenames
+
+
+def _check_bam_files(filenames, threads):
+    collector = _Collector()
+    dupcheck.validation.check_bam_files(filenames, collector, threads=threads)
+    return sorted(collector.duplicates)
+
+
+@with_temp_folder
+def test_check_bam_files__no_duplicates(temp_folder):
+    filenames = _write_bams(temp_folder, (1,))
+
+    assert_equal(_check_bam_files(filenames, 1), [])
+    assert_equal(_check_bam_files(filenames, 2), [])
+
+
+@with_temp_folder
+def test_check_bam_files__duplicated_input(temp_folder):
+    filenames = _write_bams(temp_folder, (1, 1))
+
+    result = _check_bam_files(filenames, 1)
+    assert_equal(len(result), 500)
+    for (_, _, _, counts) in result:
+        assert_equal(counts, {filenames[0]: 1, filenames[1]: 1})
+
+    assert_equal(_check_bam_files(filenames, 2), result)
+
+
+@with_temp_folder
+def test_dupcheck__main(temp_folder):
+    filenames = _write_bams(temp_folder, (1, 1))
+
+    assert_equal(dupcheck.main(filenames + ["--quiet", "--threads", "2"]), 0)
@@ -85,13 +85,14 @@ def test_factory__commands():
                 ("coverage",        "usage: paleomix coverage [options] sorted.bam [out.coverage]"),
                 ("depths",          "usage: paleomix depths [options] sorted.bam [out.depths]"),
                 ("duphist",         "usage: paleomix duphist sorted.bam > out.histogram"),
+                ("merge",           "usage: paleomix merge [options] in1.bam in2.bam [...] > out.bam"),
                 ("rmdup_collapsed", "usage: paleomix rmdup_collapsed [options] < sorted.bam > out.bam"),
                 ("genotype",        "usage: paleomix genotype [options] sorted.bam out.vcf.bgz"),
                 ("gtf_to_bed",      "usage: paleomix gtf_to_bed [options] in.gtf out_prefix [in.scaffolds]"),
                 ("sample_pileup",   "usage: paleomix sample_pileup [options] --genotype in.vcf --intervals in.bed > out.fasta"),
                 ("vcf_filter",      "Usage: paleomix vcf_filter [options] [in1.vcf, ...]"),
                 ("vcf_to_fasta",    "usage: paleomix vcf_to_fasta [options] --genotype in.vcf --intervals in.bed"),
-                ("cat",             "usage: paleomix cat [-h] [--output OUTPUT] file [file ...]"))
+                ("cat",             "usage: paleomix cat [-h] [--output OUTPUT] [--threads THREADS] file [file ...]"))
 
     for command, expected in commands:
         yield _do_test_factory__commands, command, expected
@@ -0,0 +1,136 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Disable warning for missing docstring
+# pylint: disable=C0111
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+import os
+
+import pysam
+
+from nose.tools import \
+    assert_equal, \
+    assert_raises
+
+from paleomix.common.testing import \
+    with_temp_folder, \
+    write_random_bam
+
+import paleomix.tools.merge as merge
+
+
+_CONTIGS = (("chr1", 5000), ("chr2", 3000))
+_SQ = [{"SN": "chr1", "LN": 5000}, {"SN": "chr2", "LN": 3000}]
+
+
+###############################################################################
+###############################################################################
+# merge_headers
+
+def test_merge_headers__readgroups():
+    header_1 = {"SQ": _SQ, "RG": [{"ID": "rg1", "SM": "a"}]}
+    header_2 = {"SQ": _SQ, "RG": [{"ID": "rg2", "SM": "a"},
+                                  {"ID": "rg1", "SM": "a"}]}
+
+    header, renamed = merge.merge_headers([header_1, header_2])
+    assert_equal(header, {"HD": {"VN": "1.0", "SO": "coordinate"},
+                          "SQ": _SQ,
+                          "RG": [{"ID": "rg1", "SM": "a"},
+                                 {"ID": "rg2", "SM": "a"}]})
+    assert_equal(renamed, [{}, {}])
+
+
+def test_merge_headers__conflicting_readgroups():
+    header_1 = {"SQ": _SQ, "RG": [{"ID": "rg1", "SM": "a"}]}
+    header_2 = {"SQ": _SQ, "RG": [{"ID": "rg1", "SM": "b"}]}
+
+    assert_raises(merge.BAMMergeError,
+                  merge.merge_headers, [header_1, header_2])
+
+
+def test_merge_headers__different_sequences():
+    header_1 = {"SQ": _SQ}
+    header_2 = {"SQ": _SQ[:1]}
+
+    assert_raises(merge.BAMMergeError,
+                  merge.merge_headers, [header_1, header_2])
+
+
+def test_merge_headers__programs():
+    header_1 = {"SQ": _SQ, "PG": [{"ID": "bwa", "CL": "bwa a"},
+                                  {"ID": "foo", "PP": "bwa"}]}
+    header_2 = {"SQ": _SQ, "PG": [{"ID": "bwa", "CL": "bwa b"},
+                                  {"ID": "foo", "PP": "bwa"}],
+                "CO": ["comment"]}
+
+    header, renamed = merge.merge_headers([header_1, header_2])
+    assert_equal(header["PG"], [{"ID": "bwa", "CL": "bwa a"},
+                                {"ID": "foo", "PP": "bwa"},
+                                {"ID": "bwa.1", "CL": "bwa b"},
+                                {"ID": "foo.1", "PP": "bwa.1"}])
+    assert_equal(header["CO"], ["comment"])
+    assert_equal(renamed, [{}, {"bwa": "bwa.1", "foo": "foo.1"}])
+
+
+###############################################################################
+###############################################################################
+# main
+
+def _read_records(filename):
+    with pysam.AlignmentFile(filename) as handle:
+        return [(record.reference_id, record.reference_start,
+                 record.query_name) for record in handle]
+
+
+@with_temp_folder
+def test_merge__main(temp_folder):
+    filenames = []
+    for (index, seed) in enumerate((1, 2, 3)):
+        filename = os.path.join(temp_folder, "%i.bam" % (index,))
+        write_random_bam(filename, _CONTIGS, (("rg1", "sm", "lb"),),
+                         nreads=500, seed=seed)
+        filenames.append(filename)
+
+    output = os.path.join(temp_folder, "merged.bam")
+    assert_equal(merge.main(filenames + ["--output", output]), 0)
+
+    expected = []
+    for filename in filenames:
+        expected.extend(_read_records(filename))
+    result = _read_records(output)
+
+    assert_equal(sorted(expected), sorted(result))
+    assert_equal([value[:2] for value in result],
+                 sorted(value[:2] for value in result))
+
+
+@with_temp_folder
+def test_merge__main__output_is_bgzipped(temp_folder):
+    filename = os.path.join(temp_folder, "input.bam")
+    write_random_bam(filename, _CONTIGS, (("rg1", "sm", "lb"),), nreads=10)
+
+    output = os.path.join(temp_folder, "merged.bam")
+    assert_equal(merge.main([filename, "--output", output]), 0)
+    with open(output, "rb") as handle:
+        # GZip magic number, compression method (deflate), and FEXTRA flag
+        assert_equal(handle.read(4), "\x1f\x8b\x08\x04")
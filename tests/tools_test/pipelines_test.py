@@ -0,0 +1,105 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Disable warning for missing docstring
+# pylint: disable=C0111
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+import os
+import socket
+import sys
+
+from nose.tools import assert_equal
+
+from paleomix.common.testing import \
+    Monkeypatch, \
+    with_temp_folder
+
+import paleomix.tools.bam_pipeline.pipeline as bam_pipeline
+import paleomix.tools.phylo_pipeline.pipeline as phylo_pipeline
+
+
+def _free_port():
+    sock = socket.socket()
+    try:
+        sock.bind(("", 0))
+        return sock.getsockname()[1]
+    finally:
+        sock.close()
+
+
+###############################################################################
+###############################################################################
+# BAM pipeline
+
+def test_bam_pipeline__run__with_executor():
+    @with_temp_folder
+    def _do_test_bam_pipeline__run__with_executor(temp_folder, options):
+        makefile = os.path.join(temp_folder, "missing.yaml")
+        argv = ["run", makefile,
+                "--temp-root", os.path.join(temp_folder, "temp")] + options
+
+        # Fails when reading the (missing) makefile
+        assert_equal(bam_pipeline.main(argv), 1)
+
+    for options in (["--worker-port", str(_free_port())],
+                    ["--batch-system", "slurm"]):
+        yield _do_test_bam_pipeline__run__with_executor, options
+
+
+###############################################################################
+###############################################################################
+# Phylogenetic pipeline
+
+def test_phylo_pipeline__run__with_executor():
+    @with_temp_folder
+    def _do_test_phylo_pipeline__run__with_executor(temp_folder, options):
+        makefile = os.path.join(temp_folder, "missing.yaml")
+        argv = ["genotype", makefile,
+                "--temp-root", os.path.join(temp_folder, "temp")] + options
+
+        # Fails when reading the (missing) makefile
+        assert_equal(phylo_pipeline.main(argv), 1)
+
+    for options in (["--worker-port", str(_free_port())],
+                    ["--batch-system", "slurm"]):
+        yield _do_test_phylo_pipeline__run__with_executor, options
+
+
+@with_temp_folder
+def test_phylo_pipeline__example(temp_folder):
+    filename = os.path.join(temp_folder, "phylo_pipeline",
+                            "synthesize_reads.py")
+
+    def _copy_example(name, argv):
+        assert_equal((name, argv), ("phylo_pipeline", [temp_folder]))
+        os.mkdir(os.path.dirname(filename))
+        with open(filename, "w") as handle:
+            handle.write("#!/usr/bin/python\nimport sys\n")
+        return 0
+
+    with Monkeypatch("paleomix.resources.copy_example", _copy_example):
+        assert_equal(phylo_pipeline.main(["example", temp_folder]), 0)
+
+    with open(filename) as handle:
+        assert_equal(handle.read(), "#!%s\nimport sys\n" % (sys.executable,))
@@ -0,0 +1,118 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Disable warning for missing docstring
+# pylint: disable=C0111
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+import os
+import random
+import collections
+
+import pysam
+
+from nose.tools import \
+    assert_equal
+
+from paleomix.common.testing import \
+    with_temp_folder, \
+    write_random_bam
+
+import paleomix.tools.rmdup_collapsed as rmdup_collapsed
+
+
+_CONTIGS = (("chr1", 5000), ("chr2", 3000), ("chr3", 200), ("chr4", 1000))
+_READGROUPS = (("rg1", "sample1", "lib1"),)
+
+_Handle = collections.namedtuple("_Handle",
+                                 ("references", "lengths", "nreferences"))
+
+
+def _read_records(filename):
+    with pysam.AlignmentFile(filename) as handle:
+        return [(record.query_name, record.flag, record.reference_id,
+                 record.reference_start, record.cigarstring,
+                 sorted(record.get_tags()))
+                for record in handle]
+
+
+def _run_serial(bam_file, out_file, options):
+    args = rmdup_collapsed.parse_args([bam_file] + options)
+    random.seed(args.seed)
+
+    with pysam.AlignmentFile(bam_file) as infile:
+        with pysam.AlignmentFile(out_file, "wb", template=infile) as outfile:
+            assert_equal(rmdup_collapsed.process(args, infile, outfile), 0)
+
+    return _read_records(out_file)
+
+
+def _run_parallel(bam_file, out_file, options):
+    args = rmdup_collapsed.parse_args([bam_file, "--threads", "3"] + options)
+    random.seed(args.seed)
+
+    with pysam.AlignmentFile(bam_file) as infile:
+        with open(out_file, "wb") as outfile:
+            assert_equal(rmdup_collapsed.process_parallel(args, infile,
+                                                          outfile), 0)
+
+    return _read_records(out_file)
+
+
+def _check_parallel(temp_folder, options=()):
+    bam_file = os.path.join(temp_folder, "test.bam")
+    write_random_bam(bam_file, _CONTIGS, _READGROUPS, nreads=5000)
+
+    options = ["--seed", "1234"] + list(options)
+    expected = _run_serial(bam_file, os.path.join(temp_folder, "a.bam"),
+                           options)
+    result = _run_parallel(bam_file, os.path.join(temp_folder, "b.bam"),
+                           options)
+
+    assert_equal(expected, result)
+
+
+@with_temp_folder
+def test_rmdup_collapsed__parallel(temp_folder):
+    _check_parallel(temp_folder)
+
+
+@with_temp_folder
+def test_rmdup_collapsed__parallel__remove_duplicates(temp_folder):
+    _check_parallel(temp_folder, ["--remove-duplicates"])
+
+
+def test_rmdup_collapsed__build_tasks():
+    handle = _Handle(references=("chr1", "chr2", "chr3", "chr4", "chr5"),
+                     lengths=(5000, 3000, 100, 100, 1000),
+                     nreferences=5)
+    args = rmdup_collapsed.parse_args(["test.bam", "--threads", "1"])
+
+    assert_equal(rmdup_collapsed.build_tasks(args, handle),
+                 [["chr1"], ["chr2"], ["chr3"], ["chr4", "chr5"], ["*"]])
+
+
+def test_rmdup_collapsed__build_tasks__no_contigs():
+    handle = _Handle(references=(), lengths=(), nreferences=0)
+    args = rmdup_collapsed.parse_args(["test.bam", "--threads", "4"])
+
+    assert_equal(rmdup_collapsed.build_tasks(args, handle), [["*"]])
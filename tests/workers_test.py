@@ -0,0 +1,283 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2018 Mikkel Schubert <MikkelSch@gmail.com>
+#
+# Permission is herby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Disable warning for missing docstring
+# pylint: disable=C0111
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import socket
+import threading
+import time
+
+from nose.tools import \
+    assert_equal, \
+    assert_is_instance
+
+from paleomix.common.testing import \
+    with_temp_folder, \
+    get_file_contents
+
+from paleomix.node import \
+    Node, \
+    NodeError
+
+from paleomix.workers import \
+    WorkerExecutor, \
+    run_worker
+
+
+_AUTHKEY = "test key"
+
+
+class _Config(object):
+    def __init__(self, temp_root):
+        self.temp_root = temp_root
+
+
+class _WriteNode(Node):
+    def __init__(self, filename, threads=1, fail=False):
+        self._filename = filename
+        self._fail = fail
+        Node.__init__(self,
+                      input_files=(__file__,),
+                      output_files=(filename,),
+                      threads=threads)
+
+    def _run(self, _config, _temp):
+        if self._fail:
+            raise NodeError("Node failed")
+
+        with open(self._filename, "w") as handle:
+            handle.write("%i\n" % (os.getpid(),))
+
+
+def _new_executor(**kwargs):
+    return WorkerExecutor(("127.0.0.1", 0), authkey=_AUTHKEY, **kwargs)
+
+
+def _start_worker(executor, threads=1):
+    proc = multiprocessing.Process(target=run_worker,
+                                   args=(executor.address, threads, _AUTHKEY))
+    proc.start()
+    return proc
+
+
+def _connect_fake_worker(executor, threads=1):
+    conns = []
+
+    def _connect():
+        conn = multiprocessing.connection.Client(executor.address,
+                                                 authkey=_AUTHKEY)
+        conn.send(("hello", "fake", threads))
+        conns.append(conn)
+
+    # The executor must accept the connection while the client is connecting
+    thread = threading.Thread(target=_connect)
+    thread.start()
+    _wait_for(executor, lambda _: executor.get_max_threads(1) >= threads)
+    thread.join()
+
+    return conns[0]
+
+
+def _wait_for(executor, func, timeout=10):
+    """Polls the executor until func(results) is true, and returns the
+    collected results."""
+    results = []
+    end_time = time.time() + timeout
+    while time.time() < end_time:
+        results.extend(executor.poll())
+        if func(results):
+            return results
+        time.sleep(0.01)
+
+    assert False, "Timeout waiting for executor"  # pragma: no coverage
+
+
+def _run_nodes(executor, nodes, config):
+    for (key, node) in enumerate(nodes):
+        assert executor.start(key, node, config)
+
+    finished = _wait_for(executor, lambda results: len(results) == len(nodes))
+    return dict(finished)
+
+
+###############################################################################
+###############################################################################
+# WorkerExecutor
+
+def test_worker_executor__no_workers():
+    executor = _new_executor()
+    try:
+        assert_equal(executor.get_max_threads(4), 0)
+        assert not executor.start(1, _WriteNode("/xyz/foo"), None)
+    finally:
+        executor.terminate()
+
+
+@with_temp_folder
+def test_worker_executor__run_nodes(temp_folder):
+    executor = _new_executor()
+    proc = _start_worker(executor, threads=3)
+    try:
+        _wait_for(executor, lambda _: executor.get_max_threads(1) == 3)
+
+        filenames = [os.path.join(temp_folder, name) for name in "abc"]
+        nodes = [_WriteNode(filename) for filename in filenames]
+        results = _run_nodes(executor, nodes, _Config(temp_folder))
+
+        assert_equal(results, {0: None, 1: None, 2: None})
+        for filename in filenames:
+            assert get_file_contents(filename).strip().isdigit()
+    finally:
+        executor.close()
+        proc.join()
+
+    assert_equal(proc.exitcode, 0)
+
+
+@with_temp_folder
+def test_worker_executor__node_fails(temp_folder):
+    executor = _new_executor()
+    proc = _start_worker(executor)
+    try:
+        _wait_for(executor, lambda _: executor.get_max_threads(1) == 1)
+
+        node = _WriteNode(os.path.join(temp_folder, "a"), fail=True)
+        results = _run_nodes(executor, [node], _Config(temp_folder))
+
+        assert_is_instance(results[0], NodeError)
+    finally:
+        executor.close()
+        proc.join()
+
+
+def test_worker_executor__insufficient_threads():
+    executor = _new_executor()
+    conn = _connect_fake_worker(executor, threads=2)
+    try:
+        # Nodes using more threads than available are only run by idle workers
+        assert executor.start(1, _WriteNode("/xyz/a", threads=4), None)
+        assert not executor.start(2, _WriteNode("/xyz/b", threads=1), None)
+
+        assert_equal(conn.recv()[:2], ("run", 1))
+    finally:
+        conn.close()
+        executor.terminate()
+
+
+def test_worker_executor__stalled_handshake():
+    executor = _new_executor()
+    sock = socket.create_connection(executor.address)
+    try:
+        # Connections that never complete the handshake do not block others
+        executor.poll()
+        conn = _connect_fake_worker(executor, threads=3)
+        conn.close()
+    finally:
+        sock.close()
+        executor.terminate()
+
+
+def test_worker_executor__wrong_authkey():
+    executor = _new_executor()
+    try:
+        def _connect():
+            try:
+                multiprocessing.connection.Client(executor.address,
+                                                  authkey="wrong key")
+            except (EOFError, IOError, multiprocessing.AuthenticationError):
+                pass
+
+        thread = threading.Thread(target=_connect)
+        thread.start()
+        _wait_for(executor, lambda _: not thread.is_alive())
+        thread.join()
+
+        conn = _connect_fake_worker(executor, threads=2)
+        assert_equal(executor.get_max_threads(1), 2)
+        conn.close()
+    finally:
+        executor.terminate()
+
+
+def test_worker_executor__logs_waiting_for_workers():
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger = logging.getLogger("paleomix.workers")
+    logger.addHandler(handler)
+
+    executor = _new_executor()
+    try:
+        executor.poll()
+        executor.poll()
+        assert_equal([record.getMessage() for record in records],
+                     ["Waiting for workers to connect to %s:%i"
+                      % executor.address])
+    finally:
+        logger.removeHandler(handler)
+        executor.terminate()
+
+
+@with_temp_folder
+def test_worker_executor__requeue_on_disconnect(temp_folder):
+    executor = _new_executor()
+    conn = _connect_fake_worker(executor)
+    proc = None
+    try:
+        node = _WriteNode(os.path.join(temp_folder, "a"))
+        assert executor.start(1, node, _Config(temp_folder))
+        assert_equal(conn.recv()[:2], ("run", 1))
+        conn.close()
+
+        # The node is re-queued, and new nodes are not started in the mean time
+        _wait_for(executor, lambda _: executor.get_max_threads(1) == 0)
+        assert not executor.start(2, node, _Config(temp_folder))
+
+        proc = _start_worker(executor)
+        results = _wait_for(executor, lambda results: results)
+
+        assert_equal(results, [(1, None)])
+        assert os.path.exists(node._filename)
+    finally:
+        executor.close()
+        if proc is not None:
+            proc.join()
+
+
+@with_temp_folder
+def test_worker_executor__requeue_on_missing_heartbeat(temp_folder):
+    executor = _new_executor(heartbeat_timeout=0.1)
+    conn = _connect_fake_worker(executor)
+    try:
+        node = _WriteNode(os.path.join(temp_folder, "a"))
+        assert executor.start(1, node, _Config(temp_folder))
+
+        _wait_for(executor, lambda _: executor.get_max_threads(1) == 0)
+    finally:
+        conn.close()
+        executor.terminate()